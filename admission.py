@@ -0,0 +1,351 @@
+"""Admission control for the API: token-bucket rate limits and load shedding.
+
+Every /api request is classified (see classify()) and must take a token from
+two buckets before it reaches the app: one for the client (IP address) and
+one for the project it touches. Classes have separate budgets, so a client
+polling /api/stats can't use up the budget for uploads and the other way
+round:
+
+    read    GET requests                          cheap, generous budget
+    write   other requests without an AI call
+    report  /api/submit-result with a bug description, /api/results/batch:
+            a Gemini bug report per new failure
+    ai      /api/upload, /api/modules/regenerate-bugs: queue Gemini work in bulk
+
+``ai`` and ``report`` requests are also shed while the ai_scheduler queue
+they add to (AI_PATHS, REPORT_PATHS) is full: accepting more would only make
+every one of them wait longer.
+Rejected requests get 429 with Retry-After (seconds) and the same number in
+the JSON body.
+
+Buckets live in process memory. With several workers (gunicorn -w N, or the
+PythonAnywhere web workers) set QAFLOW_RATE_LIMIT_DB to a SQLite file that
+all of them share; each take is one short IMMEDIATE transaction, run in the
+thread pool so that waiting for another worker's lock doesn't stall the event
+loop. A take that can't get the lock within LOCK_TIMEOUT lets the request
+through.
+
+Configuration:
+    QAFLOW_RATE_LIMITS="read=20/1:60,write=10/1:30,report=30/60:10,ai=6/60:3"
+        per-client budgets: <class>=<tokens>/<seconds>:<burst>
+    QAFLOW_PROJECT_RATE_LIMITS="read=100/1:300,write=50/1:150,report=150/60:30,ai=30/60:10"
+        per-project budgets, same format
+    QAFLOW_AI_MAX_QUEUE=20            shed ai/report requests above this queue depth
+    QAFLOW_RATE_LIMIT_DB=             SQLite file for shared buckets (default: memory)
+    QAFLOW_CLIENT_IP_HEADER=          e.g. X-Real-IP behind a proxy (PythonAnywhere)
+    QAFLOW_ADMISSION=off              disable the whole layer
+
+benchmarks/load.py drives the app with concurrent clients to check the limits.
+"""
+import collections
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+import ai_scheduler
+
+CLASSES = ("read", "write", "report", "ai")
+
+# Paths whose handler queues Gemini work in bulk -> the ai_scheduler queue it goes to
+AI_PATHS = {"/api/upload": "generation", "/api/modules/regenerate-bugs": "bug_report"}
+# Paths that generate a bug report for a new failure (queue: bug_report)
+REPORT_PATHS = ("/api/submit-result", "/api/results/batch")
+
+DEFAULT_CLIENT_LIMITS = "read=20/1:60,write=10/1:30,report=30/60:10,ai=6/60:3"
+DEFAULT_PROJECT_LIMITS = "read=100/1:300,write=50/1:150,report=150/60:30,ai=30/60:10"
+
+AI_MAX_QUEUE = int(os.getenv("QAFLOW_AI_MAX_QUEUE", "20"))
+
+# JSON bodies up to this size are read to find the project of a POST
+MAX_PEEK_BYTES = 64 * 1024
+
+# Seconds a shared-bucket take waits for the file lock before letting the request through
+LOCK_TIMEOUT = 0.5
+
+# Run time assumed for a queued generation before the scheduler has measured any
+DEFAULT_AI_RUN_SECONDS = 15.0
+
+
+def parse_limits(spec):
+    """'read=20/1:60,ai=6/60:3' -> {'read': (rate per second, burst), ...}"""
+    limits = {}
+    for part in (spec or "").split(","):
+        kind, _, value = part.partition("=")
+        kind = kind.strip()
+        if not kind:
+            continue
+        if kind not in CLASSES:
+            raise ValueError(f"Unknown request class in rate limits: {kind}")
+        amount, _, rest = value.partition("/")
+        seconds, _, burst = rest.partition(":")
+        rate = float(amount) / float(seconds or 1)
+        limits[kind] = (rate, float(burst) if burst else max(1.0, float(amount)))
+    return limits
+
+
+def classify(method, path, body=None):
+    """Request class for rate limiting, or None for requests that are never limited.
+
+    ``body`` is the JSON body if it could be read: only a failed submit-result
+    with a bug description calls Gemini. Without it the path's costliest class applies.
+    """
+    if not path.startswith("/api/"):
+        return None  # pages, service worker, static files
+    if path in AI_PATHS:
+        return "ai"
+    if path in REPORT_PATHS:
+        if path == "/api/submit-result" and isinstance(body, dict) and \
+                (body.get("status") == "Pass" or not body.get("bug_description")):
+            return "write"
+        return "report"
+    return "read" if method in ("GET", "HEAD") else "write"
+
+
+def queue_for(kind, path):
+    """ai_scheduler queue a request of this class adds to, or None"""
+    if kind == "ai":
+        return AI_PATHS[path]
+    return "bug_report" if kind == "report" else None
+
+
+class MemoryBuckets:
+    """Token buckets in a dict; state is per process"""
+
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now=None):
+        """Take one token. Returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+            return (1 - tokens) / rate
+
+    def _prune(self, now):
+        # Idle long enough to be full again: same as not being there
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if now - updated > 3600:
+                del self._buckets[key]
+
+
+class SQLiteBuckets:
+    """Token buckets in a SQLite file shared by every worker process on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.lock_timeouts = 0
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS rate_buckets (
+                            key TEXT PRIMARY KEY,
+                            tokens REAL NOT NULL,
+                            updated REAL NOT NULL
+                        )""")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # losing a bucket on power loss is fine
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, now=None):
+        # Wall clock: monotonic clocks aren't comparable between processes
+        now = time.time() if now is None else now
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            # Locked by the other workers for too long: fail open rather than queue up behind them
+            self.lock_timeouts += 1
+            return 0.0
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class Limiter:
+    def __init__(self, client_limits=None, project_limits=None, store=None, ai_max_queue=AI_MAX_QUEUE,
+                 enabled=True):
+        self.client_limits = parse_limits(DEFAULT_CLIENT_LIMITS)
+        self.client_limits.update(client_limits or {})
+        self.project_limits = parse_limits(DEFAULT_PROJECT_LIMITS)
+        self.project_limits.update(project_limits or {})
+        self.store = store or MemoryBuckets()
+        self.ai_max_queue = ai_max_queue
+        self.enabled = enabled
+        self.counters = collections.Counter()
+
+    def retry_after_shed(self, queue="generation"):
+        """Rough time until the AI queue has room again"""
+        metrics = ai_scheduler.scheduler.metrics()
+        run_s = metrics["run_ms"][queue].get("avg", DEFAULT_AI_RUN_SECONDS * 1000) / 1000
+        excess = metrics["queued"][queue] - self.ai_max_queue + 1
+        return max(1.0, excess * run_s / metrics["max_concurrency"])
+
+    def admit(self, kind, client, project, queue=None):
+        """Returns (None, 0) if the request may proceed, else (reason, retry_after seconds).
+
+        ``queue``: the ai_scheduler queue the request adds to (queue_for()); shed while it is full.
+        """
+        if queue and ai_scheduler.scheduler.depth(queue) >= self.ai_max_queue:
+            self.counters["shed"] += 1
+            self.counters[f"shed_{queue}"] += 1
+            return "AI queue is full", self.retry_after_shed(queue)
+        rate, burst = self.client_limits[kind]
+        wait = self.store.take(f"c:{kind}:{client}", rate, burst)
+        if wait:
+            self.counters[f"limited_client_{kind}"] += 1
+            return "Too many requests from this client", wait
+        if project:
+            rate, burst = self.project_limits[kind]
+            wait = self.store.take(f"p:{kind}:{project}", rate, burst)
+            if wait:
+                self.counters[f"limited_project_{kind}"] += 1
+                return "Too many requests for this project", wait
+        self.counters[f"admitted_{kind}"] += 1
+        return None, 0
+
+    def metrics(self):
+        lock_timeouts = getattr(self.store, "lock_timeouts", None)
+        return {"enabled": self.enabled, "ai_max_queue": self.ai_max_queue, **self.counters,
+                **({"lock_timeouts": lock_timeouts} if lock_timeouts is not None else {})}
+
+
+def _from_env():
+    path = os.getenv("QAFLOW_RATE_LIMIT_DB")
+    return Limiter(
+        client_limits=parse_limits(os.getenv("QAFLOW_RATE_LIMITS")),
+        project_limits=parse_limits(os.getenv("QAFLOW_PROJECT_RATE_LIMITS")),
+        store=SQLiteBuckets(path) if path else MemoryBuckets(),
+        enabled=os.getenv("QAFLOW_ADMISSION", "on").lower() not in ("off", "0", "false"),
+    )
+
+
+limiter = _from_env()
+
+
+def configure(**kwargs):
+    """Replace the process-wide limiter (benchmarks, load tests)"""
+    global limiter
+    limiter = Limiter(**kwargs)
+    return limiter
+
+
+def metrics():
+    return limiter.metrics()
+
+
+class AdmissionMiddleware:
+    """Applies the module-level ``limiter`` to every HTTP request"""
+
+    def __init__(self, app, client_ip_header=None):
+        self.app = app
+        header = client_ip_header if client_ip_header is not None else os.getenv("QAFLOW_CLIENT_IP_HEADER", "")
+        self.client_ip_header = header.lower()
+
+    def _client(self, scope, headers):
+        if self.client_ip_header and headers.get(self.client_ip_header):
+            return headers[self.client_ip_header].split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+        kind = classify(scope["method"], scope["path"])
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        project, body, receive = await _find_project(scope, headers, receive, read_body=kind == "report")
+        if body is not None:
+            kind = classify(scope["method"], scope["path"], body)
+        args = (kind, self._client(scope, headers), project, queue_for(kind, scope["path"]))
+        if isinstance(limiter.store, SQLiteBuckets):
+            # Blocking file I/O and lock waits
+            reason, retry_after = await run_in_threadpool(limiter.admit, *args)
+        else:
+            reason, retry_after = limiter.admit(*args)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+        seconds = max(1, math.ceil(retry_after))
+        response = JSONResponse(status_code=429, content={"error": reason, "retry_after": seconds},
+                                headers={"Retry-After": str(seconds)})
+        await response(scope, receive, send)
+
+
+async def _find_project(scope, headers, receive, read_body=False):
+    """Project named by the request: ?project=, X-Project header or a small JSON body.
+
+    Returns (project, JSON body or None, receive). Reading the body consumes
+    it, so a replaying ``receive`` is returned too; with ``read_body`` it is
+    read (for classify()) even when the project is already known. Multipart
+    uploads aren't parsed here; the client sends X-Project with them.
+    """
+    project = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("project", [None])[0]
+    project = project or headers.get("x-project")
+    if (project and not read_body) or not headers.get("content-type", "").startswith("application/json"):
+        return project, None, receive
+    try:
+        length = int(headers.get("content-length", ""))
+    except ValueError:
+        return project, None, receive
+    if length > MAX_PEEK_BYTES:
+        return project, None, receive
+
+    messages = []
+    body = b""
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    async def replay():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return project, None, replay
+    value = data.get("project") if isinstance(data, dict) else None
+    return project or (value if isinstance(value, str) else None), data, replay
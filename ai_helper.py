@@ -1,18 +1,36 @@
 import os
-import json
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
 import time
 
+import case_schema
+
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-if not GEMINI_API_KEY:
-    raise ValueError("Missing gemini api key")
+# google-genai SDK імпортується ліниво: клієнт створюється при першому AI-виклику,
+# щоб імпорт main/pa_wsgi не платив за нього на кожному холодному старті
+client = None
+
+# Базова затримка (сек) між повторними спробами при 429; бенчмарки зменшують її
+RETRY_BASE_DELAY = 2
+
+
+def get_client():
+    """Return the Gemini client, creating it on first use"""
+    global client
+    if client is None:
+        if not GEMINI_API_KEY:
+            raise ValueError("Missing gemini api key")
+        from google import genai
+        client = genai.Client(api_key=GEMINI_API_KEY)
+    return client
+
 
-client = genai.Client(api_key=GEMINI_API_KEY)
+def set_client(new_client):
+    """Replace the Gemini client (e.g. with benchmarks.fake_ai.FakeGenAIClient)"""
+    global client
+    client = new_client
 
 # Використовуємо стабільну та швидку модель (СУКА, НЕ ТРОГАЙ ЭТУ СТРОЧКУ НИКОГДА, ОКЕЙ??)
 MODEL_ID = 'gemini-3-flash'
@@ -30,7 +48,7 @@ def retry_api_call(func, *args, **kwargs):
     
     for model_id in MODEL_PRIORITIES:
         kwargs['model'] = model_id
-        delay = 2
+        delay = RETRY_BASE_DELAY
         for attempt in range(3): # 3 спроби на кожну модель
             try:
                 print(f"DEBUG: Using model {model_id} (Attempt {attempt+1})")
@@ -49,6 +67,24 @@ def retry_api_call(func, *args, **kwargs):
                     break 
     raise last_error
 
+def _generate_cases(prompt, batch_model):
+    """One schema-constrained call; returns (module_name or None, [cases])"""
+    from google.genai import types
+    response = retry_api_call(
+        get_client().models.generate_content,
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=batch_model
+        )
+    )
+    module_name, cases, dropped = case_schema.parse_batch(response, batch_model)
+    if dropped:
+        # Обрізана або частково зламана відповідь: зберігаємо те, що вдалося врятувати
+        print(f"⚠️ AI response repaired: {len(cases)} cases kept, {dropped} dropped")
+    return module_name, cases
+
+
 def generate_test_cases(requirements_text):
     prompt = f"""
     Act as a Senior Professional QA Engineer.
@@ -65,44 +101,15 @@ def generate_test_cases(requirements_text):
         - Main business logic (Happy Path).
         - Critical field validations (Mandatory, Length, Format).
         - Important logic constraints (e.g., age restrictions, KYC status).
-    5.  **Format**: Each test case MUST be a single string. Steps should be on separate lines using "•" or "1, 2, 3":
-        "Кроки:\n• [Крок 1]\n• [Крок 2]\n\nОчікуваний результат: [Результат]"
-
-    Output Format (JSON):
-    {{
-      "module_name": "User Profile",
-      "cases": [
-         "Кроки:\n• Відкрити профіль\n• Змінити First Name\n• Зберегти\n\nОчікуваний результат: Дані успішно оновлені.",
-         "Кроки:\n• Ввести некоректну дату народження (менше 18 років)\n\nОчікуваний результат: Помилка вікового обмеження."
-      ]
-    }}
+    5.  **Format**: Every case has "steps" -- a list with ONE action per item, without numbering or bullets --
+        and "expected_result" -- one sentence with the outcome.
 
     Requirements Text:
     {requirements_text}
     """
     try:
-        response = retry_api_call(
-            client.models.generate_content,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
-        )
-
-        cleaned_text = response.text.replace("```json", "").replace("```", "").strip()
-        data = json.loads(cleaned_text)
-
-        # Priority: Return (module_name, cases)
-        if isinstance(data, dict):
-            module_name = data.get("module_name") or data.get("module") or "General"
-            cases = data.get("cases") or data.get("test_cases") or []
-            if not cases and isinstance(data, list): # fallback if it ignored the dict format
-                 cases = data
-            return module_name, cases
-        elif isinstance(data, list):
-            return "General", data
-        
-        return "General", []
+        module_name, cases = _generate_cases(prompt, case_schema.CaseBatch)
+        return module_name or "General", cases
 
     except Exception as e:
         print(f"❌ AI Error (Cases): {e}")
@@ -110,7 +117,73 @@ def generate_test_cases(requirements_text):
         raise e
 
 
-def generate_bug_report(case_text, user_description):
+def generate_section_cases(sections, module_name=None, context_titles=(), target_cases=None):
+    """Like generate_test_cases, but the requirements arrive as labelled sections
+    and every case names the section it covers, so cases can later be matched
+    to document revisions (see documents.py).
+
+    sections       -- [(label, text)], labels like "S1"
+    module_name    -- known module (re-upload); None lets the model name it
+    context_titles -- titles of unchanged sections, for cross references only
+    target_cases   -- approximate number of cases to ask for (default 30-45)
+
+    Returns (module_name, [(label, case)]), cases being case_schema.SectionCase.
+    """
+    labelled = "\n\n".join(f"### [{label}]\n{text}" for label, text in sections)
+    goal = f"approximately {target_cases}" if target_cases else "approximately 30-45"
+    module_rule = (f'The module already exists and is called "{module_name}". Use exactly this name.'
+                   if module_name else 'Extract from titles (e.g., "User Profile"). In ENGLISH.')
+    context = ""
+    if context_titles:
+        context = ("\n    The module also has these UNCHANGED sections, already covered by existing cases "
+                   "(do NOT write cases for them):\n    - " + "\n    - ".join(context_titles) + "\n")
+    prompt = f"""
+    Act as a Senior Professional QA Engineer.
+    Your task is to analyze the provided requirements and generate a comprehensive yet balanced set of test cases for a single module.
+
+    GOAL: Generate {goal} high-quality test cases for the sections below.
+    The goal is total professional coverage without being "overkill" or creating microscopic duplicates.
+
+    CRITICAL RULES:
+    1.  **Module Name**: {module_rule}
+    2.  **Test Cases Content**: UKRAINIAN (Українська мова).
+    3.  **Smart Grouping**: Group related validation rules for the same field (e.g., instead of 5 tests for each forbidden character, create one comprehensive "Negative: Invalid characters" test).
+    4.  **Priorities**: Focus on:
+        - Main business logic (Happy Path).
+        - Critical field validations (Mandatory, Length, Format).
+        - Important logic constraints (e.g., age restrictions, KYC status).
+    5.  **Format**: Every case has "steps" -- a list with ONE action per item, without numbering or bullets --
+        and "expected_result" -- one sentence with the outcome.
+    6.  **Sections**: The requirements are split into sections labelled [S1], [S2], ... Every case must name
+        the ONE section it mainly verifies.
+    {context}
+    Requirements Sections:
+    {labelled}
+    """
+    try:
+        name, cases = _generate_cases(prompt, case_schema.SectionCaseBatch)
+        return module_name or name or "General", [(case.section, case) for case in cases]
+
+    except Exception as e:
+        print(f"❌ AI Error (Section cases): {e}")
+        raise e
+
+
+# Скільки символів кожного схожого звіту іде в промпт як приклад
+SIMILAR_REPORT_CHARS = 1500
+
+
+def generate_bug_report(case_text, user_description, similar_reports=None):
+    similar_block = ""
+    if similar_reports:
+        examples = "\n\n".join(f"--- Past report {i + 1} ---\n{r[:SIMILAR_REPORT_CHARS]}"
+                                 for i, r in enumerate(similar_reports))
+        similar_block = f"""
+    SIMILAR PAST REPORTS FROM THIS PROJECT (reuse their terminology, component names and
+    severity calibration; do not copy facts that don't apply to this failure):
+    {examples}
+    """
+
     prompt = f"""
     Act as a Senior QA Engineer.
     Write a professional Bug Report based on the following failure.
@@ -118,7 +191,7 @@ def generate_bug_report(case_text, user_description):
     INPUT CONTEXT (CRITICAL):
     - Test Case that was being executed: "{case_text}"
     - Tester's Observation of the failure: "{user_description}"
-
+    {similar_block}
     OUTPUT FORMAT:
     **Summary:** [Short title describing the defect]
     **Severity:** [S1-Blocker / S2-Critical / S3-Major / S4-Minor]
@@ -133,7 +206,7 @@ def generate_bug_report(case_text, user_description):
 
     try:
         response = retry_api_call(
-            client.models.generate_content,
+            get_client().models.generate_content,
             contents=prompt
         )
         return response.text.strip()
@@ -0,0 +1,253 @@
+"""Scheduler for Gemini calls: one shared quota, shared fairly between projects.
+
+Every AI call from the web app goes through here instead of running inline:
+
+    report = await ai_scheduler.run(project, "bug_report", ai_helper.generate_bug_report, text, desc)
+
+- Work classes are served by priority: interactive bug reports before bulk
+  generation. A generation task waiting longer than AGING_SECONDS is served
+  anyway, so a stream of bug reports can't starve uploads forever.
+- Inside a class every project has its own queue and projects take turns
+  by weighted fair queuing: a project's virtual time advances by cost/weight
+  per task, the project furthest behind goes next. One project queueing ten
+  big specs doesn't delay another project's single upload by ten slots.
+- At most MAX_CONCURRENCY calls run at once (worker threads; the Gemini SDK
+  is synchronous), which also keeps the event loop free while they run.
+
+Configuration:
+    QAFLOW_AI_CONCURRENCY=2               global cap on simultaneous AI calls
+    QAFLOW_AI_WEIGHTS="Big Client=3,Internal=1"   per-project weights (default 1)
+    QAFLOW_AI_AGING_SECONDS=30
+
+metrics() reports queue depth, running calls and wait/run times; it is
+served at /api/ai/queue.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import os
+import threading
+import time
+
+import profiling
+
+# Lower number = served first
+PRIORITIES = {"bug_report": 0, "generation": 1}
+
+MAX_CONCURRENCY = int(os.getenv("QAFLOW_AI_CONCURRENCY", "2"))
+AGING_SECONDS = float(os.getenv("QAFLOW_AI_AGING_SECONDS", "30"))
+
+# Wait/run time samples kept per class for the percentiles in metrics()
+SAMPLE_WINDOW = 500
+
+
+def parse_weights(spec):
+    """'A=3,B=1' -> {'A': 3.0, 'B': 1.0}"""
+    weights = {}
+    for part in (spec or "").split(","):
+        name, _, value = part.rpartition("=")
+        if name.strip():
+            weights[name.strip()] = max(float(value), 0.01)
+    return weights
+
+
+class _Task:
+    __slots__ = ("project", "kind", "func", "args", "kwargs", "cost", "future", "enqueued")
+
+    def __init__(self, project, kind, func, args, kwargs, cost):
+        self.project = project
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cost = cost
+        self.future = concurrent.futures.Future()
+        self.enqueued = time.monotonic()
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))] * 1000, 1)
+
+    return {"count": len(ordered), "avg": round(sum(ordered) / len(ordered) * 1000, 1),
+            "p50": pct(50), "p95": pct(95), "max": round(ordered[-1] * 1000, 1)}
+
+
+class AIScheduler:
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, weights=None, aging_seconds=AGING_SECONDS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.weights = dict(weights if weights is not None else parse_weights(os.getenv("QAFLOW_AI_WEIGHTS")))
+        self.aging_seconds = aging_seconds
+        self._cond = threading.Condition()
+        # kind -> project -> deque of tasks; only projects with queued work are present
+        self._queues = {kind: collections.OrderedDict() for kind in PRIORITIES}
+        # Weighted fair queuing state per class: project -> virtual finish time
+        self._vfinish = {kind: {} for kind in PRIORITIES}
+        self._vtime = {kind: 0.0 for kind in PRIORITIES}
+        self._running = 0
+        self._completed = collections.Counter()
+        self._failed = collections.Counter()
+        self._waits = {kind: collections.deque(maxlen=SAMPLE_WINDOW) for kind in PRIORITIES}
+        self._runs = {kind: collections.deque(maxlen=SAMPLE_WINDOW) for kind in PRIORITIES}
+        self._per_project = collections.defaultdict(lambda: {"completed": 0, "wait_s": 0.0})
+        self._workers = []
+        self._pid = None
+
+    def weight(self, project):
+        return self.weights.get(project, 1.0)
+
+    # --- Submitting ---
+
+    def submit(self, project, kind, func, *args, cost=1.0, **kwargs):
+        """Queue ``func(*args, **kwargs)``; returns a concurrent.futures.Future"""
+        if kind not in PRIORITIES:
+            raise ValueError(f"Unknown AI work class: {kind}")
+        task = _Task(project or "", kind, func, args, kwargs, max(cost, 0.01))
+        with self._cond:
+            self._ensure_workers()
+            queues = self._queues[kind]
+            if task.project not in queues:
+                # A project coming back from idle starts at the current virtual time,
+                # not with credit saved up while it was away
+                vfinish = self._vfinish[kind]
+                vfinish[task.project] = max(vfinish.get(task.project, 0.0), self._vtime[kind])
+                queues[task.project] = collections.deque()
+            queues[task.project].append(task)
+            self._cond.notify()
+        return task.future
+
+    async def run(self, project, kind, func, *args, cost=1.0, **kwargs):
+        """submit() and await the result from async code"""
+        with profiling.stage("ai"):
+            return await asyncio.wrap_future(self.submit(project, kind, func, *args, cost=cost, **kwargs))
+
+    # --- Dispatch ---
+
+    def _pick_kind(self):
+        ordered = sorted(PRIORITIES, key=PRIORITIES.get)
+        chosen = next((kind for kind in ordered if self._queues[kind]), None)
+        if chosen is None:
+            return None
+        # Aging: lower classes whose oldest task waited too long go first
+        now = time.monotonic()
+        for kind in ordered[ordered.index(chosen) + 1:]:
+            oldest = min((q[0].enqueued for q in self._queues[kind].values()), default=None)
+            if oldest is not None and now - oldest >= self.aging_seconds:
+                return kind
+        return chosen
+
+    def _pick(self):
+        kind = self._pick_kind()
+        if kind is None:
+            return None
+        queues = self._queues[kind]
+        vfinish = self._vfinish[kind]
+        project = min(queues, key=lambda p: vfinish[p])
+        task = queues[project].popleft()
+        if not queues[project]:
+            del queues[project]
+        self._vtime[kind] = vfinish[project]
+        vfinish[project] += task.cost / self.weight(project)
+        return task
+
+    def _ensure_workers(self):
+        # Threads don't survive a fork (gunicorn --preload): start fresh ones in the child
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._workers = []
+            self._running = 0
+        while len(self._workers) < self.max_concurrency:
+            worker = threading.Thread(target=self._work, name=f"ai-worker-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._pick()
+                while task is None:
+                    self._cond.wait()
+                    task = self._pick()
+                self._running += 1
+            if not task.future.set_running_or_notify_cancel():
+                with self._cond:
+                    self._running -= 1
+                continue
+            started = time.monotonic()
+            ok = True
+            try:
+                task.future.set_result(task.func(*task.args, **task.kwargs))
+            except BaseException as e:
+                ok = False
+                task.future.set_exception(e)
+            finally:
+                finished = time.monotonic()
+                with self._cond:
+                    self._running -= 1
+                    (self._completed if ok else self._failed)[task.kind] += 1
+                    self._waits[task.kind].append(started - task.enqueued)
+                    self._runs[task.kind].append(finished - started)
+                    stats = self._per_project[task.project]
+                    stats["completed"] += 1
+                    stats["wait_s"] += started - task.enqueued
+
+    # --- Metrics ---
+
+    def depth(self, kind=None, project=None):
+        """Queued (not yet running) tasks, optionally for one class and/or project"""
+        with self._cond:
+            kinds = [kind] if kind else list(PRIORITIES)
+            return sum(len(q) for k in kinds for p, q in self._queues[k].items() if project is None or p == project)
+
+    def metrics(self):
+        with self._cond:
+            now = time.monotonic()
+            queued = {kind: {p: len(q) for p, q in self._queues[kind].items()} for kind in PRIORITIES}
+            oldest = {kind: round(max((now - q[0].enqueued for q in self._queues[kind].values()), default=0) * 1000, 1)
+                      for kind in PRIORITIES}
+            projects = {}
+            for project in set(self._per_project) | {p for q in queued.values() for p in q}:
+                stats = self._per_project.get(project, {"completed": 0, "wait_s": 0.0})
+                projects[project] = {
+                    "weight": self.weight(project),
+                    "queued": sum(queued[kind].get(project, 0) for kind in PRIORITIES),
+                    "completed": stats["completed"],
+                    "avg_wait_ms": round(stats["wait_s"] / stats["completed"] * 1000, 1) if stats["completed"] else 0,
+                }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "running": self._running,
+                "queued": {kind: sum(q.values()) for kind, q in queued.items()},
+                "oldest_wait_ms": oldest,
+                "wait_ms": {kind: _percentiles(self._waits[kind]) for kind in PRIORITIES},
+                "run_ms": {kind: _percentiles(self._runs[kind]) for kind in PRIORITIES},
+                "completed": dict(self._completed),
+                "failed": dict(self._failed),
+                "projects": projects,
+            }
+
+
+scheduler = AIScheduler()
+
+
+def configure(max_concurrency=None, weights=None, aging_seconds=None):
+    """Replace the process-wide scheduler (benchmarks, tests of settings)"""
+    global scheduler
+    scheduler = AIScheduler(
+        max_concurrency=max_concurrency or MAX_CONCURRENCY,
+        weights=weights,
+        aging_seconds=AGING_SECONDS if aging_seconds is None else aging_seconds,
+    )
+    return scheduler
+
+
+async def run(project, kind, func, *args, cost=1.0, **kwargs):
+    return await scheduler.run(project, kind, func, *args, cost=cost, **kwargs)
+
+
+def metrics():
+    return scheduler.metrics()
@@ -0,0 +1,275 @@
+"""Online backups of the SQLite database: compressed snapshots, retention, restore.
+
+    backup.create()                 # snapshot now; also POST /api/admin/backup
+    python -m backup create
+    python -m backup list
+    python -m backup restore backups/qaflow-20260101-030000.db.gz
+
+A snapshot is taken with SQLite's online backup API, QAFLOW_BACKUP_PAGES
+(256) pages per step with a short sleep in between, from one read
+transaction: in WAL mode that is a consistent snapshot, and
+/api/submit-result and every other writer go on committing while it is
+copied. Copying the file instead, as before, leaves out every commit still
+in the -wal file and can catch a checkpoint halfway. The copy is checked (PRAGMA quick_check), gzipped into
+QAFLOW_BACKUP_DIR (default: backups/ next to the database) and only then
+renamed to its final name, so a listed file is always complete. The newest
+QAFLOW_BACKUP_KEEP (7) snapshots are kept.
+
+While a snapshot runs, a probe takes the write lock (BEGIN IMMEDIATE,
+ROLLBACK; nothing is written) every PROBE_INTERVAL seconds, and before it a
+few times for a baseline. Every report has the backup duration and how long
+a writer waited for the lock before and during it.
+
+The maintenance thread takes a snapshot every QAFLOW_BACKUP_HOURS (24; 0 turns
+it off), recorded in maintenance_runs like the other tasks.
+
+restore() first snapshots the current database (unless told not to), then
+copies the snapshot over it with the backup API, which works under a running
+app. Data versions are moved forward afterwards so that no client's ETag or
+worker's name cache matches the restored data by accident.
+
+PostgreSQL: use pg_dump / pg_restore; the scheduled task is off there.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import utils
+
+BACKUP_HOURS = float(os.getenv("QAFLOW_BACKUP_HOURS", "24"))
+BACKUP_KEEP = int(os.getenv("QAFLOW_BACKUP_KEEP", "7"))
+PAGES_PER_STEP = int(os.getenv("QAFLOW_BACKUP_PAGES", "256"))
+STEP_SLEEP = float(os.getenv("QAFLOW_BACKUP_SLEEP_MS", "5")) / 1000
+
+PREFIX = "qaflow-"
+SUFFIX = ".db.gz"
+# Write-lock probe: seconds between probes, and baseline probes before the copy
+PROBE_INTERVAL = 0.02
+BASELINE_PROBES = 10
+
+# One snapshot at a time per process (the scheduler and the admin endpoint)
+_lock = threading.Lock()
+
+
+def supported():
+    return utils.get_backend().dialect == "sqlite"
+
+
+def backup_dir():
+    configured = os.getenv("QAFLOW_BACKUP_DIR")
+    if configured:
+        return configured
+    return os.path.join(os.path.dirname(os.path.abspath(utils.get_backend().path)), "backups")
+
+
+def _check_supported():
+    if not supported():
+        raise ValueError("Built-in backups are for SQLite; use pg_dump/pg_restore for PostgreSQL")
+
+
+class _WriteProbe(threading.Thread):
+    """Times how long taking the write lock takes, until stopped"""
+
+    def __init__(self, path, interval=PROBE_INTERVAL):
+        super().__init__(name="backup-probe", daemon=True)
+        self.path = path
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+    def probe(self, conn):
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("ROLLBACK")
+        self.samples.append(time.perf_counter() - started)
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            while not self._done.wait(self.interval):
+                self.probe(conn)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _summary(samples):
+    if not samples:
+        return {"samples": 0}
+    ordered = sorted(samples)
+    return {"samples": len(ordered),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2)}
+
+
+def _baseline(path):
+    probe = _WriteProbe(path)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        for _ in range(BASELINE_PROBES):
+            probe.probe(conn)
+            time.sleep(PROBE_INTERVAL / 5)
+    finally:
+        conn.close()
+    return probe.samples
+
+
+def list_backups():
+    """Snapshots in the backup directory, newest first"""
+    directory = backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    backups = []
+    for name in os.listdir(directory):
+        if name.startswith(PREFIX) and name.endswith(SUFFIX):
+            stat = os.stat(os.path.join(directory, name))
+            backups.append((stat.st_mtime, name, stat.st_size))
+    backups.sort(reverse=True)
+    return [{"name": name, "bytes": size, "created_at": datetime.fromtimestamp(mtime).isoformat(timespec="seconds")}
+            for mtime, name, size in backups]
+
+
+def prune(keep=BACKUP_KEEP):
+    """Delete all but the newest ``keep`` snapshots; returns their names"""
+    removed = [entry["name"] for entry in list_backups()[keep:]]
+    for name in removed:
+        os.remove(os.path.join(backup_dir(), name))
+    return removed
+
+
+def create(label=None, keep=BACKUP_KEEP):
+    """Snapshot the database now and keep the newest ``keep`` (None: delete nothing); returns the report"""
+    _check_supported()
+    backend = utils.get_backend()
+    directory = backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    with _lock:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        name = f"{PREFIX}{stamp}{'-' + label if label else ''}{SUFFIX}"
+        n = 1
+        while os.path.exists(os.path.join(directory, name)):
+            n += 1
+            name = f"{PREFIX}{stamp}-{n}{'-' + label if label else ''}{SUFFIX}"
+        started = time.perf_counter()
+        baseline = _baseline(backend.path)
+        fd, raw_path = tempfile.mkstemp(prefix=".snapshot-", suffix=".db", dir=directory)
+        os.close(fd)
+        part = os.path.join(directory, name + ".part")
+        try:
+            probe = _WriteProbe(backend.path)
+            probe.start()
+            try:
+                copy = backend.backup(raw_path, pages=PAGES_PER_STEP, sleep=STEP_SLEEP)
+            finally:
+                probe.stop()
+            check = sqlite3.connect(raw_path)
+            try:
+                status = check.execute("PRAGMA quick_check").fetchone()[0]
+            finally:
+                check.close()
+            if status != "ok":
+                raise RuntimeError(f"Snapshot failed its integrity check: {status}")
+            compress_started = time.perf_counter()
+            with open(raw_path, "rb") as src, gzip.open(part, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(part, os.path.join(directory, name))
+            compress_seconds = time.perf_counter() - compress_started
+            raw_bytes = os.path.getsize(raw_path)
+        finally:
+            for path in (raw_path, part):
+                if os.path.exists(path):
+                    os.remove(path)
+        return {
+            "file": name,
+            "seconds": round(time.perf_counter() - started, 3),
+            "copy_seconds": copy["seconds"],
+            "compress_seconds": round(compress_seconds, 3),
+            "pages": copy["pages"],
+            "steps": copy["steps"],
+            "raw_bytes": raw_bytes,
+            "stored_bytes": os.path.getsize(os.path.join(directory, name)),
+            "writer_lock_wait": {"before": _summary(baseline), "during": _summary(probe.samples)},
+            "pruned": prune(keep) if keep is not None else [],
+        }
+
+
+def _resolve(name):
+    if os.path.exists(name):
+        return name
+    path = os.path.join(backup_dir(), os.path.basename(name))
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No such backup: {name}")
+    return path
+
+
+def restore(name, safety_copy=True):
+    """Replace the database with snapshot ``name`` (a file name in the backup
+    directory or a path); returns {"restored", "safety_copy", "seconds"}"""
+    _check_supported()
+    path = _resolve(name)
+    started = time.perf_counter()
+    os.makedirs(backup_dir(), exist_ok=True)
+    fd, raw_path = tempfile.mkstemp(prefix=".restore-", suffix=".db", dir=backup_dir())
+    os.close(fd)
+    try:
+        with gzip.open(path, "rb") as src, open(raw_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        check = sqlite3.connect(raw_path)
+        try:
+            status = check.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            check.close()
+        if status != "ok":
+            raise RuntimeError(f"Backup {name} failed its integrity check: {status}")
+        # Nothing is pruned here: the snapshot being restored may be the oldest one
+        safety = create(label="pre-restore", keep=None)["file"] if safety_copy else None
+        project_version, catalog_version = utils.get_data_versions()
+        utils.get_backend().restore(raw_path)
+        utils.advance_data_versions(project_version + 1, catalog_version + 1)
+    finally:
+        os.remove(raw_path)
+    return {"restored": os.path.basename(path), "safety_copy": safety,
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+def status():
+    return {"supported": supported(), "directory": backup_dir() if supported() else None,
+            "interval_hours": BACKUP_HOURS, "keep": BACKUP_KEEP,
+            "backups": list_backups() if supported() else []}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QAFlow database backups")
+    parser.add_argument("--database", help="SQLite path or URL (default: QAFLOW_DATABASE_URL / database.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create", help="take a snapshot now")
+    commands.add_parser("list", help="list snapshots, newest first")
+    restore_cmd = commands.add_parser("restore", help="replace the database with a snapshot")
+    restore_cmd.add_argument("backup", help="file name in the backup directory, or a path")
+    restore_cmd.add_argument("--no-safety-copy", action="store_true",
+                             help="don't snapshot the current database first")
+    args = parser.parse_args(argv)
+    if args.database:
+        utils.configure_database(args.database)
+    if args.command == "create":
+        result = create()
+    elif args.command == "list":
+        result = list_backups()
+    else:
+        result = restore(args.backup, safety_copy=not args.no_safety_copy)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""Reproducible performance benchmarks for QAFlow-AI.
+
+Run with ``python -m benchmarks.run`` from the repository root. All AI calls
+go through ``benchmarks.fake_ai`` and all data lives in a temporary SQLite
+file, so the real ``database.db`` and the Gemini quota are never touched.
+"""
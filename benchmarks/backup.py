@@ -0,0 +1,151 @@
+"""Writer latency while the database is being backed up (backup.py).
+
+A writer thread marks random cases passed/failed the way /api/submit-result
+does (utils.update_case_status), one every --write-interval seconds, for the
+whole run. The run goes through these phases:
+
+    idle      -- no backup: the baseline
+    online    -- backup.create(): online backup API in page steps, from one
+                 read snapshot, then quick_check and gzip
+    one-step  -- the same backup API copying everything in a single step
+    file-copy -- shutil.copyfile of the live file, the way backups were made before
+
+and reports per phase the duration, the number of writes and their latency
+(p50/p95/max), plus the backup's own report (duration, size, write-lock
+probe). The file copy is checked with PRAGMA quick_check and for commits
+it is missing: in WAL mode the newest ones are still in the -wal file,
+which a copy of the database file alone leaves behind.
+
+Examples:
+    python -m benchmarks.backup --output backup.json
+    python -m benchmarks.backup --cases 20000 --modules 10 --write-interval 0.001
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import datagen
+
+
+class Writer(threading.Thread):
+    def __init__(self, case_ids, interval, seed):
+        super().__init__(name="writer", daemon=True)
+        self.case_ids = case_ids
+        self.interval = interval
+        self.rng = random.Random(seed)
+        self.samples = []
+        self._done = threading.Event()
+
+    def run(self):
+        import utils
+        while not self._done.is_set():
+            case_id = self.rng.choice(self.case_ids)
+            started = time.perf_counter()
+            utils.update_case_status(case_id, self.rng.choice(("Pass", "FAILED")))
+            self.samples.append((started, time.perf_counter() - started))
+            if self.interval:
+                time.sleep(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def window(self, start, end):
+        latencies = sorted(lat for t, lat in self.samples if start <= t < end)
+        if not latencies:
+            return {"writes": 0}
+        return {"writes": len(latencies),
+                "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+                "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2)}
+
+
+def _phase(writer, fn):
+    start = time.perf_counter()
+    detail = fn()
+    end = time.perf_counter()
+    return {"seconds": round(end - start, 3), "writer": writer.window(start, end), **(detail or {})}
+
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix="qaflow_backup_")
+    db_path = os.path.join(work_dir, "bench.db")
+    os.environ["QAFLOW_BACKUP_DIR"] = os.path.join(work_dir, "backups")
+    t0 = time.perf_counter()
+    datagen.populate(db_path, projects=args.projects, modules_per_project=args.modules,
+                     cases_per_module=args.cases, seed=args.seed)
+    populate_s = time.perf_counter() - t0
+
+    import backup
+    import utils
+    conn = utils.get_db_connection()
+    case_ids = [row[0] for row in conn.execute("SELECT id FROM test_cases")]
+    conn.close()
+
+    writer = Writer(case_ids, args.write_interval, args.seed)
+    writer.start()
+    time.sleep(0.5)
+    phases = {"idle": _phase(writer, lambda: time.sleep(args.idle))}
+    phases["online"] = _phase(writer, lambda: {"report": backup.create()})
+
+    one_step = os.path.join(work_dir, "one-step.db")
+    phases["one-step"] = _phase(writer, lambda: utils.get_backend().backup(one_step, pages=-1, sleep=0))
+
+    copied = os.path.join(work_dir, "file-copy.db")
+
+    def file_copy():
+        shutil.copyfile(db_path, copied)
+        live = utils.get_data_versions()[0]
+        check = sqlite3.connect(copied)
+        try:
+            # Every write bumps its project's data version: the gap is commits the copy doesn't have
+            copy = check.execute("SELECT COALESCE(MAX(version), 0) FROM project_versions").fetchone()[0]
+            return {"quick_check": check.execute("PRAGMA quick_check").fetchone()[0], "commits_missing": live - copy}
+        except sqlite3.DatabaseError as e:
+            return {"quick_check": str(e)}
+        finally:
+            check.close()
+    phases["file-copy"] = _phase(writer, file_copy)
+    writer.stop()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "params": vars(args),
+        "populate_s": round(populate_s, 2),
+        "database_bytes": phases["online"]["report"]["raw_bytes"],
+        "phases": phases,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Writer latency during database backups")
+    parser.add_argument("--projects", type=int, default=2)
+    parser.add_argument("--modules", type=int, default=10)
+    parser.add_argument("--cases", type=int, default=5000, help="cases per module")
+    parser.add_argument("--write-interval", type=float, default=0.002, help="seconds between writes")
+    parser.add_argument("--idle", type=float, default=2.0, help="seconds of the baseline phase")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Import throughput and memory of case_import on large files.
+
+A file of --rows cases is generated per format (CSV, NDJSON, XLSX) with the
+columns of another tool's export: Module, Title (steps, one per line),
+Expected Result, Status, Bug Report. About --bad-rate of the rows are broken
+(no steps, unknown status) and must come back as row errors. Every run is a
+fresh process on an empty database and reports rows per second, the
+import's own report (imported / failed / chunks) and the process's peak RSS.
+
+    stream    -- case_import.import_file: rows streamed, chunks validated
+                 (in worker processes with --workers), one executemany per chunk
+    add_cases -- what a script could do before: read the whole file, then
+                 utils.add_cases per module (CSV only)
+
+Memory: --sizes runs the CSV import at several sizes; with streaming the
+peak RSS should hardly move between them.
+
+Examples:
+    python -m benchmarks.bulk_import --output bulk_import.json
+    python -m benchmarks.bulk_import --rows 20000 --formats csv --workers 0,2
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import case_schema
+from benchmarks import datagen
+
+STATUSES = ["", "Untested", "Passed", "Failed", "Pass", "PENDING"]
+HEADERS = ["Module", "Title", "Expected Result", "Status", "Bug Report"]
+
+
+def generate_rows(count, bad_rate, seed):
+    rng = random.Random(seed)
+    for i in range(count):
+        module = datagen.module_name(i % 25)
+        case = case_schema.split_text(datagen.case_text(rng, i))
+        steps, expected = "\n".join(case["steps"]), case["expected_result"]
+        status = rng.choice(STATUSES)
+        bug = "Кнопка не реагує на натискання" if status == "Failed" else ""
+        if rng.random() < bad_rate:
+            if rng.random() < 0.5:
+                steps = ""
+            else:
+                status = "Blocked"
+        yield [module, steps, expected, status, bug]
+
+
+def write_file(path, fmt, count, bad_rate, seed):
+    rows = generate_rows(count, bad_rate, seed)
+    if fmt == "csv":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADERS)
+            writer.writerows(rows)
+    elif fmt == "ndjson":
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(dict(zip(HEADERS, row)), ensure_ascii=False) + "\n")
+    else:
+        import openpyxl
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(HEADERS)
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+
+
+def _peak_rss_mb():
+    # kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def child(args):
+    """One measurement in this (fresh) process; prints its JSON"""
+    import case_import
+    import utils
+    utils.configure_database(args.database)
+    utils.init_db()
+    rss_before = _peak_rss_mb()
+    started = time.perf_counter()
+    if args.child == "stream":
+        report = case_import.import_file(args.file, "Import Bench", workers=args.child_workers)
+        report.pop("errors")
+        report.pop("modules")
+    else:
+        with open(args.file, encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            next(reader)
+            by_module = {}
+            for module, steps, expected, _, _ in reader:
+                by_module.setdefault(module, []).append({"steps": steps.split("\n"), "expected_result": expected})
+        for module, cases in by_module.items():
+            utils.add_cases(cases, module, "Import Bench")
+        report = {"rows": sum(len(cases) for cases in by_module.values())}
+    seconds = time.perf_counter() - started
+    conn = utils.get_db_connection()
+    stored = conn.execute("SELECT COUNT(*) FROM test_cases").fetchone()[0]
+    conn.close()
+    print(json.dumps({**report, "seconds": round(seconds, 3), "rows_per_second": round(report["rows"] / seconds, 1),
+                      "stored": stored, "peak_rss_mb": _peak_rss_mb(), "rss_before_mb": rss_before}))
+
+
+def measure(work_dir, path, method, workers):
+    db_path = os.path.join(work_dir, f"bench-{method}-{workers}-{time.monotonic_ns()}.db")
+    command = [sys.executable, "-m", "benchmarks.bulk_import", "--child", method, "--file", path,
+               "--database", db_path, "--child-workers", str(workers)]
+    out = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    for name in os.listdir(work_dir):
+        if name.startswith(os.path.basename(db_path)):
+            os.remove(os.path.join(work_dir, name))
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix="qaflow_import_")
+    workers = [int(w) for w in args.workers.split(",")]
+    files = {}
+
+    def data_file(fmt, rows):
+        if (fmt, rows) not in files:
+            path = os.path.join(work_dir, f"cases-{rows}.{'xlsx' if fmt == 'xlsx' else fmt}")
+            started = time.perf_counter()
+            write_file(path, fmt, rows, args.bad_rate, args.seed)
+            files[fmt, rows] = {"path": path, "bytes": os.path.getsize(path),
+                                "generate_s": round(time.perf_counter() - started, 2)}
+        return files[fmt, rows]["path"]
+
+    results = {}
+    for fmt in args.formats.split(","):
+        path = data_file(fmt, args.rows)
+        results[fmt] = {f"stream_workers_{w}": measure(work_dir, path, "stream", w) for w in workers}
+        if fmt == "csv" and args.baseline:
+            results[fmt]["add_cases"] = measure(work_dir, path, "add_cases", 0)
+    memory = {}
+    for rows in (int(size) for size in args.sizes.split(",") if size):
+        memory[rows] = measure(work_dir, data_file("csv", rows), "stream", 0)["peak_rss_mb"]
+    for info in files.values():
+        os.remove(info["path"])
+    os.rmdir(work_dir)
+    return {"params": vars(args), "cpus": os.cpu_count(),
+            "files": {f"{fmt}-{rows}": {k: v for k, v in info.items() if k != "path"} for (fmt, rows), info in files.items()},
+            "results": results, "csv_peak_rss_mb_by_rows": memory}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Bulk import throughput: streaming import vs add_cases")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--formats", default="csv,ndjson,xlsx")
+    parser.add_argument("--workers", default="0", help="comma-separated validation process counts to compare")
+    parser.add_argument("--bad-rate", type=float, default=0.01, help="share of broken rows")
+    parser.add_argument("--sizes", default="10000,100000", help="CSV sizes for the memory comparison")
+    parser.add_argument("--no-baseline", dest="baseline", action="store_false", help="skip the add_cases run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    # One measurement, in a fresh process
+    parser.add_argument("--child", choices=["stream", "add_cases"], help=argparse.SUPPRESS)
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    parser.add_argument("--database", help=argparse.SUPPRESS)
+    parser.add_argument("--child-workers", type=int, default=0, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.child:
+        child(args)
+        return
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
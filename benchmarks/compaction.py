@@ -0,0 +1,96 @@
+"""Prompt compaction on the fixture corpus: tokens saved and what survived.
+
+    python -m benchmarks.compaction [--budget 24000] [--output compaction.json]
+    python -m benchmarks.compaction --live   # also compare real model output
+
+For every document in benchmarks/fixtures/compaction.json this runs the
+upload path's reader and prompt_budget.prepare(), reports tokens before/after
+and checks the quality markers:
+
+    must_keep        phrases that have to survive compaction verbatim
+    must_drop        boilerplate that should be gone
+    min_occurrences  legitimately repeated lines that must not be deduplicated
+
+--live sends both the raw and the compacted text to Gemini (needs
+GEMINI_API_KEY) and reports module name and case counts side by side.
+Exits 1 if a quality check fails.
+"""
+import argparse
+import json
+import os
+import sys
+
+import prompt_budget
+import utils
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+READERS = {"doc": utils.read_doc, "docx": utils.read_docx, "txt": utils.read_txt}
+
+
+def _normalize(text):
+    return " ".join(text.split()).casefold()
+
+
+def check(fixture, compacted):
+    """List of failed quality checks for one fixture"""
+    text = _normalize(compacted)
+    failures = [f"lost: {p}" for p in fixture.get("must_keep", []) if _normalize(p) not in text]
+    failures += [f"kept boilerplate: {p}" for p in fixture.get("must_drop", []) if _normalize(p) in text]
+    for phrase, minimum in fixture.get("min_occurrences", {}).items():
+        count = text.count(_normalize(phrase))
+        if count < minimum:
+            failures.append(f"'{phrase}' appears {count}x, expected >= {minimum}")
+    return failures
+
+
+def _live(raw, compacted):
+    import ai_helper
+    result = {}
+    for name, text in (("raw", raw), ("compacted", compacted)):
+        module_name, cases = ai_helper.generate_test_cases(text)
+        result[name] = {"module": module_name, "cases": len(cases)}
+    return result
+
+
+def run(budget=None, live=False):
+    with open(os.path.join(FIXTURES, "compaction.json"), encoding="utf-8") as f:
+        fixtures = json.load(f)
+    report = {}
+    for fixture in fixtures:
+        raw = READERS[fixture["reader"]](os.path.join(FIXTURES, fixture["file"]))
+        compacted, stats = prompt_budget.prepare(raw, budget)
+        entry = dict(stats, failures=check(fixture, compacted))
+        if live:
+            entry["live"] = _live(raw, compacted)
+        report[fixture["file"]] = entry
+    totals = {
+        "tokens_in": sum(e["tokens_in"] for e in report.values()),
+        "tokens_out": sum(e["tokens_out"] for e in report.values()),
+    }
+    totals["saved_pct"] = round(100 * (1 - totals["tokens_out"] / max(totals["tokens_in"], 1)), 1)
+    return {"fixtures": report, "totals": totals}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure prompt compaction on the fixture corpus")
+    parser.add_argument("--budget", type=int, help="token budget (default: prompt_budget.TOKEN_BUDGET)")
+    parser.add_argument("--live", action="store_true", help="compare real model output on raw vs compacted text")
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    report = run(args.budget, args.live)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    failed = {name: e["failures"] for name, e in report["fixtures"].items() if e["failures"]}
+    if failed:
+        print(f"Quality checks failed: {failed}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare base.json head.json [--threshold 0.15] [--metric p95_ms]
+
+Exits with status 1 if any scenario got slower than the threshold allows.
+"""
+import argparse
+import json
+import sys
+
+
+def compare(base, head, metric="p95_ms", threshold=0.15):
+    rows = []
+    regressed = False
+    for name, head_stats in head["scenarios"].items():
+        base_stats = base["scenarios"].get(name)
+        if not base_stats or metric not in base_stats or metric not in head_stats:
+            rows.append((name, None, head_stats.get(metric), None, "new"))
+            continue
+        old, new = base_stats[metric], head_stats[metric]
+        change = (new - old) / old if old else 0.0
+        verdict = "ok"
+        if change > threshold:
+            verdict = "REGRESSION"
+            regressed = True
+        elif change < -threshold:
+            verdict = "faster"
+        rows.append((name, old, new, change, verdict))
+    return rows, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark JSON reports")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--metric", default="p95_ms")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.head, encoding="utf-8") as f:
+        head = json.load(f)
+
+    rows, regressed = compare(base, head, args.metric, args.threshold)
+    print(f"{'scenario':<22}{'base':>12}{'head':>12}{'change':>10}  verdict   ({args.metric})")
+    for name, old, new, change, verdict in rows:
+        old_s = f"{old:.3f}" if old is not None else "-"
+        new_s = f"{new:.3f}" if new is not None else "-"
+        change_s = f"{change:+.1%}" if change is not None else "-"
+        print(f"{name:<22}{old_s:>12}{new_s:>12}{change_s:>10}  {verdict}")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
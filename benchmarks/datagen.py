@@ -0,0 +1,95 @@
+"""Synthetic data generator for the benchmarks.
+
+Everything is derived from a seed, so two runs with the same parameters
+produce byte-identical databases and documents.
+"""
+import random
+
+import utils
+
+STATUS_MIX = (("PENDING", 0.6), ("Pass", 0.3), ("FAILED", 0.1))
+
+_WORDS = [
+    "профіль", "логін", "пароль", "email", "телефон", "дата", "народження", "валідація",
+    "форма", "кнопка", "збереження", "помилка", "повідомлення", "поле", "обов'язкове",
+    "довжина", "формат", "KYC", "статус", "верифікація", "аватар", "налаштування",
+]
+_MODULE_NAMES = [
+    "User Profile", "Authentication", "Registration", "Payments", "Notifications",
+    "Search", "Settings", "KYC Verification", "Checkout", "Admin Panel",
+]
+
+
+def _sentence(rng, words=8):
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def module_name(index):
+    base = _MODULE_NAMES[index % len(_MODULE_NAMES)]
+    return base if index < len(_MODULE_NAMES) else f"{base} {index // len(_MODULE_NAMES) + 1}"
+
+
+def case_text(rng, index):
+    steps = "\n".join(f"• {_sentence(rng, 5)}" for _ in range(rng.randint(2, 5)))
+    return f"Кроки:\n{steps}\n\nОчікуваний результат: {_sentence(rng, 7)} #{index}"
+
+
+def _pick_status(rng, mix):
+    roll = rng.random()
+    acc = 0.0
+    for status, weight in mix:
+        acc += weight
+        if roll < acc:
+            return status
+    return mix[-1][0]
+
+
+def populate(db_url, projects=1, modules_per_project=5, cases_per_module=100, seed=42, status_mix=STATUS_MIX):
+    """Point utils at ``db_url`` (SQLite path or postgresql://...), create the
+    schema and fill it with synthetic data. The database should be empty.
+
+    Returns a dict describing what was generated (project and module names).
+    """
+    rng = random.Random(seed)
+    utils.configure_database(db_url)
+    utils.init_db()
+
+    conn = utils.get_db_connection()
+    c = conn.cursor()
+    layout = {}
+    case_index = 0
+    for p in range(projects):
+        project_name = f"Bench Project {p + 1}"
+        project_id = c.execute("INSERT INTO projects (name) VALUES (?) RETURNING id", (project_name,)).fetchone()[0]
+        layout[project_name] = []
+        for m in range(modules_per_project):
+            name = module_name(m)
+            module_id = c.execute("INSERT INTO modules (project_id, name) VALUES (?, ?) RETURNING id",
+                                  (project_id, name)).fetchone()[0]
+            layout[project_name].append(name)
+            rows = []
+            for _ in range(cases_per_module):
+                status = _pick_status(rng, status_mix)
+                bug = f"**Summary:** Synthetic bug #{case_index}" if status == "FAILED" else None
+                rows.append((module_id, case_text(rng, case_index), status, bug, int(status == "FAILED")))
+                case_index += 1
+            c.executemany("INSERT INTO test_cases (module_id, content, status, bug_report, fail_count) "
+                          "VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return {"projects": layout, "total_cases": case_index}
+
+
+def requirements_document(title, sections=10, seed=42):
+    """Plain-text requirements spec shaped like our Confluence exports"""
+    rng = random.Random(seed)
+    lines = [f"# {title}", ""]
+    for s in range(sections):
+        lines.append(f"## {s + 1}. {_sentence(rng, 3)}")
+        for _ in range(rng.randint(3, 8)):
+            lines.append(f"- {_sentence(rng, rng.randint(6, 14))}")
+        lines.append("Поле | Тип | Обов'язкове")
+        for _ in range(rng.randint(2, 5)):
+            lines.append(f"{rng.choice(_WORDS)} | text | {rng.choice(['так', 'ні'])}")
+        lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,128 @@
+"""Drop-in replacement for ``genai.Client`` used by the benchmarks.
+
+Only the surface that ``ai_helper`` touches is implemented:
+``client.models.generate_content(model=..., contents=..., config=...)``
+returning an object with a ``.text`` attribute and, like the SDK when the
+config has a ``response_schema``, ``.parsed``.
+"""
+import json
+import random
+import re
+import threading
+import time
+
+
+class FakeResponse:
+    def __init__(self, text, parsed=None):
+        self.text = text
+        self.parsed = parsed
+
+
+class FakeQuotaError(Exception):
+    """Mimics the SDK error raised when Gemini answers with HTTP 429"""
+
+    def __init__(self, model):
+        super().__init__(f"429 RESOURCE_EXHAUSTED: quota exceeded for {model} (injected by fake backend)")
+
+
+class _FakeModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate_content(self, model=None, contents="", config=None):
+        return self._owner._generate(model, contents, config)
+
+
+class FakeGenAIClient:
+    """Fake Gemini client with configurable latency and 429 injection.
+
+    latency       -- base seconds spent per call
+    jitter        -- extra uniform random seconds added on top of latency
+    error_rate    -- probability (0..1) that a call raises a 429-style error
+    cases_per_doc -- how many test cases a generation call returns
+    malformed_rate -- probability (0..1) that a generation answer is cut off
+                      mid-case, like a response hitting the output token limit
+    seed          -- makes latency/error sequences reproducible between runs
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, cases_per_doc=30, malformed_rate=0.0, seed=42):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.cases_per_doc = cases_per_doc
+        self.malformed_rate = malformed_rate
+        self.models = _FakeModels(self)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "injected_429": 0, "case_generations": 0, "malformed": 0, "bug_reports": 0,
+                      "prompt_chars": 0, "time_s": 0.0}
+
+    def _generate(self, model, contents, config):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["prompt_chars"] += len(contents or "")
+            delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+            if fail:
+                self.stats["injected_429"] += 1
+            self.stats["time_s"] += delay
+
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeQuotaError(model)
+
+        if getattr(config, "response_mime_type", None) == "application/json":
+            with self._lock:
+                self.stats["case_generations"] += 1
+                malformed = self.malformed_rate > 0 and self._rng.random() < self.malformed_rate
+                if malformed:
+                    self.stats["malformed"] += 1
+            text = json.dumps(self._fake_cases(contents), ensure_ascii=False)
+            if malformed:
+                return FakeResponse(text[:len(text) * 3 // 4])
+            schema = getattr(config, "response_schema", None)
+            return FakeResponse(text, schema.model_validate_json(text) if hasattr(schema, "model_validate_json") else None)
+
+        with self._lock:
+            self.stats["bug_reports"] += 1
+        return FakeResponse(self._fake_bug_report(contents))
+
+    def _fake_cases(self, prompt):
+        # Take the module name from the prompt (re-upload) or the synthetic spec title
+        module_name = "Benchmark Module"
+        known = re.search(r'already exists and is called "(.+?)"', prompt or "")
+        if known:
+            module_name = known.group(1)
+        else:
+            for line in (prompt or "").splitlines():
+                line = line.strip()
+                if line.startswith("# "):
+                    module_name = line[2:].strip()
+                    break
+        # Sectioned prompts (ai_helper.generate_section_cases) ask for a count and want labels back
+        labels = re.findall(r"### \[(S\d+)\]", prompt or "")
+        target = re.search(r"Generate approximately (\d+) ", prompt or "")
+        count = int(target.group(1)) if labels and target else self.cases_per_doc
+        cases = [
+            {"steps": [f"Відкрити {module_name}", f"Виконати сценарій {i + 1}"],
+             "expected_result": f"Сценарій {i + 1} завершено успішно."}
+            for i in range(count)
+        ]
+        if labels:
+            cases = [{"section": labels[i % len(labels)], **case} for i, case in enumerate(cases)]
+        return {"module_name": module_name, "cases": cases}
+
+    def _fake_bug_report(self, prompt):
+        return (
+            "**Summary:** Synthetic defect reported by benchmark\n"
+            "**Severity:** S3-Major\n"
+            "**Steps to Reproduce:**\n1. Run the benchmark scenario\n"
+            "**Expected Result:** Scenario passes\n"
+            "**Actual Result:** Scenario failed (fake backend)"
+        )
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0.0 if key == "time_s" else 0
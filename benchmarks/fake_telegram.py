@@ -0,0 +1,156 @@
+"""Local stand-in for the Telegram Bot API, with Telegram's flood control.
+
+    server = FakeTelegramServer(latency=0.02)
+    await server.start()
+    bot = server.bot()          # aiogram Bot talking to the fake server
+    ...
+    await server.stop()
+
+Only the methods the bot uses are implemented: getMe, sendMessage,
+editMessageText, editMessageReplyMarkup, deleteMessage, answerCallbackQuery.
+Messages are kept in memory, so a run can check what every message shows
+in the end. Calls over the limits get HTTP 429 with ``retry_after`` the way
+Telegram does: more than chat_rate messages to one private chat, group_rate
+to a group (negative chat id) or global_rate in total. Limits use
+the ``<messages>/<seconds>:<burst>`` format of telegram_outbox. An edit
+that doesn't change the text gets Telegram's "message is not modified" 400.
+"""
+import asyncio
+import collections
+import math
+import time
+
+from aiohttp import web
+
+from telegram_outbox import parse_rate
+
+TOKEN = "123456:fake-token"
+
+
+class _Limit:
+    def __init__(self, spec):
+        self.rate, self.burst = parse_rate(spec)
+        self.buckets = {}
+
+    def take(self, key, now):
+        """0 if allowed, else seconds until it would be"""
+        tokens, updated = self.buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            return 0.0
+        self.buckets[key] = (tokens, now)
+        return (1 - tokens) / self.rate
+
+
+class FakeTelegramServer:
+    """latency -- seconds per call; the limits as in telegram_outbox"""
+
+    def __init__(self, latency=0.0, global_rate="30/1:30", chat_rate="1/1:3", group_rate="20/60:3",
+                 host="127.0.0.1", port=0):
+        self.latency = latency
+        self.host, self.port = host, port
+        self._global = _Limit(global_rate)
+        self._chat = _Limit(chat_rate)
+        self._group = _Limit(group_rate)
+        # (chat_id, message_id) -> text
+        self.messages = {}
+        self._next_id = collections.Counter()
+        self.stats = collections.Counter()
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def bot(self):
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        return Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(self.url)))
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.stats["calls"] += 1
+        self.stats[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        handler = getattr(self, f"_{method}", None)
+        if handler is None:
+            return self._error(404, f"Not Found: method {method} is not implemented")
+        if method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            chat_id = int(params["chat_id"])
+            now = time.monotonic()
+            limit = self._group if chat_id < 0 else self._chat
+            wait = max(limit.take(chat_id, now), self._global.take(None, now))
+            if wait > 0:
+                self.stats["flood_429"] += 1
+                retry_after = max(1, math.ceil(wait))
+                return web.json_response({"ok": False, "error_code": 429,
+                                          "description": f"Too Many Requests: retry after {retry_after}",
+                                          "parameters": {"retry_after": retry_after}}, status=429)
+        return handler(params)
+
+    def _error(self, status, description):
+        return web.json_response({"ok": False, "error_code": status, "description": description}, status=status)
+
+    def _message(self, chat_id, message_id, text=None):
+        message = {"message_id": message_id, "date": int(time.time()),
+                   "chat": {"id": chat_id, "type": "group" if chat_id < 0 else "private"}}
+        if text is not None:
+            message["text"] = text
+        return web.json_response({"ok": True, "result": message})
+
+    def _getMe(self, params):
+        return web.json_response({"ok": True, "result": {"id": 123456, "is_bot": True, "first_name": "QAFlow",
+                                                         "username": "qaflow_fake_bot"}})
+
+    def _sendMessage(self, params):
+        chat_id = int(params["chat_id"])
+        self._next_id[chat_id] += 1
+        message_id = self._next_id[chat_id]
+        self.messages[(chat_id, message_id)] = params.get("text", "")
+        return self._message(chat_id, message_id, params.get("text", ""))
+
+    def _editMessageText(self, params):
+        key = (int(params["chat_id"]), int(params["message_id"]))
+        if key not in self.messages:
+            return self._error(400, "Bad Request: message to edit not found")
+        text = params.get("text", "")
+        if self.messages[key] == text and "reply_markup" not in params:
+            return self._error(400, "Bad Request: message is not modified")
+        self.messages[key] = text
+        return self._message(*key, text)
+
+    def _editMessageReplyMarkup(self, params):
+        key = (int(params["chat_id"]), int(params["message_id"]))
+        if key not in self.messages:
+            return self._error(400, "Bad Request: message to edit not found")
+        return self._message(*key, self.messages[key])
+
+    def _deleteMessage(self, params):
+        key = (int(params["chat_id"]), int(params["message_id"]))
+        if self.messages.pop(key, None) is None:
+            return self._error(400, "Bad Request: message to delete not found")
+        return web.json_response({"ok": True, "result": True})
+
+    def _answerCallbackQuery(self, params):
+        return web.json_response({"ok": True, "result": True})
+
+    def summary(self):
+        return {"stats": dict(self.stats), "messages": len(self.messages)}
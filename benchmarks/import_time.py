@@ -0,0 +1,79 @@
+"""Cold-start budget for the web entry points.
+
+Imports ``pa_wsgi`` (and therefore ``main``) in fresh interpreters and checks
+that the median import time stays under the budget and that none of the
+lazily-loaded heavy dependencies sneak back into the import graph.
+
+    python -m benchmarks.import_time [--budget-ms 1500] [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Loaded on first upload / first AI call only; importing main must not pull them in
+LAZY_MODULES = ("docx", "textract", "bs4", "google.genai", "uvicorn")
+
+DEFAULT_BUDGET_MS = 1500
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {target}
+elapsed = (time.perf_counter() - t0) * 1000
+print(json.dumps({{"ms": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(target="pa_wsgi", runs=5):
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # Point the app at a throwaway DB so the probe never touches database.db
+    env = dict(os.environ, QAFLOW_DB_PATH=os.path.join(tempfile.mkdtemp(prefix="qaflow_import_"), "probe.db"))
+    samples = []
+    loaded = set()
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, "-c", _PROBE.format(target=target, lazy=LAZY_MODULES)],
+                                      cwd=repo_root, env=env, text=True)
+        data = json.loads(out.strip().splitlines()[-1])
+        samples.append(data["ms"])
+        loaded.update(data["loaded"])
+    return {
+        "target": target,
+        "runs": runs,
+        "median_ms": round(statistics.median(samples), 2),
+        "max_ms": round(max(samples), 2),
+        "eager_heavy_modules": sorted(loaded),
+    }
+
+
+def check(result, budget_ms=DEFAULT_BUDGET_MS):
+    problems = []
+    if result["median_ms"] > budget_ms:
+        problems.append(f"median import time {result['median_ms']}ms exceeds budget {budget_ms}ms")
+    if result["eager_heavy_modules"]:
+        problems.append(f"heavy modules imported eagerly: {', '.join(result['eager_heavy_modules'])}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the cold-import budget of the WSGI entry point")
+    parser.add_argument("--target", default="pa_wsgi")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    result = measure(args.target, args.runs)
+    problems = check(result, args.budget_ms)
+    result["budget_ms"] = args.budget_ms
+    result["ok"] = not problems
+    print(json.dumps(result, indent=2))
+    for problem in problems:
+        print(f"❌ {problem}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Load generator for the admission layer (admission.py).
+
+Simulated users run concurrently for --duration seconds:
+
+    polite    -- testers: read stats/modules/cases every --think seconds
+    runaway   -- clients polling /api/stats in a tight loop
+    uploaders -- post a requirements document, then wait --think seconds
+
+Every simulated client has its own IP address, so the per-client buckets
+apply. The report lists, per client type and request class, how many
+requests got through, how many got 429 (and the Retry-After they were
+given) and the latency of the admitted ones, plus the limiter counters.
+The expectations: polite clients are never limited, runaway clients are,
+and uploads beyond the AI queue limit are shed instead of piling up.
+
+Examples:
+    python -m benchmarks.load --output load.json
+    python -m benchmarks.load --runaway 4 --uploaders 6 --ai-latency 1 --ai-max-queue 3
+    python -m benchmarks.load --url http://127.0.0.1:8000 --ip-header X-Real-IP --project Demo
+
+By default the app runs in-process on a temp SQLite database with the fake
+AI backend. With --url an already running server is driven instead; start it
+with QAFLOW_CLIENT_IP_HEADER set to --ip-header so that the simulated
+clients are told apart.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import datagen
+from benchmarks.fake_ai import FakeGenAIClient
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+        self.retry_after = collections.defaultdict(list)
+
+    def record(self, group, response, elapsed):
+        self.statuses[group][response.status_code] += 1
+        if response.status_code == 429:
+            self.retry_after[group].append(float(response.headers.get("retry-after", 0)))
+        else:
+            self.latencies[group].append(elapsed)
+
+    def summary(self):
+        out = {}
+        for group in sorted(self.statuses):
+            lat = sorted(self.latencies[group])
+            retry = self.retry_after[group]
+            entry = {"statuses": {str(k): v for k, v in sorted(self.statuses[group].items())}}
+            total = sum(self.statuses[group].values())
+            entry["limited_pct"] = round(100.0 * self.statuses[group][429] / total, 1) if total else 0
+            if lat:
+                entry["p50_ms"] = round(lat[len(lat) // 2] * 1000, 1)
+                entry["p95_ms"] = round(lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000, 1)
+            if retry:
+                entry["retry_after_s"] = {"min": min(retry), "max": max(retry)}
+            out[group] = entry
+        return out
+
+
+async def _request(client, stats, group, method, url, **kwargs):
+    t0 = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    stats.record(group, response, time.perf_counter() - t0)
+    return response
+
+
+async def polite(client, stats, project, deadline, think):
+    while time.monotonic() < deadline:
+        for url in ("/api/stats", "/api/modules", "/api/cases"):
+            await _request(client, stats, f"polite {url}", "GET", url, params={"project": project})
+        await asyncio.sleep(think)
+
+
+async def runaway(client, stats, project, deadline):
+    while time.monotonic() < deadline:
+        await _request(client, stats, "runaway /api/stats", "GET", "/api/stats", params={"project": project})
+        await asyncio.sleep(0)
+
+
+async def uploader(client, stats, project, deadline, think, index):
+    n = 0
+    while time.monotonic() < deadline:
+        doc = datagen.requirements_document(f"Load Module {index}-{n}", sections=4, seed=index * 1000 + n)
+        response = await _request(client, stats, "uploader /api/upload", "POST", "/api/upload",
+                                  data={"project": project}, headers={"X-Project": project},
+                                  files={"file": (f"load_{index}_{n}.txt", doc.encode("utf-8"))})
+        n += 1
+        if response.status_code == 429:
+            # Well-behaved client: honour Retry-After, but don't sleep past the end of the run
+            wait = float(response.headers.get("retry-after", 1))
+            await asyncio.sleep(min(wait, max(0.0, deadline - time.monotonic())))
+        else:
+            await asyncio.sleep(think)
+
+
+def _client_factory(args, app):
+    def make(i):
+        ip = f"10.0.{i // 250}.{i % 250 + 1}"
+        if app is not None:
+            transport = httpx.ASGITransport(app=app, client=(ip, 40000 + i))
+            return httpx.AsyncClient(transport=transport, base_url="http://load.test", timeout=120)
+        headers = {args.ip_header: ip} if args.ip_header else {}
+        return httpx.AsyncClient(base_url=args.url, headers=headers, timeout=120)
+    return make
+
+
+def build_app(args):
+    """In-process app on a temp database with the fake AI backend and the requested limits"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="qaflow_load_"), "load.db")
+    layout = datagen.populate(db_path, modules_per_project=3, cases_per_module=50, seed=args.seed)
+
+    import ai_helper
+    import ai_scheduler
+    import admission
+    fake = FakeGenAIClient(latency=args.ai_latency, cases_per_doc=10, seed=args.seed)
+    ai_helper.set_client(fake)
+    ai_scheduler.configure(max_concurrency=args.ai_concurrency)
+    store = admission.SQLiteBuckets(os.path.join(os.path.dirname(db_path), "buckets.db")) if args.sqlite_buckets \
+        else admission.MemoryBuckets()
+    admission.configure(client_limits=admission.parse_limits(args.client_limits),
+                        project_limits=admission.parse_limits(args.project_limits),
+                        store=store, ai_max_queue=args.ai_max_queue)
+    # No VACUUM in the middle of a measurement
+    os.environ["QAFLOW_MAINTENANCE"] = "off"
+
+    import main
+    main.startup()
+    return main.app, next(iter(layout["projects"]))
+
+
+async def run(args):
+    app, project = (None, args.project) if args.url else build_app(args)
+    make = _client_factory(args, app)
+    stats = Stats()
+    deadline = time.monotonic() + args.duration
+    clients = []
+    tasks = []
+    i = 0
+    for _ in range(args.polite):
+        clients.append(make(i))
+        tasks.append(polite(clients[-1], stats, project, deadline, args.think))
+        i += 1
+    for _ in range(args.runaway):
+        clients.append(make(i))
+        tasks.append(runaway(clients[-1], stats, project, deadline))
+        i += 1
+    for n in range(args.uploaders):
+        clients.append(make(i))
+        tasks.append(uploader(clients[-1], stats, project, deadline, args.think, n))
+        i += 1
+    t0 = time.perf_counter()
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - t0
+    async with make(i) as probe:
+        queue = (await probe.get("/api/ai/queue")).json()
+    for client in clients:
+        await client.aclose()
+    return {
+        "params": vars(args),
+        "wall_s": round(wall, 2),
+        "groups": stats.summary(),
+        "admission": queue.get("admission"),
+        "ai_queue": {"queued": queue.get("queued"), "completed": queue.get("completed")},
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Concurrent load against the API to check admission control")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--polite", type=int, default=5)
+    parser.add_argument("--runaway", type=int, default=2)
+    parser.add_argument("--uploaders", type=int, default=8)
+    parser.add_argument("--think", type=float, default=1.0, help="pause between polite/upload rounds (s)")
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--ip-header", help="send each client's address in this header (with --url)")
+    parser.add_argument("--project", default="togetherfun", help="project to use with --url")
+    parser.add_argument("--client-limits", default="", help="QAFLOW_RATE_LIMITS format (in-process only)")
+    parser.add_argument("--project-limits", default="", help="QAFLOW_PROJECT_RATE_LIMITS format")
+    parser.add_argument("--ai-max-queue", type=int, default=3)
+    parser.add_argument("--ai-concurrency", type=int, default=1)
+    parser.add_argument("--ai-latency", type=float, default=0.5, help="seconds per fake AI call")
+    parser.add_argument("--sqlite-buckets", action="store_true", help="use the shared SQLite bucket store")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
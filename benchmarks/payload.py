@@ -0,0 +1,85 @@
+"""Payload size and JSON serialization cost of the list endpoints.
+
+    python -m benchmarks.payload [--cases 500] [--output payload.json]
+
+For every endpoint this reports the bytes on the wire for identity/gzip/br and
+how long the stdlib encoder (Starlette's JSONResponse) and FastJSONResponse
+take to render the same body.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks import datagen
+from benchmarks.run import build_app
+from benchmarks.fake_ai import FakeGenAIClient
+
+ENDPOINTS = [
+    ("cases", "/api/cases", {"page": 1, "limit": 100}),
+    ("cases_id_status", "/api/cases", {"page": 1, "limit": 100, "fields": "id,status"}),
+    ("bugs", "/api/bugs", {}),
+    ("bugs_id_module", "/api/bugs", {"fields": "id,module"}),
+    ("modules", "/api/modules", {}),
+]
+
+
+def _time_render(render, content, rounds):
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        render(content)
+    return (time.perf_counter() - t0) / rounds * 1000
+
+
+def measure(client, project, rounds=50):
+    from fastapi.responses import JSONResponse
+    import http_cache
+
+    stdlib = JSONResponse(None)
+    fast = http_cache.FastJSONResponse(None)
+    results = {}
+    for name, path, params in ENDPOINTS:
+        params = dict(params, project=project)
+        entry = {}
+        for encoding in ("identity", "gzip", "br"):
+            res = client.get(path, params=params, headers={"Accept-Encoding": encoding})
+            entry[f"bytes_{encoding}"] = res.num_bytes_downloaded
+            entry.setdefault("status", res.status_code)
+            if encoding == "identity":
+                content = res.json()
+            elif res.headers.get("content-encoding") != encoding:
+                entry[f"bytes_{encoding}"] = None  # not compressed: below the threshold or encoder missing
+        entry["render_stdlib_ms"] = round(_time_render(stdlib.render, content, rounds), 4)
+        entry["render_fast_ms"] = round(_time_render(fast.render, content, rounds), 4)
+        results[name] = entry
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure API payload size and serialization time")
+    parser.add_argument("--modules", type=int, default=5)
+    parser.add_argument("--cases", type=int, default=500, help="cases per module")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="qaflow_payload_"), "bench.db")
+    layout = datagen.populate(db_path, modules_per_project=args.modules, cases_per_module=args.cases, seed=args.seed)
+    client = build_app(db_path, FakeGenAIClient())
+    project = next(iter(layout["projects"]))
+
+    report = {"total_cases": layout["total_cases"], "endpoints": measure(client, project, args.rounds)}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
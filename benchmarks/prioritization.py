@@ -0,0 +1,187 @@
+"""How much sooner testers find failures with the risk-based case order (case_priority.py).
+
+A synthetic project gets a hidden truth: every module has a defect rate, a
+few features per module are fragile, and negative-path cases (invalid,
+empty, too long) fail more often. A first round of cases is run and
+recorded (the history), then a second round is uploaded as PENDING and
+walked through the way /api/start-module and /api/submit-result do:
+utils.get_next_pending_case_by_module, then utils.update_case_status with
+the hidden outcome. Orders compared:
+
+    id        -- every priority 0: the old ORDER BY id
+    risk      -- case_priority.rescore() once, after the upload
+    adaptive  -- risk, plus a rescore after every failure (what schedule() does
+                 a few seconds later)
+
+Per order the report gives APFD (average percentage of faults detected:
+1.0 would be all failures first, about 0.5 is a random order), the share of
+failures found after 10/25/50% of the cases, the next-case lookup time and
+the rescore time.
+
+Examples:
+    python -m benchmarks.prioritization --output prioritization.json
+    python -m benchmarks.prioritization --modules 20 --cases 200 --orders risk
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+FEATURES = ["email", "телефон", "пароль", "дата народження", "аватар", "адреса", "місто", "індекс",
+            "прізвище", "ім'я", "громадянство", "IBAN", "сума платежу", "промокод", "коментар", "файл"]
+HAPPY = ["ввести коректне значення у поле '{f}' і зберегти", "відкрити розділ з полем '{f}' і переглянути дані",
+         "змінити поле '{f}' на інше допустиме значення", "заповнити '{f}' і перейти на наступний крок"]
+NEGATIVE = ["ввести невалідне значення у поле '{f}'", "залишити обов'язкове поле '{f}' порожнім",
+            "ввести у поле '{f}' значення, що перевищує максимальну довжину",
+            "ввести у '{f}' спецсимволи та некоректний формат"]
+SCREENS = ["Профіль", "Реєстрація", "Оплата", "Налаштування", "Пошук", "Кошик", "Адмін", "Сповіщення"]
+
+
+def build_truth(rng, modules):
+    truth = {}
+    for m in range(modules):
+        rate = rng.choice([0.02, 0.03, 0.05, 0.08, 0.15, 0.3])
+        fragile = set(rng.sample(FEATURES, 2))
+        truth[f"{SCREENS[m % len(SCREENS)]} {m + 1}"] = (rate, fragile)
+    return truth
+
+
+def make_case(rng, rate, fragile):
+    feature = rng.choice(FEATURES)
+    negative = rng.random() < 0.35
+    action = rng.choice(NEGATIVE if negative else HAPPY).format(f=feature)
+    text = (f"Кроки:\n• Відкрити форму\n• {action[0].upper() + action[1:]}\n\n"
+            f"Очікуваний результат: {'Показано повідомлення про помилку' if negative else 'Дані збережено'}.")
+    p = rate * (2.5 if negative else 1.0) * (4.0 if feature in fragile else 1.0)
+    return text, rng.random() < min(p, 0.9)
+
+
+def populate(db_path, args, rng):
+    import utils
+    utils.configure_database(db_path)
+    utils.init_db()
+    truth = build_truth(rng, args.modules)
+    conn = utils.get_db_connection()
+    project_id = conn.execute("INSERT INTO projects (name) VALUES (?) RETURNING id", (args.project,)).fetchone()[0]
+    modules, outcome = {}, {}
+    for name, (rate, fragile) in truth.items():
+        module_id = conn.execute("INSERT INTO modules (project_id, name) VALUES (?, ?) RETURNING id",
+                                 (project_id, name)).fetchone()[0]
+        modules[name] = module_id
+        history = [make_case(rng, rate, fragile) for _ in range(args.history)]
+        conn.executemany("""
+            INSERT INTO test_cases (module_id, content, status, bug_observation, fail_count) VALUES (?, ?, ?, ?, ?)
+        """, [(module_id, text, "FAILED" if failed else "Pass", "Не працює як очікувалось" if failed else None,
+               int(failed)) for text, failed in history])
+        for text, failed in (make_case(rng, rate, fragile) for _ in range(args.cases)):
+            case_id = conn.execute("INSERT INTO test_cases (module_id, content) VALUES (?, ?) RETURNING id",
+                                   (module_id, text)).fetchone()[0]
+            outcome[case_id] = failed
+    conn.commit()
+    conn.close()
+    return project_id, modules, outcome
+
+
+def _reset(conn, project_id, outcome):
+    ids = list(outcome)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        conn.execute(f"UPDATE test_cases SET status = 'PENDING', priority = 0, fail_count = 0 "
+                     f"WHERE id IN ({','.join(['?'] * len(chunk))})", chunk)
+    conn.commit()
+
+
+def _apfd(positions, n):
+    m = len(positions)
+    return round(1 - sum(positions) / (n * m) + 1 / (2 * n), 4) if m and n else None
+
+
+def walk(args, order, project_id, modules, outcome):
+    import case_priority
+    import utils
+    conn = utils.get_db_connection()
+    _reset(conn, project_id, outcome)
+    conn.close()
+    rescores = []
+    if order != "id":
+        rescores.append(case_priority.rescore(args.project)["seconds"])
+    lookups, apfds = [], []
+    found_at = {0.1: 0, 0.25: 0, 0.5: 0}
+    total_failures = sum(outcome.values())
+    for name in modules:
+        positions, n = [], 0
+        while True:
+            started = time.perf_counter()
+            case = utils.get_next_pending_case_by_module(name, args.project)
+            lookups.append(time.perf_counter() - started)
+            if case is None or case["status"] != "PENDING":
+                break
+            n += 1
+            failed = outcome[case["id"]]
+            utils.update_case_status(case["id"], "FAILED" if failed else "Pass")
+            if failed:
+                positions.append(n)
+                if order == "adaptive":
+                    rescores.append(case_priority.rescore(args.project)["seconds"])
+        apfds.append(_apfd(positions, n))
+        for share in found_at:
+            found_at[share] += sum(1 for p in positions if p <= share * n)
+    lookups.sort()
+    apfds = [a for a in apfds if a is not None]
+    return {
+        "apfd": round(sum(apfds) / len(apfds), 4) if apfds else None,
+        **{f"found_after_{int(share * 100)}pct": round(found / total_failures, 3) if total_failures else None
+           for share, found in found_at.items()},
+        "next_case_p50_us": round(lookups[len(lookups) // 2] * 1e6, 1),
+        "next_case_p95_us": round(lookups[int(len(lookups) * 0.95)] * 1e6, 1),
+        "rescores": len(rescores),
+        "rescore_mean_s": round(sum(rescores) / len(rescores), 4) if rescores else None,
+    }
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    work_dir = tempfile.mkdtemp(prefix="qaflow_priority_")
+    db_path = os.path.join(work_dir, "bench.db")
+    project_id, modules, outcome = populate(db_path, args, rng)
+    import utils
+    plan = utils.explain_query("SELECT id FROM test_cases WHERE module_id = ? AND status = ? "
+                               "ORDER BY priority DESC, id ASC LIMIT 1", (1, "PENDING"))
+    orders = {order: walk(args, order, project_id, modules, outcome) for order in args.orders.split(",")}
+    utils.get_backend().dispose()
+    for name in os.listdir(work_dir):
+        os.remove(os.path.join(work_dir, name))
+    os.rmdir(work_dir)
+    return {"params": vars(args), "cases": len(outcome), "failures": sum(outcome.values()),
+            "next_case_plan": plan, "orders": orders}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Failures found early: id order vs risk-based order")
+    parser.add_argument("--project", default="Priority Bench")
+    parser.add_argument("--modules", type=int, default=8)
+    parser.add_argument("--history", type=int, default=80, help="cases already run per module")
+    parser.add_argument("--cases", type=int, default=80, help="pending cases per module")
+    parser.add_argument("--orders", default="id,risk,adaptive")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
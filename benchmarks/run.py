@@ -0,0 +1,149 @@
+"""Benchmark runner.
+
+Examples:
+    python -m benchmarks.run --cases 500 --output bench_base.json
+    python -m benchmarks.run --scenarios upload,search --ai-latency 0.2 --ai-error-rate 0.1
+    python -m benchmarks.compare bench_base.json bench_head.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import datagen, import_time, scenarios
+from benchmarks.fake_ai import FakeGenAIClient
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except Exception:
+        return None
+
+
+def build_app(db_url, fake_client):
+    """Import the app against ``db_url`` with the fake AI backend plugged in"""
+    import utils
+    utils.configure_database(db_url)
+
+    import ai_helper
+    ai_helper.set_client(fake_client)
+    ai_helper.RETRY_BASE_DELAY = 0.01
+
+    import admission
+    # Scenarios measure the app itself; benchmarks/load.py exercises the limits
+    admission.configure(enabled=False)
+    # No VACUUM in the middle of a measurement
+    os.environ["QAFLOW_MAINTENANCE"] = "off"
+
+    import main
+    main.startup()
+    from fastapi.testclient import TestClient
+    return TestClient(main.app)
+
+
+def run(args):
+    fake = FakeGenAIClient(latency=args.ai_latency, jitter=args.ai_jitter, error_rate=args.ai_error_rate,
+                           cases_per_doc=args.cases_per_doc, malformed_rate=args.ai_malformed_rate, seed=args.seed)
+    db_path = args.database_url or os.path.join(tempfile.mkdtemp(prefix="qaflow_bench_"), "bench.db")
+
+    t0 = time.perf_counter()
+    layout = datagen.populate(db_path, projects=args.projects, modules_per_project=args.modules,
+                              cases_per_module=args.cases, seed=args.seed)
+    populate_s = time.perf_counter() - t0
+
+    client = build_app(db_path, fake)
+    ctx = {
+        "layout": layout,
+        "fake": fake,
+        "seed": args.seed,
+        "uploads": args.uploads,
+        "doc_sections": args.doc_sections,
+        "fail_every": args.fail_every,
+        "max_clicks": args.max_clicks,
+        "repeat": args.repeat,
+        "search_terms": ["профіль", "валідація", "KYC", "Payments"],
+    }
+
+    results = {}
+    selected = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    for name in selected:
+        if name not in scenarios.SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}'. Available: {', '.join(scenarios.SCENARIOS)}")
+        fake.reset_stats()
+        rec = scenarios.Recorder(name)
+        scenarios.SCENARIOS[name](client, ctx, rec)
+        rec.finished = time.perf_counter()
+        results[name] = rec.summary()
+        results[name]["ai"] = dict(fake.stats)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": vars(args),
+            "populate_s": round(populate_s, 4),
+            "total_cases": layout["total_cases"],
+        },
+        "scenarios": results,
+    }
+    if not args.skip_import_check:
+        startup = import_time.measure(runs=args.import_runs)
+        startup["budget_ms"] = args.import_budget_ms
+        startup["problems"] = import_time.check(startup, args.import_budget_ms)
+        report["startup"] = startup
+    return report
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="QAFlow-AI in-process benchmark suite")
+    parser.add_argument("--scenarios", default=",".join(scenarios.SCENARIOS))
+    parser.add_argument("--projects", type=int, default=1)
+    parser.add_argument("--modules", type=int, default=5, help="modules per project")
+    parser.add_argument("--cases", type=int, default=200, help="cases per module")
+    parser.add_argument("--uploads", type=int, default=5)
+    parser.add_argument("--doc-sections", type=int, default=10)
+    parser.add_argument("--cases-per-doc", type=int, default=30)
+    parser.add_argument("--fail-every", type=int, default=10, help="fail every Nth case in test_through_module")
+    parser.add_argument("--max-clicks", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--ai-latency", type=float, default=0.0, help="seconds per fake AI call")
+    parser.add_argument("--ai-jitter", type=float, default=0.0)
+    parser.add_argument("--ai-error-rate", type=float, default=0.0, help="probability of an injected 429")
+    parser.add_argument("--ai-malformed-rate", type=float, default=0.0,
+                        help="probability that a generated answer is cut off (exercises partial repair)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="run against this (empty) database instead of a temp SQLite file, "
+                                               "e.g. postgresql://localhost/qaflow_bench")
+    parser.add_argument("--skip-import-check", action="store_true", help="skip the cold-import budget check")
+    parser.add_argument("--import-runs", type=int, default=3)
+    parser.add_argument("--import-budget-ms", type=float, default=import_time.DEFAULT_BUDGET_MS)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    if report.get("startup", {}).get("problems"):
+        for problem in report["startup"]["problems"]:
+            print(f"❌ {problem}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Scripted user scenarios executed in-process against the FastAPI app.
+
+Every scenario receives a ``starlette.testclient.TestClient`` and a context
+dict (project layout, fake AI client, options) and records one timing sample
+per HTTP request through ``Recorder``.
+"""
+import concurrent.futures
+import statistics
+import time
+
+from benchmarks import datagen
+
+
+class Recorder:
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+        self.errors = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.finished = None
+        self.extra = {}
+
+    def call(self, fn, *args, expect=(200,), **kwargs):
+        t0 = time.perf_counter()
+        response = fn(*args, **kwargs)
+        self.samples.append(time.perf_counter() - t0)
+        self.bytes += len(response.content)
+        if response.status_code not in expect:
+            self.errors += 1
+        return response
+
+    def summary(self):
+        end = self.finished or time.perf_counter()
+        samples = sorted(self.samples)
+        if not samples:
+            return {"requests": 0, "errors": self.errors}
+
+        def pct(p):
+            return samples[min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))] * 1000
+
+        wall = end - self.started
+        return {
+            "requests": len(samples),
+            "errors": self.errors,
+            "wall_s": round(wall, 4),
+            "rps": round(len(samples) / wall, 2) if wall > 0 else None,
+            "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+            "p50_ms": round(pct(50), 3),
+            "p95_ms": round(pct(95), 3),
+            "p99_ms": round(pct(99), 3),
+            "max_ms": round(samples[-1] * 1000, 3),
+            "bytes": self.bytes,
+            **self.extra,
+        }
+
+
+def _first_project(ctx):
+    return next(iter(ctx["layout"]["projects"]))
+
+
+def upload(client, ctx, rec):
+    """Upload synthetic requirement docs; each one costs one AI generation call"""
+    project = _first_project(ctx)
+    for i in range(ctx["uploads"]):
+        title = f"Uploaded Module {i + 1}"
+        body = datagen.requirements_document(title, sections=ctx["doc_sections"], seed=ctx["seed"] + i)
+        rec.call(client.post, "/api/upload", data={"project": project},
+                 files={"file": (f"spec_{i}.txt", body.encode("utf-8"), "text/plain")})
+
+
+def test_through_module(client, ctx, rec):
+    """Walk one module click by click: every Nth case fails and gets a bug report"""
+    project = _first_project(ctx)
+    module = ctx["layout"]["projects"][project][0]
+    fail_every = ctx["fail_every"]
+    clicks = 0
+    while clicks < ctx["max_clicks"]:
+        res = rec.call(client.post, "/api/start-module", json={"module_name": module, "project": project})
+        data = res.json()
+        if data.get("finished") or "case" not in data or data["case"].get("is_retest"):
+            break
+        case = data["case"]
+        clicks += 1
+        if fail_every and clicks % fail_every == 0:
+            payload = {"case_id": case["id"], "status": "FAILED", "project": project,
+                       "failed_case_text": case["text"], "bug_description": "Кнопка не реагує"}
+        else:
+            payload = {"case_id": case["id"], "status": "Pass", "project": project}
+        rec.call(client.post, "/api/submit-result", json=payload)
+
+
+def search(client, ctx, rec):
+    project = _first_project(ctx)
+    for q in ctx["search_terms"] * ctx["repeat"]:
+        rec.call(client.get, "/api/search", params={"project": project, "q": q})
+
+
+def export(client, ctx, rec):
+    project = _first_project(ctx)
+    for _ in range(max(1, ctx["repeat"] // 5)):
+        rec.call(client.get, "/api/export/csv", params={"project": project})
+
+
+def stats_polling(client, ctx, rec):
+    """What app.js does on every dashboard refresh"""
+    project = _first_project(ctx)
+    for _ in range(ctx["repeat"]):
+        rec.call(client.get, "/api/stats", params={"project": project})
+        rec.call(client.get, "/api/modules", params={"project": project})
+        rec.call(client.get, "/api/bugs", params={"project": project})
+
+
+def stats_revalidate(client, ctx, rec):
+    """Same polling as stats_polling, but replaying ETags like a browser's HTTP cache does"""
+    project = _first_project(ctx)
+    etags = {}
+    for _ in range(ctx["repeat"]):
+        for path in ("/api/stats", "/api/modules", "/api/bugs"):
+            headers = {"If-None-Match": etags[path]} if path in etags else {}
+            res = rec.call(client.get, path, params={"project": project}, headers=headers, expect=(200, 304))
+            if res.headers.get("etag"):
+                etags[path] = res.headers["etag"]
+
+
+def browse_cases(client, ctx, rec):
+    """Page through the All Cases view"""
+    project = _first_project(ctx)
+    for page in range(1, ctx["repeat"] + 1):
+        rec.call(client.get, "/api/cases", params={"project": project, "page": page, "limit": 100})
+
+
+def ai_contention(client, ctx, rec):
+    """One project floods uploads while another files bug reports; times the bug reports.
+
+    Run with --projects 2 so the two sides are different projects.
+    """
+    import ai_scheduler
+    projects = list(ctx["layout"]["projects"])
+    noisy, quiet = projects[0], projects[-1]
+    module = ctx["layout"]["projects"][quiet][0]
+    fake = ctx["fake"]
+    saved_latency = fake.latency
+    fake.latency = max(saved_latency, 0.05)  # contention needs AI calls that take a while
+
+    def flood(i):
+        body = datagen.requirements_document(f"Flood Module {i + 1}", sections=ctx["doc_sections"], seed=i)
+        return client.post("/api/upload", data={"project": noisy},
+                           files={"file": (f"flood_{i}.txt", body.encode("utf-8"), "text/plain")})
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=ctx["uploads"] * 2) as pool:
+            burst = [pool.submit(flood, i) for i in range(ctx["uploads"] * 2)]
+            time.sleep(fake.latency)  # let the burst queue up first
+            for _ in range(ctx["uploads"]):
+                data = client.post("/api/start-module", json={"module_name": module, "project": quiet}).json()
+                if "case" not in data:
+                    break
+                case = data["case"]
+                rec.call(client.post, "/api/submit-result", json={
+                    "case_id": case["id"], "status": "FAILED", "project": quiet,
+                    "failed_case_text": case["text"], "bug_description": "Сторінка не завантажується"})
+            rec.extra["flood_errors"] = sum(f.result().status_code != 200 for f in burst)
+    finally:
+        fake.latency = saved_latency
+    rec.extra["scheduler"] = ai_scheduler.metrics()
+
+
+SCENARIOS = {
+    "upload": upload,
+    "test_through_module": test_through_module,
+    "search": search,
+    "export": export,
+    "stats_polling": stats_polling,
+    "stats_revalidate": stats_revalidate,
+    "browse_cases": browse_cases,
+    "ai_contention": ai_contention,
+}
@@ -0,0 +1,223 @@
+"""Clicks per second through a testing session: database per click vs the working set (sessions.py).
+
+Every tester thread walks its own module the way /api/start-module and
+/api/submit-result do, click after click: next case, then a result (every
+--fail-every-th one FAILED). Paths compared:
+
+    direct   -- utils.get_next_pending_case_by_module + utils.update_case_status:
+                a query and a commit per click, as before
+    session  -- sessions.next_case + sessions.record: served from memory,
+                journaled, written in batches by the flusher thread
+
+Per path the report gives clicks per second, click latency (p50/p95/max)
+and, for the session path, the flusher's batches. After the session path
+every status in the database is compared with what the testers recorded.
+
+The crash check runs a child process that records --crash-clicks results
+and dies with os._exit() before its flusher writes them; the parent then
+replays the child's journal (sessions.recover) and checks that every result
+made it to the database, once.
+
+Examples:
+    python -m benchmarks.sessions --output sessions.json
+    python -m benchmarks.sessions --testers 8 --cases 2000 --fsync
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import datagen
+
+ALL_PENDING = (("PENDING", 1.0),)
+
+
+def _reset(conn):
+    conn.execute("UPDATE test_cases SET status = 'PENDING', fail_count = 0, bug_report = NULL, bug_observation = NULL")
+    conn.commit()
+
+
+def _summary(latencies):
+    ordered = sorted(latencies)
+    return {"p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+            "max_ms": round(ordered[-1] * 1000, 3)}
+
+
+def walk(path, project, modules, args):
+    """Every tester walks one module to the end; returns the report and {case_id: status}"""
+    import sessions
+    import utils
+    if path == "direct":
+        next_case = lambda module: utils.get_next_pending_case_by_module(module, project)
+        record = lambda case_id, status: utils.update_case_status(case_id, status)
+    else:
+        next_case = lambda module: sessions.next_case(project, module)
+        record = lambda case_id, status: sessions.record(project, case_id, status)
+    latencies, recorded = [], {}
+    lock = threading.Lock()
+
+    def tester(module, seed):
+        rng = random.Random(seed)
+        own_latencies, own = [], {}
+        while True:
+            started = time.perf_counter()
+            case = next_case(module)
+            if case is None or case["status"] != "PENDING":
+                break
+            status = "FAILED" if args.fail_every and rng.randrange(args.fail_every) == 0 else "Pass"
+            record(case["id"], status)
+            own_latencies.append(time.perf_counter() - started)
+            own[case["id"]] = status
+        with lock:
+            latencies.extend(own_latencies)
+            recorded.update(own)
+
+    threads = [threading.Thread(target=tester, args=(module, args.seed + i)) for i, module in enumerate(modules)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    report = {"clicks": len(latencies), "seconds": round(seconds, 3),
+              "clicks_per_second": round(len(latencies) / seconds, 1), "click": _summary(latencies)}
+    if path == "session":
+        flush_started = time.perf_counter()
+        sessions.flush()
+        report["final_flush_ms"] = round((time.perf_counter() - flush_started) * 1000, 2)
+        status = sessions.status()
+        report["flusher"] = {key: status[key] for key in ("flushes", "flushed", "flush_errors", "last_flush_ms")}
+    return report, recorded
+
+
+def _statuses(conn, case_ids):
+    statuses = {}
+    ids = list(case_ids)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        rows = conn.execute(f"SELECT id, status FROM test_cases WHERE id IN ({','.join(['?'] * len(chunk))})", chunk)
+        statuses.update((row[0], row[1]) for row in rows)
+    return statuses
+
+
+def crash_child(args):
+    """Child process of the crash check: record results, then die before they are written"""
+    import sessions
+    import utils
+    utils.configure_database(args.database)
+    sessions.FLUSH_INTERVAL = 3600  # the flusher never gets to them
+    sessions.FLUSH_BATCH = 10 ** 9
+    module = args.module
+    recorded = {}
+    while len(recorded) < args.crash_clicks:
+        case = sessions.next_case(args.project, module)
+        if case is None or case["status"] != "PENDING":
+            break
+        status = "FAILED" if len(recorded) % 3 == 0 else "Pass"
+        sessions.record(args.project, case["id"], status)
+        recorded[case["id"]] = status
+    print(json.dumps(recorded), flush=True)
+    os._exit(1)
+
+
+def crash_check(db_path, project, module, args):
+    import sessions
+    import utils
+    child = subprocess.run(
+        [sys.executable, "-m", "benchmarks.sessions", "--crash-child", "--database", db_path,
+         "--project", project, "--module", module, "--crash-clicks", str(args.crash_clicks)],
+        capture_output=True, text=True, env=os.environ.copy())
+    recorded = {int(k): v for k, v in json.loads(child.stdout.strip().splitlines()[-1]).items()}
+    conn = utils.get_db_connection()
+    before = _statuses(conn, recorded)
+    conn.close()
+    replayed = sessions.recover()
+    again = sessions.recover(min_age=0)
+    conn = utils.get_db_connection()
+    after = _statuses(conn, recorded)
+    fail_counts = dict(conn.execute(
+        f"SELECT id, fail_count FROM test_cases WHERE id IN ({','.join(['?'] * len(recorded))})",
+        list(recorded)).fetchall()) if recorded else {}
+    conn.close()
+    return {
+        "child_exit_code": child.returncode,
+        "recorded": len(recorded),
+        "in_database_before_replay": sum(1 for k, v in recorded.items() if before.get(k) == v),
+        "replayed": replayed,
+        "replayed_again": again,
+        "in_database_after_replay": sum(1 for k, v in recorded.items() if after.get(k) == v),
+        "fail_count_wrong": sum(1 for k, v in recorded.items() if fail_counts.get(k) != int(v == "FAILED")),
+    }
+
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix="qaflow_sessions_")
+    db_path = os.path.join(work_dir, "bench.db")
+    os.environ["QAFLOW_SESSION_JOURNAL_DIR"] = os.path.join(work_dir, "journal")
+    os.environ["QAFLOW_SESSION_FSYNC"] = "on" if args.fsync else "off"
+    layout = datagen.populate(db_path, projects=1, modules_per_project=args.testers + 1,
+                              cases_per_module=args.cases, seed=args.seed, status_mix=ALL_PENDING)
+    project, modules = next(iter(layout["projects"].items()))
+    import sessions
+    import utils
+    paths = {}
+    for path in args.paths.split(","):
+        conn = utils.get_db_connection()
+        _reset(conn)
+        conn.close()
+        sessions.invalidate()
+        report, recorded = walk(path, project, modules[:args.testers], args)
+        conn = utils.get_db_connection()
+        stored = _statuses(conn, recorded)
+        conn.close()
+        report["statuses_wrong"] = sum(1 for k, v in recorded.items() if stored.get(k) != v)
+        paths[path] = report
+    if "direct" in paths and "session" in paths:
+        paths["speedup"] = round(paths["session"]["clicks_per_second"] / paths["direct"]["clicks_per_second"], 2)
+    crash = crash_check(db_path, project, modules[-1], args) if args.crash_clicks else None
+    utils.get_backend().dispose()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return {"params": vars(args), "cases": args.cases * args.testers, "paths": paths, "crash": crash}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Clicks per second: database per click vs session working set")
+    parser.add_argument("--testers", type=int, default=4, help="concurrent testers, one module each")
+    parser.add_argument("--cases", type=int, default=1000, help="cases per module")
+    parser.add_argument("--fail-every", type=int, default=10, help="about one result in N is FAILED")
+    parser.add_argument("--paths", default="direct,session")
+    parser.add_argument("--fsync", action="store_true", help="QAFLOW_SESSION_FSYNC=on for the session path")
+    parser.add_argument("--crash-clicks", type=int, default=200, help="results in the crash check (0: skip it)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    # Used by the crash check to start its child process
+    parser.add_argument("--crash-child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--database", help=argparse.SUPPRESS)
+    parser.add_argument("--project", help=argparse.SUPPRESS)
+    parser.add_argument("--module", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.crash_child:
+        crash_child(args)
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
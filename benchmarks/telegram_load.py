@@ -0,0 +1,184 @@
+"""Many Telegram chats at once, against the fake Bot API, with and without telegram_outbox.
+
+Every simulated chat goes through what bot.py does for a user:
+
+    upload  -- a status message and its series of edits while the document
+               is read and the AI works (handle_document)
+    testing -- --cases rounds of: next case sent, marked passed (send_next_case,
+               process_pass)
+    bug     -- a status message edited twice, then the case marked failed
+               (process_bug_desc)
+
+``direct`` calls the Bot API the way the handlers used to: every call is
+awaited, and a 429 makes the handler sleep retry_after and try again (the best
+a handler can do on its own). ``outbox`` sends everything through
+telegram_outbox.Outbox; handlers wait only for the messages they need the id
+of. Per mode the report gives the time until every chat's messages show their
+final text, how long handlers were busy (p50/p95), the Bot API calls made,
+the 429s received and the edits the outbox coalesced. It also checks every
+message ends with the text the handler set last.
+
+Examples:
+    python -m benchmarks.telegram_load --output telegram.json
+    python -m benchmarks.telegram_load --chats 200 --mode outbox --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+
+import telegram_outbox
+from benchmarks.fake_telegram import FakeTelegramServer
+
+
+class DirectSender:
+    """Straight Bot API calls, awaited one by one; sleeps through 429s"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.stalled_s = 0.0
+
+    async def _call(self, method, **kwargs):
+        while True:
+            try:
+                return await getattr(self.bot, method)(**kwargs)
+            except TelegramRetryAfter as e:
+                self.stalled_s += e.retry_after
+                await asyncio.sleep(e.retry_after)
+
+    async def send(self, chat_id, text):
+        return await self._call("send_message", chat_id=chat_id, text=text)
+
+    async def edit(self, chat_id, message_id, text):
+        await self._call("edit_message_text", chat_id=chat_id, message_id=message_id, text=text)
+
+
+class OutboxSender:
+    def __init__(self, bot, args):
+        self.outbox = telegram_outbox.Outbox(
+            bot, global_rate=telegram_outbox.parse_rate(args.global_rate),
+            chat_rate=telegram_outbox.parse_rate(args.chat_rate))
+
+    async def send(self, chat_id, text):
+        return await self.outbox.send_message(chat_id, text)
+
+    async def edit(self, chat_id, message_id, text):
+        self.outbox.edit_message_text(chat_id, message_id, text)
+
+
+async def chat_session(sender, chat_id, args, rng, expected, busy):
+    await asyncio.sleep(rng.random() * args.spread)
+
+    # handle_document
+    t0 = time.perf_counter()
+    status = await sender.send(chat_id, "⏳ Ініціалізація обробки файлу...")
+    for step in ("📖 Зчитування вмісту документу...", "🧠 AI аналізує бізнес-логіку...",
+                 "📝 Синхронізація з таблицею"):
+        await sender.edit(chat_id, status.message_id, step)
+        await asyncio.sleep(args.work)
+    final = f"✅ Модуль chat {chat_id} додано до черги"
+    await sender.edit(chat_id, status.message_id, final)
+    expected[(chat_id, status.message_id)] = final
+    busy.append(time.perf_counter() - t0)
+
+    # send_next_case / process_pass
+    for i in range(args.cases):
+        await asyncio.sleep(args.think)
+        t0 = time.perf_counter()
+        case = await sender.send(chat_id, f"🆔 Case #{i + 1}\n🔸 Кроки: ...")
+        busy.append(time.perf_counter() - t0)
+        await asyncio.sleep(args.think)
+        t0 = time.perf_counter()
+        passed = f"Case #{i + 1}\n\n✅ Passed"
+        await sender.edit(chat_id, case.message_id, passed)
+        expected[(chat_id, case.message_id)] = passed
+        busy.append(time.perf_counter() - t0)
+
+    # process_bug_desc
+    await asyncio.sleep(args.think)
+    t0 = time.perf_counter()
+    status = await sender.send(chat_id, "⏳ Генерація Bug Report (English)...")
+    await asyncio.sleep(args.work)
+    await sender.edit(chat_id, status.message_id, "📝 Збереження звіту в базу даних...")
+    report = f"🐛 Bug Report Created: chat {chat_id}"
+    await sender.edit(chat_id, status.message_id, report)
+    expected[(chat_id, status.message_id)] = report
+    busy.append(time.perf_counter() - t0)
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 1) if values else None
+
+
+async def run_mode(mode, args):
+    server = await FakeTelegramServer(latency=args.latency, global_rate=args.global_rate,
+                                      chat_rate=args.chat_rate).start()
+    bot = server.bot()
+    sender = DirectSender(bot) if mode == "direct" else OutboxSender(bot, args)
+    rng = random.Random(args.seed)
+    expected, busy = {}, []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(chat_session(sender, 1000 + i, args, rng, expected, busy) for i in range(args.chats)))
+    handlers_s = time.perf_counter() - t0
+    if mode == "outbox":
+        await sender.outbox.drain()
+    wall = time.perf_counter() - t0
+    wrong = sum(1 for key, text in expected.items() if server.messages.get(key) != text)
+    report = {
+        "wall_s": round(wall, 2),
+        "handlers_done_s": round(handlers_s, 2),
+        "handler_busy_p50_ms": _percentile(busy, 0.5),
+        "handler_busy_p95_ms": _percentile(busy, 0.95),
+        "api_calls": server.stats["calls"],
+        "flood_429": server.stats["flood_429"],
+        "messages_wrong_final_text": wrong,
+    }
+    if mode == "direct":
+        report["stalled_s"] = round(sender.stalled_s, 1)
+    else:
+        report["outbox"] = sender.outbox.status()
+    await bot.session.close()
+    await server.stop()
+    return report
+
+
+async def run(args):
+    modes = ("direct", "outbox") if args.mode == "both" else (args.mode,)
+    return {"params": vars(args), "modes": {mode: await run_mode(mode, args) for mode in modes}}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Concurrent Telegram chats against a fake Bot API")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--cases", type=int, default=3, help="cases tested per chat")
+    parser.add_argument("--mode", choices=("direct", "outbox", "both"), default="both")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per fake Bot API call")
+    parser.add_argument("--work", type=float, default=0.05, help="seconds between status edits")
+    parser.add_argument("--think", type=float, default=0.3, help="seconds a tester spends per step")
+    parser.add_argument("--spread", type=float, default=1.0, help="chats start within this many seconds")
+    parser.add_argument("--global-rate", default="30/1:30", help="limit of the fake server and the outbox")
+    parser.add_argument("--chat-rate", default="1/1:3")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,12 @@ from aiogram.fsm.state import State, StatesGroup
 from dotenv import load_dotenv
 
 import ai_helper
+import ai_scheduler
+import bug_reports
+import case_priority
 import utils
+import prompt_budget
+import telegram_outbox
 
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
@@ -30,6 +35,8 @@ bot = Bot(token=TOKEN)
 dp = Dispatcher()
 router = Router()
 dp.include_router(router)
+# Усі повідомлення та редагування йдуть через чергу з лімітами Telegram (див. telegram_outbox.py)
+outbox = telegram_outbox.Outbox(bot)
 
 
 # --- UI ELEMENTS (KEYBOARDS) ---
@@ -79,7 +86,8 @@ def get_test_keyboard(row_number):
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext):
     await state.clear()
-    await message.answer(
+    outbox.answer(
+        message,
         "👋 **Вітаю в QAFlow AI!**\n\n"
         "Я ваш інтелектуальний асистент для автоматизації ручного тестування.\n"
         "Я допоможу перетворити документацію на структуровані чек-листи та згенерувати баг-репорти.\n\n"
@@ -91,19 +99,20 @@ async def cmd_start(message: Message, state: FSMContext):
 @router.message(F.text == "🔙 Повернутися в меню")
 async def go_back(message: Message, state: FSMContext):
     await state.clear()
-    await message.answer("🏠 Ви повернулися до головного меню.", reply_markup=get_main_keyboard())
+    outbox.answer(message, "🏠 Ви повернулися до головного меню.", reply_markup=get_main_keyboard())
 
 
 @router.message(F.text == "🚀 Розпочати сесію тестування")
 async def start_flow(message: Message, state: FSMContext):
-    status_msg = await message.answer("⏳ Перевірка статусу завдань...", reply_markup=get_back_keyboard())
+    status_msg = await outbox.answer(message, "⏳ Перевірка статусу завдань...", reply_markup=get_back_keyboard())
 
     pending_modules_dict = utils.get_unique_pending_modules()
 
-    await status_msg.delete()
+    outbox.delete_message(status_msg.chat.id, status_msg.message_id)
 
     if pending_modules_dict:
-        await message.answer(
+        outbox.answer(
+            message,
             f"🔎 **Знайдено активні завдання.**\n"
             f"Кількість модулів у роботі: {len(pending_modules_dict)}.\n\n"
             "Бажаєте продовжити або завантажити нові вимоги?",
@@ -111,7 +120,8 @@ async def start_flow(message: Message, state: FSMContext):
         )
         await state.set_state(TestSession.choosing_action)
     else:
-        await message.answer(
+        outbox.answer(
+            message,
             "✅ **Всі заплановані тести виконано.**\n\n"
             "Будь ласка, завантажте файл з вимогами (.docx, .doc, .txt), щоб створити новий набір тестів.",
             reply_markup=get_back_keyboard()
@@ -121,21 +131,21 @@ async def start_flow(message: Message, state: FSMContext):
 
 @router.callback_query(TestSession.choosing_action, F.data == "action_upload")
 async def action_upload(callback: CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("📤 **Завантажте документ з вимогами.**\nПідтримуються формати: .docx, .doc, .txt")
+    outbox.edit(callback.message, "📤 **Завантажте документ з вимогами.**\nПідтримуються формати: .docx, .doc, .txt")
     await state.set_state(TestSession.waiting_for_doc)
 
 
 @router.callback_query(TestSession.choosing_action, F.data == "action_continue")
 async def action_continue(callback: CallbackQuery, state: FSMContext):
     modules_dict = utils.get_unique_pending_modules()
-    await callback.message.edit_text("📂 **Оберіть модуль для тестування:**",
-                                     reply_markup=get_modules_keyboard(modules_dict))
+    outbox.edit(callback.message, "📂 **Оберіть модуль для тестування:**",
+                reply_markup=get_modules_keyboard(modules_dict))
     await state.set_state(TestSession.selecting_module)
 
 
 @router.message(TestSession.waiting_for_doc, F.document)
 async def handle_document(message: Message, state: FSMContext):
-    status_msg = await message.answer("⏳ **Ініціалізація обробки файлу...**")
+    status_msg = await outbox.answer(message, "⏳ **Ініціалізація обробки файлу...**")
 
     file_id = message.document.file_id
     file_name = message.document.file_name
@@ -144,7 +154,8 @@ async def handle_document(message: Message, state: FSMContext):
     await bot.download_file(file.file_path, file_path)
 
     try:
-        await status_msg.edit_text("📖 **Зчитування вмісту документу...**")
+        # Проміжні статуси не чекаємо: якщо черга зайнята, піде лише останній
+        outbox.edit(status_msg, "📖 **Зчитування вмісту документу...**")
 
         if file_path.endswith('.docx'):
             text = utils.read_docx(file_path)
@@ -153,32 +164,37 @@ async def handle_document(message: Message, state: FSMContext):
         else:
             text = utils.read_txt(file_path)
 
-        await status_msg.edit_text("🧠 **AI аналізує бізнес-логіку та формує сценарії...**")
+        text, _ = prompt_budget.prepare(text)
 
-        module_name, cases = ai_helper.generate_test_cases(text)
+        outbox.edit(status_msg, "🧠 **AI аналізує бізнес-логіку та формує сценарії...**")
+
+        module_name, cases = await ai_scheduler.run("telegram", "generation", ai_helper.generate_test_cases, text)
 
         if module_name is None:
-            await status_msg.edit_text("❌ Помилка сервісу AI. Спробуйте пізніше або перевірте файл.")
+            outbox.edit(status_msg, "❌ Помилка сервісу AI. Спробуйте пізніше або перевірте файл.")
             return
 
         if not cases:
-            await status_msg.edit_text("⚠️ Не вдалося виділити тест-кейси. Перевірте, чи містить файл чіткі вимоги.")
+            outbox.edit(status_msg, "⚠️ Не вдалося виділити тест-кейси. Перевірте, чи містить файл чіткі вимоги.")
             return
 
-        await status_msg.edit_text(
+        outbox.edit(
+            status_msg,
             f"📝 **Синхронізація з таблицею:**\n📦 Модуль: {module_name}\n🔢 Кількість кейсів: {len(cases)}")
 
-        utils.add_cases_to_sheet(cases, module_name)
+        utils.add_cases(cases, module_name)
+        await asyncio.to_thread(case_priority.rescore, modules=[module_name])
 
         modules_dict = utils.get_unique_pending_modules()
-        await status_msg.edit_text(
+        outbox.edit(
+            status_msg,
             f"✅ **Успішно!** Модуль '{module_name}' додано до черги.\n\nОберіть модуль для початку роботи:",
             reply_markup=get_modules_keyboard(modules_dict)
         )
         await state.set_state(TestSession.selecting_module)
 
     except Exception as e:
-        await status_msg.edit_text(f"❌ Системна помилка: {e}")
+        outbox.edit(status_msg, f"❌ Системна помилка: {e}")
     finally:
         if os.path.exists(file_path): os.remove(file_path)
 
@@ -188,42 +204,43 @@ async def handle_text_instead(message: Message, state: FSMContext):
     if message.text == "🔙 Повернутися в меню":
         await go_back(message, state)
         return
-    await message.answer("⚠️ Очікується файл документу, а не текст.\nНатисніть '🔙 Повернутися в меню' для скасування.")
+    outbox.answer(message, "⚠️ Очікується файл документу, а не текст.\nНатисніть '🔙 Повернутися в меню' для скасування.")
 
 
 @router.callback_query(TestSession.selecting_module, F.data == "action_upload")
 async def upload_more(callback: CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("📤 **Завантажте наступний файл.**")
+    outbox.edit(callback.message, "📤 **Завантажте наступний файл.**")
     await state.set_state(TestSession.waiting_for_doc)
 
 
 @router.callback_query(TestSession.selecting_module, F.data.startswith("mod_"))
 async def select_module(callback: CallbackQuery, state: FSMContext):
-    row_num = int(callback.data.split("_")[1])
-    module_name = utils.get_module_name_by_row(row_num)
+    # Кнопка модуля несе id його першого кейсу (get_unique_pending_modules)
+    case_id = int(callback.data.split("_")[1])
+    module_name = utils.get_module_name_by_case(case_id)
 
     if not module_name:
         await callback.answer("❌ Модуль не знайдено (актуалізуйте таблицю).", show_alert=True)
         return
 
     await state.update_data(current_module=module_name)
-    await callback.message.edit_text(f"🚀 **Запуск модуля:** {module_name}")
+    outbox.edit(callback.message, f"🚀 **Запуск модуля:** {module_name}")
     await state.set_state(TestSession.testing)
-    await send_next_case(callback.message, module_name)
+    await send_next_case(callback.message, module_name, state)
 
 
-async def send_next_case(message: Message, module_name):
+async def send_next_case(message: Message, module_name, state: FSMContext):
     case_data = utils.get_next_pending_case_by_module(module_name)
     if case_data:
         text = (
             f"📦 **{module_name}**\n"
-            f"🆔 **Case #{case_data['row']}**\n"
+            f"🆔 **Case #{case_data['id']}**\n"
             f"➖➖➖➖➖➖➖➖\n"
             f"🔸 {case_data['text']}"
         )
-        await message.answer(text, reply_markup=get_test_keyboard(case_data['row']))
+        outbox.answer(message, text, reply_markup=get_test_keyboard(case_data['id']))
     else:
-        await message.answer(f"🎉 **Модуль '{module_name}' успішно протестовано!**", reply_markup=get_main_keyboard())
+        outbox.answer(message, f"🎉 **Модуль '{module_name}' успішно протестовано!**", reply_markup=get_main_keyboard())
         await state.clear()
 
 
@@ -234,14 +251,14 @@ async def process_pass(callback: CallbackQuery, state: FSMContext):
         text_lines = callback.message.text.split('\n')
         case_text = text_lines[-1]
         utils.update_case_status(row_number, "Pass")
-        await callback.message.edit_text(f"~~{case_text}~~\n\n✅ **Passed**", reply_markup=None)
+        outbox.edit(callback.message, f"~~{case_text}~~\n\n✅ **Passed**", reply_markup=None)
     except Exception as e:
         print(f"❌ Error inside process_pass: {e}")
-        await callback.message.edit_reply_markup(reply_markup=None)
+        outbox.edit_message_reply_markup(callback.message.chat.id, callback.message.message_id, reply_markup=None)
 
     data = await state.get_data()
     module_name = data.get('current_module')
-    if module_name: await send_next_case(callback.message, module_name)
+    if module_name: await send_next_case(callback.message, module_name, state)
 
 
 @router.callback_query(F.data.startswith("fail_"))
@@ -251,7 +268,8 @@ async def process_fail(callback: CallbackQuery, state: FSMContext):
     case_text = text_lines[-1].replace("🔸 ", "")
 
     await state.update_data(failed_row=row_number, failed_case_text=case_text, msg_id=callback.message.message_id)
-    await callback.message.answer(
+    outbox.answer(
+        callback.message,
         "✍️ **Реєстрація дефекту**\n\n"
         "Опишіть фактичний результат (Actual Result) або деталі помилки.\n"
         "AI використає це для створення Bug Report.",
@@ -266,34 +284,37 @@ async def process_bug_desc(message: Message, state: FSMContext):
     user_desc = message.text
     data = await state.get_data()
 
-    status_msg = await message.answer("⏳ **Генерація Bug Report (English)...**")
-    bug_report = ai_helper.generate_bug_report(data['failed_case_text'], user_desc)
+    status_msg = await outbox.answer(message, "⏳ **Генерація Bug Report (English)...**")
+    bug_report = await bug_reports.report_for("telegram", data['failed_row'], data['failed_case_text'], user_desc)
 
-    await status_msg.edit_text("📝 **Збереження звіту в базу даних...**")
-    utils.update_case_status(data['failed_row'], "Failed", bug_report)
-    await status_msg.edit_text(f"🐛 **Bug Report Created:**\n{bug_report}")
+    outbox.edit(status_msg, "📝 **Збереження звіту в базу даних...**")
+    utils.update_case_status(data['failed_row'], "FAILED", bug_report, user_desc)
+    case_priority.schedule(module_name=data.get('current_module'))
+    outbox.edit(status_msg, f"🐛 **Bug Report Created:**\n{bug_report}")
 
-    try:
-        await bot.edit_message_text(f"~~{data['failed_case_text']}~~\n\n❌ **Failed**", chat_id=message.chat.id,
-                                    message_id=data['msg_id'], reply_markup=None)
-    except Exception as e:
-        print(f"❌ Error processing bug report msg update: {e}")
+    # Помилки (повідомлення видалене тощо) outbox логує сам
+    outbox.edit_message_text(message.chat.id, data['msg_id'], f"~~{data['failed_case_text']}~~\n\n❌ **Failed**",
+                             reply_markup=None)
 
     module_name = data.get('current_module')
     await state.set_state(TestSession.testing)
-    if module_name: await send_next_case(message, module_name)
+    if module_name: await send_next_case(message, module_name, state)
 
 
 @router.message()
 async def global_reset(message: Message, state: FSMContext):
     if await state.get_state() == TestSession.waiting_for_bug_desc: return
     await state.clear()
-    await message.answer("🏠 Скидання контексту. Головне меню.", reply_markup=get_main_keyboard())
+    outbox.answer(message, "🏠 Скидання контексту. Головне меню.", reply_markup=get_main_keyboard())
 
 
 async def main():
     print("🚀 QAFlow AI Bot is running...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Не губимо повідомлення, що ще в черзі
+        await outbox.drain(timeout=10)
 
 
 if __name__ == "__main__":
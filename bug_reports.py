@@ -0,0 +1,279 @@
+"""Bug report service: result cache, similar-report context, bulk regeneration.
+
+    report = await bug_reports.report_for(project, case_id, case_text, observation)
+
+- Cache: reports are stored per project under a hash of the normalized case
+  content and tester observation (and PROMPT_VERSION). The same failure
+  reported again, e.g. on a retest, is answered without a model call. Hand
+  edits (PUT /api/bugs) replace the cached text, so the next hit returns the
+  edited report.
+- Context: a per-project TF-IDF index over failed cases that already have a
+  report. The closest SIMILAR_LIMIT reports go into the prompt, which keeps
+  wording and severities consistent within a project.
+- Regeneration: start_module_regeneration() records a job and regenerates
+  every failed case of a module in a background thread; start_case_reports()
+  does the same for failures synced from offline sessions. Calls go through
+  ai_scheduler as bulk work, so testers' live bug reports still go first;
+  failures sharing the same case text and observation cost one call.
+"""
+import collections
+import concurrent.futures
+import hashlib
+import math
+import re
+import threading
+import time
+
+import ai_helper
+import ai_scheduler
+import utils
+
+# Bump when the bug report prompt changes: old cache entries stop matching
+PROMPT_VERSION = 1
+
+SIMILAR_LIMIT = 3
+SIMILAR_MIN_SCORE = 0.2
+# SimilarityIndex.closest: highest-weighted cases kept per term, and terms of the query used
+POSTINGS_LIMIT = 32
+QUERY_TERMS = 8
+# The index is rebuilt from the database at most this often; new reports are added in between
+INDEX_TTL_SECONDS = 60
+
+STATS = collections.Counter()
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _normalize(text):
+    return " ".join((text or "").split()).casefold()
+
+
+def cache_key(case_text, observation):
+    raw = f"{PROMPT_VERSION}\x00{_normalize(case_text)}\x00{_normalize(observation)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _terms(text):
+    # Cheap stemming: Ukrainian and English inflections mostly change the word ending
+    return [w[:6] for w in _WORD_RE.findall(text.casefold()) if len(w) > 2 and not w.isdigit()]
+
+
+def _document(content, observation, report):
+    # The observation is what distinguishes failures; old rows without one fall back to the report head
+    return f"{content or ''}\n{observation or (report or '')[:300]}"
+
+
+class SimilarityIndex:
+    """TF-IDF cosine similarity over one project's failed cases"""
+
+    def __init__(self, rows):
+        tfs = [(row["id"], collections.Counter(_terms(_document(row["content"], row["bug_observation"],
+                                                                  row["bug_report"]))), row["bug_report"])
+               for row in rows]
+        self._df = collections.Counter()
+        for _, tf, _ in tfs:
+            self._df.update(tf.keys())
+        self._n = len(tfs)
+        self._docs = {case_id: (self._vector(tf), report) for case_id, tf, report in tfs}
+        self._postings = None
+        self.built_at = time.monotonic()
+
+    def _vector(self, tf):
+        vec = {t: (1 + math.log(c)) * (math.log((1 + self._n) / (1 + self._df.get(t, 0))) + 1) for t, c in tf.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {t: v / norm for t, v in vec.items()}
+
+    def add(self, case_id, content, observation, report):
+        self._docs[case_id] = (self._vector(collections.Counter(_terms(_document(content, observation, report)))),
+                               report)
+        self._postings = None
+
+    def closest(self, content, postings_limit=POSTINGS_LIMIT, query_terms=QUERY_TERMS):
+        """Similarity of ``content`` to the closest indexed case (0.0: nothing in common).
+
+        Approximate, through an inverted index that keeps the ``postings_limit``
+        highest weights per term, looked up for the ``query_terms`` rarest terms
+        of ``content``: a case that shares just common words with many failures
+        is close to none of them, and scoring every pending case of a project
+        costs the same per case however many failures there are.
+        """
+        if self._postings is None:
+            postings = collections.defaultdict(list)
+            for case_id, (vec, _) in self._docs.items():
+                for t, w in vec.items():
+                    postings[t].append((w, case_id))
+            self._postings = {t: sorted(p, reverse=True)[:postings_limit] for t, p in postings.items()}
+        query = self._vector(collections.Counter(_terms(_document(content, None, None))))
+        scores = collections.defaultdict(float)
+        for t, w in sorted(query.items(), key=lambda item: -item[1])[:query_terms]:
+            for weight, case_id in self._postings.get(t, ()):
+                scores[case_id] += w * weight
+        return max(scores.values(), default=0.0)
+
+    def search(self, content, observation, limit=SIMILAR_LIMIT, exclude=None, min_score=SIMILAR_MIN_SCORE):
+        query = self._vector(collections.Counter(_terms(_document(content, observation, None))))
+        scored = []
+        for case_id, (vec, report) in self._docs.items():
+            if case_id == exclude:
+                continue
+            score = sum(w * vec.get(t, 0.0) for t, w in query.items())
+            if score >= min_score:
+                scored.append((score, case_id, report))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        # Identical reports (duplicated failures) add nothing as separate examples
+        unique = []
+        for _, _, report in scored:
+            if report not in unique:
+                unique.append(report)
+            if len(unique) == limit:
+                break
+        return unique
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_for(project_id):
+    with _indexes_lock:
+        index = _indexes.get(project_id)
+        if index is None or time.monotonic() - index.built_at > INDEX_TTL_SECONDS:
+            index = SimilarityIndex(utils.get_bug_corpus(project_id))
+            _indexes[project_id] = index
+        return index
+
+
+def similar_reports(project_id, content, observation, exclude=None):
+    return _index_for(project_id).search(content, observation, exclude=exclude)
+
+
+def _remember(project_id, key, case_id, content, observation, report):
+    utils.save_cached_bug_report(project_id, key, report)
+    with _indexes_lock:
+        index = _indexes.get(project_id)
+    if index is not None:
+        index.add(case_id, content, observation, report)
+
+
+async def report_for(project_name, case_id, case_text, observation):
+    """Bug report for a failed case: cached, or generated with similar past reports as context"""
+    case = utils.get_case_for_report(case_id)
+    if case is None:  # unknown case: nothing to cache against
+        STATS["uncached"] += 1
+        return await ai_scheduler.run(project_name, "bug_report", ai_helper.generate_bug_report,
+                                      case_text, observation)
+    project_id, content = case["project_id"], case["content"]
+    key = cache_key(content, observation)
+    cached = utils.get_cached_bug_report(project_id, key)
+    if cached:
+        STATS["hits"] += 1
+        return cached
+    STATS["misses"] += 1
+    similar = similar_reports(project_id, content, observation, exclude=case_id)
+    report = await ai_scheduler.run(project_name, "bug_report", ai_helper.generate_bug_report,
+                                    content, observation, similar)
+    _remember(project_id, key, case_id, content, observation, report)
+    return report
+
+
+def remember_edit(case_id, report):
+    """A hand-edited report replaces the cached one for the same failure"""
+    case = utils.get_case_for_report(case_id)
+    if case and case["bug_observation"]:
+        utils.save_cached_bug_report(case["project_id"], cache_key(case["content"], case["bug_observation"]), report)
+
+
+def stats():
+    return dict(STATS)
+
+
+# --- Bulk regeneration ---
+
+def start_module_regeneration(project_name, module_name, force=True):
+    """Start regenerating the reports of every failed case in a module.
+
+    force=False reuses cached reports where there are any. Returns the job
+    id (poll utils.get_job / GET /api/jobs/{id}), or None if the project
+    doesn't exist.
+    """
+    project_id = utils.get_project_id(project_name)
+    if project_id is None:
+        return None
+    cases = utils.get_failed_cases_for_module(project_id, module_name)
+    return _start_job(project_name, project_id, "regenerate_bug_reports", cases, force, module_name)
+
+
+def start_case_reports(project_name, case_ids):
+    """Background reports for failures recorded offline (synced via /api/results/batch).
+    Cached reports are reused. Returns the job id, or None if there is nothing to do."""
+    project_id = utils.get_project_id(project_name)
+    if project_id is None or not case_ids:
+        return None
+    cases = utils.get_cases_for_reports(project_id, case_ids)
+    return _start_job(project_name, project_id, "offline_bug_reports", cases, False,
+                      f"{len(cases)} offline failures")
+
+
+def _start_job(project_name, project_id, kind, cases, force, detail):
+    job_id = utils.create_job(project_id, kind, total=len(cases), detail=detail)
+    threading.Thread(target=_run_regeneration, args=(job_id, project_name, project_id, detail, cases, force),
+                     name=f"job-{job_id[:8]}", daemon=True).start()
+    return job_id
+
+
+def _run_regeneration(job_id, project_name, project_id, label, cases, force):
+    utils.update_job(job_id, status="running")
+    done = failed = skipped = 0
+    waiting = {}  # future -> (key, cases sharing that key)
+    by_key = {}
+    try:
+        for case in cases:
+            observation = case["bug_observation"]
+            if not observation:  # reported before observations were stored: nothing to regenerate from
+                skipped += 1
+                continue
+            key = cache_key(case["content"], observation)
+            if key in by_key:
+                by_key[key][1].append(case)
+                continue
+            if not force:
+                cached = utils.get_cached_bug_report(project_id, key)
+                if cached:
+                    STATS["hits"] += 1
+                    utils.update_bug_report_text(case["id"], cached)
+                    done += 1
+                    continue
+            similar = similar_reports(project_id, case["content"], observation, exclude=case["id"])
+            future = ai_scheduler.scheduler.submit(project_name, "generation", ai_helper.generate_bug_report,
+                                                   case["content"], observation, similar)
+            by_key[key] = (future, [case])
+            waiting[future] = key
+        utils.update_job(job_id, done=done)
+
+        error = None
+        for future in concurrent.futures.as_completed(waiting):
+            key = waiting[future]
+            group = by_key[key][1]
+            try:
+                report = future.result()
+            except Exception as e:
+                failed += len(group)
+                error = str(e)
+            else:
+                STATS["regenerated"] += 1
+                first = group[0]
+                _remember(project_id, key, first["id"], first["content"], first["bug_observation"], report)
+                for case in group:
+                    utils.update_bug_report_text(case["id"], report)
+                done += len(group)
+            utils.update_job(job_id, done=done, failed=failed)
+
+        detail = label
+        if skipped:
+            detail += f"; {skipped} without a stored observation skipped"
+        if error:
+            detail += f"; last error: {error}"
+        utils.update_job(job_id, status="failed" if failed and not done else "done", detail=detail,
+                         done=done, failed=failed)
+    except Exception as e:
+        utils.update_job(job_id, status="failed", detail=f"{label}; {e}", done=done, failed=failed)
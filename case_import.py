@@ -0,0 +1,376 @@
+"""Bulk import of existing test cases from CSV, XLSX and NDJSON files.
+
+    case_import.import_file("suite.csv", "Shop")        # also POST /api/import
+    python -m case_import suite.xlsx --project Shop --map module=Component
+
+For teams moving from another tool: their cases go straight into test_cases,
+no AI generation involved. The file is read a row at a time (csv, openpyxl in
+read-only mode, one JSON object per line), rows are validated in chunks of
+QAFLOW_IMPORT_CHUNK (1000) and every valid chunk is one transaction with one
+executemany (utils.import_case_rows). Memory stays the same whatever the
+size of the file: a few chunks in flight, the first MAX_ERRORS row errors and
+a count per module.
+
+Columns are found by their header (COLUMN_ALIASES, any case; our own CSV
+export is read as is) or mapped explicitly, {"module": "Component", ...}.
+Every row needs a module (column, or the default for a missing column or
+a blank cell) and steps: a "steps" column, one per line, with "expected
+result" next to it, or a "content" column in the format the app shows
+("Кроки: ... Очікуваний результат: ..."). Text goes through case_schema
+like the cases utils.add_cases stores, so imported cases render and search
+the same as generated ones. Status is PENDING, Pass or FAILED
+(STATUS_ALIASES: "passed", "untested", ...); empty is PENDING.
+
+Validation (pydantic) is the CPU-bound part. With QAFLOW_IMPORT_WORKERS > 0
+(default: CPU cores - 1, at most 4) chunks are validated in worker processes
+while the previous ones are written; files under INLINE_BYTES are validated
+in-process, where starting the workers would cost more than it saves.
+
+benchmarks/bulk_import.py measures rows per second on a 100k-row file.
+"""
+import argparse
+import collections
+import concurrent.futures
+import csv
+import json
+import multiprocessing
+import os
+import re
+import time
+
+import case_schema
+import utils
+
+CHUNK_ROWS = int(os.getenv("QAFLOW_IMPORT_CHUNK", "1000"))
+WORKERS = int(os.getenv("QAFLOW_IMPORT_WORKERS", str(max(0, min(4, (os.cpu_count() or 1) - 1)))))
+
+# Smaller files are validated in this process
+INLINE_BYTES = 2 * 1024 * 1024
+# Row errors kept for the report; the rest are only counted
+MAX_ERRORS = 1000
+# Longest cell csv accepts (its default, 128 KB, is short for a case with a bug report)
+MAX_FIELD_BYTES = 16 * 1024 * 1024
+SNIFF_BYTES = 64 * 1024
+
+FIELDS = ("project", "module", "content", "steps", "expected_result", "status", "bug_report")
+COLUMN_ALIASES = {
+    "project": ("project", "проєкт", "проект"),
+    "module": ("module", "component", "section", "suite", "folder", "feature", "модуль", "розділ"),
+    "content": ("content", "text", "test case", "case", "title", "description", "тест кейс", "кейс", "опис"),
+    "steps": ("steps", "test steps", "кроки"),
+    "expected_result": ("expected result", "expected", "очікуваний результат", "результат очікуваний"),
+    "status": ("status", "result", "state", "статус"),
+    "bug_report": ("bug report", "bug", "defect", "баг репорт", "баг"),
+}
+STATUS_ALIASES = {
+    "PENDING": ("pending", "", "untested", "not run", "not executed", "new", "todo", "to do", "retest",
+                "не виконано", "не пройдено ще"),
+    "Pass": ("pass", "passed", "ok", "success", "successful", "done", "пройдено", "успішно"),
+    "FAILED": ("fail", "failed", "failure", "broken", "провалено", "не пройдено", "помилка"),
+}
+_STATUSES = {alias: status for status, aliases in STATUS_ALIASES.items() for alias in aliases}
+_HEADER_SPACE_RE = re.compile(r"[\s_\-]+")
+
+
+def _header_key(name):
+    return _HEADER_SPACE_RE.sub(" ", str(name or "")).strip().casefold()
+
+
+def column_map(headers, mapping=None):
+    """{field: header} for the headers of a file; ``mapping`` ({field: header}) wins over the aliases"""
+    mapping = mapping or {}
+    by_key = {}
+    for header in headers:
+        by_key.setdefault(_header_key(header), header)
+    columns = {}
+    for field in FIELDS:
+        if field in mapping:
+            header = by_key.get(_header_key(mapping[field]))
+            if header is None:
+                raise ValueError(f"Column '{mapping[field]}' (for {field}) is not in the file")
+            columns[field] = header
+            continue
+        for alias in COLUMN_ALIASES[field]:
+            if alias in by_key:
+                columns[field] = by_key[alias]
+                break
+    return columns
+
+
+# --- Readers: (row number, {header: value}) one at a time; a str instead of the dict is that row's error ---
+
+def _encoding(path):
+    with open(path, "rb") as f:
+        sample = f.read(SNIFF_BYTES)
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A character cut in two at the end of the sample is still UTF-8
+        if e.start < len(sample) - 3:
+            return "cp1251"
+    return "utf-8-sig"
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        # NDJSON steps as an array
+        return "\n".join(map(str, value))
+    return str(value)
+
+
+def read_csv(path):
+    encoding = _encoding(path)
+    csv.field_size_limit(max(csv.field_size_limit(), MAX_FIELD_BYTES))
+    with open(path, encoding=encoding, newline="") as f:
+        sample = f.read(SNIFF_BYTES)
+        f.seek(0)
+        try:
+            # Excel in a Ukrainian locale saves with ';'
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        headers = next(reader, None)
+        if headers is None:
+            return
+        yield 1, headers
+        for number, values in enumerate(reader, start=2):
+            if any(values):
+                # Short rows still have every column, so the column map holds for all of them
+                yield number, dict(zip(headers, values + [""] * (len(headers) - len(values))))
+
+
+def read_xlsx(path):
+    import openpyxl  # only for XLSX imports
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = next(rows, None)
+        if headers is None:
+            return
+        headers = ["" if h is None else str(h) for h in headers]
+        yield 1, headers
+        for number, values in enumerate(rows, start=2):
+            if any(v not in (None, "") for v in values):
+                values = list(values) + [None] * (len(headers) - len(values))
+                yield number, {h: _cell(v) for h, v in zip(headers, values)}
+    finally:
+        workbook.close()
+
+
+def read_ndjson(path):
+    with open(path, encoding="utf-8-sig") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, f"not valid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield number, "not a JSON object"
+                continue
+            yield number, {k: _cell(v) for k, v in record.items()}
+
+
+READERS = {"csv": read_csv, "xlsx": read_xlsx, "ndjson": read_ndjson}
+EXTENSIONS = {".csv": "csv", ".tsv": "csv", ".txt": "csv", ".xlsx": "xlsx", ".xlsm": "xlsx",
+              ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+def file_format(filename):
+    fmt = EXTENSIONS.get(os.path.splitext(filename or "")[1].lower())
+    if fmt is None:
+        raise ValueError(f"Unsupported file type: {filename} (CSV, XLSX or NDJSON)")
+    return fmt
+
+
+# --- Validation (runs in worker processes) ---
+
+def validate_row(project, module, content, steps, expected_result, status, bug_report):
+    """A row as utils.import_case_rows stores it; ValueError says what is wrong with it"""
+    project, module = (project or "").strip(), (module or "").strip()
+    if not project:
+        raise ValueError("no project")
+    if not module:
+        raise ValueError("no module")
+    normalized = _STATUSES.get((status or "").strip().casefold())
+    if normalized is None:
+        raise ValueError(f"unknown status '{status}' (PENDING, Pass or FAILED)")
+    case = case_schema.split_text(steps or content or "")
+    if (expected_result or "").strip():
+        case["expected_result"] = expected_result
+    stored = case_schema.columns(case)
+    if stored is None:
+        raise ValueError("no steps")
+    return (project, module, *stored, normalized, (bug_report or "").strip() or None)
+
+
+def validate_chunk(rows):
+    """[(row number, project, module, content, steps, expected, status, bug report)] -> (valid rows, [(row, error)])"""
+    valid, errors = [], []
+    for number, *fields in rows:
+        try:
+            valid.append(validate_row(*fields))
+        except ValueError as e:
+            errors.append((number, str(e)))
+    return valid, errors
+
+
+def _validated(chunks, workers):
+    """validate_chunk() of every chunk, in order; up to 2 chunks per worker in flight"""
+    if not workers:
+        for rows, errors in chunks:
+            valid, invalid = validate_chunk(rows)
+            yield valid, sorted(errors + invalid)
+        return
+    # spawn: forking a process with the app's threads (pools, flushers) running isn't safe
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        in_flight = collections.deque()
+        for rows, errors in chunks:
+            in_flight.append((pool.submit(validate_chunk, rows), errors))
+            if len(in_flight) >= 2 * workers:
+                future, errors = in_flight.popleft()
+                valid, invalid = future.result()
+                yield valid, sorted(errors + invalid)
+        while in_flight:
+            future, errors = in_flight.popleft()
+            valid, invalid = future.result()
+            yield valid, sorted(errors + invalid)
+
+
+def _chunks(records, project, module, mapping, chunk_rows, only_project=False):
+    """(row number, record) -> chunks of ([row tuples for validate_chunk], [(row, reader error)])
+
+    A blank project or module cell takes the default, like a file without
+    that column. With ``only_project`` a row naming another project is an error.
+    """
+    columns_for = {}
+    rows, errors = [], []
+    for number, record in records:
+        if not isinstance(record, str):
+            keys = tuple(record)
+            if keys not in columns_for:
+                try:
+                    columns_for[keys] = column_map(keys, mapping)
+                except ValueError as e:
+                    # NDJSON: this object lacks a mapped key
+                    columns_for[keys] = str(e)
+            columns = columns_for[keys]
+            if isinstance(columns, str):
+                record = columns
+        if not isinstance(record, str):
+            row_project = (record.get(columns["project"]) or "").strip() if "project" in columns else ""
+            row_module = (record.get(columns["module"]) or "").strip() if "module" in columns else ""
+            if only_project and row_project and row_project != project:
+                record = f"project '{row_project}' is not the one being imported into ({project})"
+        if isinstance(record, str):
+            errors.append((number, record))
+        else:
+            rows.append((number, row_project or project, row_module or module,
+                         *(record.get(columns[field], "") if field in columns else "" for field in FIELDS[2:])))
+        if len(rows) + len(errors) >= chunk_rows:
+            yield rows, errors
+            rows, errors = [], []
+    if rows or errors:
+        yield rows, errors
+
+
+def import_file(path, project=None, module=None, mapping=None, fmt=None, dry_run=False, workers=None,
+                chunk_rows=None, only_project=False):
+    """Import the cases in ``path`` (CSV, XLSX or NDJSON by its extension, or ``fmt``).
+
+    ``project`` and ``module`` are used for rows without their own (no column
+    or a blank cell); ``mapping`` is {field: header} (FIELDS). With
+    ``only_project`` (POST /api/import) every row goes into ``project`` and
+    rows naming another project are row errors; otherwise (the CLI) a project
+    column may spread the file over several projects. With ``dry_run`` rows
+    are only validated.
+    Raises ValueError for a file that can't be imported at all (type,
+    header, mapping); row problems are in the report.
+    """
+    started = time.perf_counter()
+    fmt = fmt or file_format(path)
+    if fmt not in READERS:
+        raise ValueError(f"Unsupported import format: {fmt}")
+    if workers is None:
+        workers = WORKERS if os.path.getsize(path) >= INLINE_BYTES else 0
+    unknown = set(mapping or {}) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown import fields: {sorted(unknown)}; expected some of {list(FIELDS)}")
+    records = READERS[fmt](path)
+    if fmt != "ndjson":
+        # Tabular files: check the header once, before any row
+        _, headers = next(records, (None, []))
+        columns = column_map(headers, mapping)
+        if "content" not in columns and "steps" not in columns:
+            raise ValueError(f"No column with the cases (content or steps) among: {headers}")
+        if "module" not in columns and not module:
+            raise ValueError("No module column; choose the module to import into")
+        if "project" not in columns and not project:
+            raise ValueError("No project column; choose the project to import into")
+    if only_project and not project:
+        raise ValueError("Choose the project to import into")
+    rows = imported = failed = chunks = 0
+    errors = []
+    added = collections.Counter()
+    for valid, invalid in _validated(_chunks(records, project, module, mapping, chunk_rows or CHUNK_ROWS, only_project),
+                                   workers):
+        chunks += 1
+        rows += len(valid) + len(invalid)
+        failed += len(invalid)
+        errors.extend({"row": number, "error": error} for number, error in invalid[:MAX_ERRORS - len(errors)])
+        if valid and not dry_run:
+            added.update(utils.import_case_rows(valid))
+        imported += len(valid)
+    seconds = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "imported": imported,
+        "failed": failed,
+        "errors": errors,
+        "errors_truncated": failed > len(errors),
+        "modules": [{"project": p, "module": m, "cases": n} for (p, m), n in sorted(added.items())],
+        "dry_run": dry_run,
+        "chunks": chunks,
+        "workers": workers,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+    }
+
+
+def _mapping_arg(pairs):
+    mapping = {}
+    for pair in pairs or []:
+        field, sep, header = pair.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"--map expects field=Column, got '{pair}'")
+        mapping[field.strip()] = header.strip()
+    return mapping
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import existing test cases from CSV, XLSX or NDJSON")
+    parser.add_argument("file")
+    parser.add_argument("--project", help="project for rows without a project column")
+    parser.add_argument("--module", help="module for rows without a module column")
+    parser.add_argument("--map", action="append", metavar="FIELD=COLUMN",
+                        help=f"column of a field ({', '.join(FIELDS)}); repeatable")
+    parser.add_argument("--format", choices=sorted(READERS), help="default: from the file extension")
+    parser.add_argument("--dry-run", action="store_true", help="validate only")
+    parser.add_argument("--workers", type=int, help=f"validation processes (default {WORKERS}; 0: in-process)")
+    parser.add_argument("--database", help="SQLite path or URL (default: QAFLOW_DATABASE_URL / database.db)")
+    args = parser.parse_args(argv)
+    if args.database:
+        utils.configure_database(args.database)
+    utils.init_db()
+    report = import_file(args.file, args.project, args.module, _mapping_arg(args.map), args.format,
+                         args.dry_run, args.workers)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
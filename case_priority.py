@@ -0,0 +1,144 @@
+"""Risk-based case order: the cases most likely to fail are served first.
+
+    case_priority.rescore(project, ["Payments"])   # recompute pending cases now (None: every module)
+    case_priority.schedule(project, "Payments")    # same, RESCORE_DELAY_SECONDS from now; calls coalesce
+
+Cases used to come in id order, so a session spent its first hour on happy
+paths. Every PENDING case now has a priority in test_cases.priority (0..1,
+higher first):
+
+    W_MODULE  * failure rate of its module
+  + W_SIMILAR * similarity to the project's failed cases
+  + W_KEYWORD * negative-path wording (invalid, empty, validation, ...)
+
+- Module failure rate: cases that ever failed (test_cases.fail_count, kept
+  across retests) over cases run, live and archived modules of the same name
+  together, smoothed towards the project's rate so a module with two results
+  doesn't jump to 0 or 1.
+- Similarity: TF-IDF cosine to the closest case that ever failed
+  (bug_reports.SimilarityIndex), so a case that failed before and was reset
+  for a retest scores 1.0 on it.
+- Keywords: RISK_KEYWORDS stems, saturating at KEYWORDS_SATURATION matches.
+
+Scores are computed here and stored; get_next_pending_case_by_module reads
+the first (priority DESC, id) entry of an index and does no scoring. Uploads,
+retests and restores rescore their module right away, a new failure
+schedules a rescore of its module (its rate moved; that's where the tester
+is), and the maintenance "priorities" task rescores every project as a
+backstop: failures make similar cases in other modules riskier, and passes
+move failure rates too. A whole project costs about 0.3 ms per pending case.
+
+benchmarks/prioritization.py measures how much sooner failures are found.
+"""
+import collections
+import re
+import threading
+import time
+
+import bug_reports
+import utils
+
+W_MODULE = 0.4
+W_SIMILAR = 0.4
+W_KEYWORD = 0.2
+# Weight of the project's failure rate in a module's rate, in cases run
+PRIOR_RUNS = 5
+KEYWORDS_SATURATION = 2
+RESCORE_DELAY_SECONDS = 10
+
+RISK_KEYWORDS = re.compile(
+    r"\b(?:невалід|некорект|неправильн|неіснуюч|негатив|помилк|валідац|порожн|обов.язков|недопуст|заборон"
+    r"|граничн|перевищ|максимальн|мінімальн|спецсимвол|дубл|прострочен|без прав"
+    r"|invalid|incorrect|wrong|negative|error|empty|blank|required|mandatory|validat|boundar|exceed"
+    r"|maximum|minimum|special char|duplicat|unauthori|forbidden|expired|timeout)",
+    re.IGNORECASE)
+
+STATS = collections.Counter()
+
+# project -> [timer, modules to rescore (None: all)]
+_timers = {}
+_timers_lock = threading.Lock()
+
+
+def keyword_score(text):
+    hits = {match.casefold() for match in RISK_KEYWORDS.findall(text or "")}
+    return min(1.0, len(hits) / KEYWORDS_SATURATION)
+
+
+def module_rates(history):
+    """{module name: smoothed failure rate} from utils.get_failure_history()"""
+    run = sum(r for r, _ in history.values())
+    prior = sum(f for _, f in history.values()) / run if run else 0.0
+    return {name: (failed + PRIOR_RUNS * prior) / (runs + PRIOR_RUNS) for name, (runs, failed) in history.items()}
+
+
+def score(content, module_rate, index=None):
+    similarity = index.closest(content) if index is not None else 0.0
+    return round(W_MODULE * module_rate + W_SIMILAR * similarity + W_KEYWORD * keyword_score(content), 4)
+
+
+def rescore(project_name="togetherfun", modules=None):
+    """Recompute the priority of the PENDING cases of a project's ``modules`` (None: all of them).
+    Returns {"cases", "changed", "seconds"}, or None if there's no such project."""
+    started = time.perf_counter()
+    project_id = utils.get_project_id(project_name)
+    if project_id is None:
+        return None
+    rates = module_rates(utils.get_failure_history(project_id))
+    corpus = utils.get_failure_corpus(project_id)
+    index = bug_reports.SimilarityIndex(corpus) if corpus else None
+    cases = utils.get_cases_to_prioritize(project_id, modules)
+    scored = {}
+    changed = []
+    for case in cases:
+        # Re-uploaded and duplicated cases share their text: score it once
+        key = (case["module"], case["content"])
+        if key not in scored:
+            scored[key] = score(case["content"], rates.get(case["module"], 0.0), index)
+        if scored[key] != case["priority"]:
+            changed.append((scored[key], case["id"]))
+    if changed:
+        utils.save_case_priorities(project_id, changed)
+    STATS["rescored"] += 1
+    STATS["cases_changed"] += len(changed)
+    return {"cases": len(cases), "changed": len(changed), "seconds": round(time.perf_counter() - started, 3)}
+
+
+def _scheduled(project_name):
+    with _timers_lock:
+        _, modules = _timers.pop(project_name)
+    try:
+        rescore(project_name, None if modules is None else sorted(modules))
+    except Exception as e:
+        STATS["failed"] += 1
+        print(f"⚠️ Case priorities for '{project_name}' failed: {e}")
+
+
+def schedule(project_name="togetherfun", module_name=None):
+    """Rescore a module (None: the whole project) RESCORE_DELAY_SECONDS from now;
+    calls until then join that run"""
+    with _timers_lock:
+        pending = _timers.get(project_name)
+        if pending is not None:
+            STATS["coalesced"] += 1
+            if pending[1] is not None:
+                if module_name is None:
+                    pending[1] = None
+                else:
+                    pending[1].add(module_name)
+            return
+        timer = threading.Timer(RESCORE_DELAY_SECONDS, _scheduled, (project_name,))
+        timer.daemon = True
+        _timers[project_name] = [timer, None if module_name is None else {module_name}]
+    timer.start()
+
+
+def rescore_all():
+    """Every project; the maintenance backstop"""
+    results = [rescore(project["name"]) for project in utils.get_all_projects()]
+    return {"projects": len(results), "cases": sum(r["cases"] for r in results if r),
+            "changed": sum(r["changed"] for r in results if r)}
+
+
+def stats():
+    return dict(STATS)
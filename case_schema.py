@@ -0,0 +1,172 @@
+"""Typed test cases: the shape Gemini must answer in and what test_cases stores.
+
+    module_name, cases, dropped = case_schema.parse_batch(response, case_schema.SectionCaseBatch)
+
+ai_helper passes the batch model as ``response_schema``, so generation is
+constrained to it and the SDK hands back ``response.parsed``. parse_batch()
+is the one validation pass for whatever arrives: the parsed object, or else
+the raw text, parsed and validated in one go by pydantic. Only a response
+that doesn't validate as a whole (cut off at the output token limit, a stray
+fence, one broken case) goes through repair(): every complete, valid case is
+kept and the rest is counted as dropped. An upload loses a case or two
+instead of failing.
+
+A stored case has its steps (one per line) and expected result in their own
+columns; ``content`` is the rendered text that the UI, search, export and
+bug reports read (render()).
+"""
+import json
+import re
+from typing import List, get_args
+
+from pydantic import BaseModel, ValidationError, field_validator, model_validator
+
+STEPS_LABEL = "Кроки:"
+RESULT_LABEL = "Очікуваний результат:"
+
+# Bullets and numbering in front of a step; render() puts its own
+_STEP_PREFIX_RE = re.compile(r"^\s*(?:[•\-*–]|\d+[.)])\s+")
+_BR_RE = re.compile(r"\s*<br\s*/?>\s*", re.IGNORECASE)
+_RESULT_RE = re.compile(re.escape(RESULT_LABEL), re.IGNORECASE)
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+_MODULE_RE = re.compile(r'"module_name"\s*:\s*("(?:[^"\\]|\\.)*")')
+_CASES_RE = re.compile(r'"(?:cases|test_cases)"\s*:\s*\[')
+
+
+def split_text(text):
+    """Case text in the rendered format -> {"steps": [...], "expected_result": "..."}.
+
+    Also reads the older "Кроки: ... <br> Очікуваний результат: ..." rows and
+    single-line steps separated by semicolons.
+    """
+    if "<" in text:
+        text = _BR_RE.sub("\n", text)
+    parts = _RESULT_RE.split(text, maxsplit=1)
+    steps = parts[0].strip()
+    if steps.lower().startswith(STEPS_LABEL.lower()):
+        steps = steps[len(STEPS_LABEL):]
+    lines = steps.strip().split("\n")
+    if len(lines) == 1 and ";" in lines[0]:
+        lines = lines[0].split(";")
+    return {"steps": lines, "expected_result": parts[1].strip() if len(parts) > 1 else ""}
+
+
+class GeneratedCase(BaseModel):
+    steps: List[str]
+    expected_result: str
+
+    @model_validator(mode="before")
+    @classmethod
+    def _from_text(cls, value):
+        # Plain text: the Telegram bot, fixtures and other callers of utils.add_cases
+        return split_text(value) if isinstance(value, str) else value
+
+    @field_validator("steps")
+    @classmethod
+    def _clean_steps(cls, steps):
+        steps = [_STEP_PREFIX_RE.sub("", step).strip() for step in steps]
+        steps = [step for step in steps if step]
+        if not steps:
+            raise ValueError("a case needs at least one step")
+        return steps
+
+    @field_validator("expected_result")
+    @classmethod
+    def _strip(cls, value):
+        return value.strip()
+
+
+class SectionCase(GeneratedCase):
+    # Label of the requirements section the case verifies ("S1", ...)
+    section: str
+
+
+class CaseBatch(BaseModel):
+    module_name: str
+    cases: List[GeneratedCase]
+
+
+class SectionCaseBatch(BaseModel):
+    module_name: str
+    cases: List[SectionCase]
+
+
+def render(case):
+    steps = "\n".join(f"• {step}" for step in case.steps)
+    if not case.expected_result:
+        return f"{STEPS_LABEL}\n{steps}"
+    return f"{STEPS_LABEL}\n{steps}\n\n{RESULT_LABEL} {case.expected_result}"
+
+
+def coerce(value):
+    """A GeneratedCase from a model instance, dict or text; None if there's no usable step"""
+    if isinstance(value, GeneratedCase):
+        return value
+    try:
+        return GeneratedCase.model_validate(value)
+    except ValidationError:
+        return None
+
+
+def columns(value):
+    """(content, steps, expected_result) as test_cases stores a case given as for
+    coerce(); None if there's no usable step"""
+    case = coerce(value)
+    if case is None:
+        return None
+    return render(case), "\n".join(case.steps), case.expected_result
+
+
+def parse_batch(response, batch_model):
+    """Returns (module_name or None, [cases], number of cases dropped by repair)"""
+    parsed = getattr(response, "parsed", None)
+    if isinstance(parsed, batch_model):
+        return parsed.module_name.strip() or None, parsed.cases, 0
+    text = _FENCE_RE.sub("", response.text or "")
+    try:
+        batch = batch_model.model_validate_json(text)
+    except ValidationError:
+        return repair(text, batch_model)
+    return batch.module_name.strip() or None, batch.cases, 0
+
+
+def repair(text, batch_model):
+    """Salvages the valid cases of a response that doesn't validate as a whole"""
+    item_model = get_args(batch_model.model_fields["cases"].annotation)[0]
+    module_name = None
+    match = _MODULE_RE.search(text)
+    if match:
+        try:
+            module_name = json.loads(match.group(1)).strip() or None
+        except ValueError:
+            pass
+
+    match = _CASES_RE.search(text)
+    if match:
+        pos = match.end()
+    elif text.lstrip().startswith("["):
+        pos = text.index("[") + 1
+    else:
+        return module_name, [], 0
+
+    decoder = json.JSONDecoder()
+    cases, dropped = [], 0
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(text) or text[pos] == "]":
+            break
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            # Broken case: go on from the next one, if the response continues at all
+            dropped += 1
+            pos = text.find("{", pos + 1)
+            if pos < 0:
+                break
+            continue
+        try:
+            cases.append(item_model.model_validate(item))
+        except ValidationError:
+            dropped += 1
+    return module_name, cases, dropped
@@ -0,0 +1,203 @@
+"""Incremental test case generation for re-uploaded requirement documents.
+
+    module_name, result = await documents.ingest(project, filename, text, module=None)
+
+Every upload is stored as a new version of its module's document, split
+into sections. A section is a heading with its body; one longer than
+MAX_CHUNK_TOKENS is cut further into content-defined chunks (a chunk ends on a line
+whose hash hits the boundary condition, so an edit only moves the chunk it
+is in, not every boundary after it). Sections are keyed by a hash of their
+normalized text and each generated case remembers the key it was written for.
+
+On a re-upload only the sections whose key is new go to the model, with the
+titles of the unchanged ones as context. Cases of sections that disappeared
+are marked OBSOLETE: they drop out of the run and the stats, but their
+results and bug reports stay readable. A re-upload without changes costs no
+model call at all.
+
+The previous version is the module named in the ``module`` form field. An
+upload without one is a revision of the module last uploaded under the same
+file name only if at least MIN_REVISION_OVERLAP of that version's sections
+are still there (same text or same heading): "requirements.docx" is a common
+name, and a different spec under it must not mark a module's cases OBSOLETE.
+"document" in the result says which module was matched and how.
+"""
+import hashlib
+import re
+import zlib
+
+import ai_helper
+import ai_scheduler
+import prompt_budget
+import utils
+
+# Content-defined chunking of long sections (estimated tokens)
+MIN_CHUNK_TOKENS = 80
+MAX_CHUNK_TOKENS = 400
+# Past MIN_CHUNK_TOKENS, roughly one line in BOUNDARY_DIVISOR ends a chunk
+BOUNDARY_DIVISOR = 8
+
+# Cases asked for a whole module; a partial update asks for its share of this
+FULL_MODULE_CASES = 40
+MIN_TARGET_CASES = 3
+# Share of the previous version's sections an upload matched by file name must still have
+MIN_REVISION_OVERLAP = 0.5
+
+_HEADING_RE = re.compile(r"#{1,6}\s+(.+)")
+
+
+def _normalize(text):
+    return " ".join(text.split()).casefold()
+
+
+def _chunk(lines):
+    chunks, current, tokens = [], [], 0
+    for line in lines:
+        current.append(line)
+        tokens += prompt_budget.estimate_tokens(line) + 1
+        boundary = zlib.crc32(_normalize(line).encode("utf-8")) % BOUNDARY_DIVISOR == 0
+        if tokens >= MAX_CHUNK_TOKENS or (tokens >= MIN_CHUNK_TOKENS and boundary):
+            chunks.append(current)
+            current, tokens = [], 0
+    if current:
+        if chunks and tokens < MIN_CHUNK_TOKENS:
+            chunks[-1].extend(current)
+        else:
+            chunks.append(current)
+    return chunks
+
+
+def split_sections(text):
+    """Split requirements text into [{"key", "title", "text"}] in document order"""
+    groups = []
+    title, body = "", []
+    for line in text.split("\n"):
+        match = _HEADING_RE.fullmatch(line.strip())
+        if match:
+            if body or title:
+                groups.append((title, body))
+            title, body = match.group(1).strip(), []
+        elif line.strip():
+            body.append(line)
+    if body or title:
+        groups.append((title, body))
+
+    sections = []
+    seen = {}
+    for title, body in groups:
+        chunks = _chunk(body) or [[]]
+        for i, chunk in enumerate(chunks):
+            part_title = title if len(chunks) == 1 else f"{title} ({i + 1})".strip()
+            raw = f"{_normalize(title)}\n{_normalize(' '.join(chunk))}"
+            key = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+            # Identical sections (copy-pasted blocks) still need distinct keys
+            seen[key] = seen.get(key, 0) + 1
+            if seen[key] > 1:
+                key = f"{key}-{seen[key]}"
+            heading = f"# {title}\n" if title else ""
+            sections.append({"key": key, "title": part_title or "(untitled)", "text": heading + "\n".join(chunk)})
+    return sections
+
+
+def section_overlap(previous, sections):
+    """Share of the previous version's sections found in ``sections``, by key or heading"""
+    if not previous["sections"]:
+        return 0.0
+    keys = {s["key"] for s in sections}
+    titles = {_normalize(s["title"]) for s in sections if s["title"] != "(untitled)"}
+    kept = sum(1 for s in previous["sections"] if s["key"] in keys or _normalize(s["title"]) in titles)
+    return kept / len(previous["sections"])
+
+
+def _fit(sections, max_tokens):
+    # Whole sections only: what doesn't fit is left for the next upload
+    kept, used = [], 0
+    for section in sections:
+        cost = prompt_budget.estimate_tokens(section["text"]) + 5
+        if kept and used + cost > max_tokens:
+            break
+        kept.append(section)
+        used += cost
+    return kept
+
+
+async def ingest(project, filename, text, module=None):
+    """Generate cases for an uploaded document. Returns (module_name, result).
+
+    result: {"count", "cases", "document": {...}, "tokens": {...}} where
+    "document" says which version was stored and what changed, and
+    "tokens" is shaped like prompt_budget.prepare() stats.
+    """
+    compacted, stats = prompt_budget.compact(text)
+    sections = split_sections(compacted)
+    match = {"matched_module": None, "matched_by": None, "overlap": None}
+    if module:
+        previous = utils.get_latest_document(project, module_name=module)
+        if previous:
+            match.update(matched_module=module, matched_by="module")
+    else:
+        previous = utils.get_latest_document(project, filename=filename)
+        if previous:
+            overlap = round(section_overlap(previous, sections), 2)
+            match["overlap"] = overlap
+            if overlap >= MIN_REVISION_OVERLAP:
+                match.update(matched_module=previous["module"], matched_by="filename")
+            else:
+                # Same file name, different document: a new module
+                match["rejected_module"] = previous["module"]
+                previous = None
+    module_name = module or (previous["module"] if previous else None)
+
+    old_keys = {s["key"] for s in previous["sections"]} if previous else set()
+    new_keys = {s["key"] for s in sections}
+    changed = [s for s in sections if s["key"] not in old_keys]
+    removed = sorted(old_keys - new_keys)
+    unchanged = [s for s in sections if s["key"] in old_keys]
+
+    tokens_full = sum(prompt_budget.estimate_tokens(s["text"]) for s in sections)
+    sent = _fit(changed, prompt_budget.TOKEN_BUDGET)
+    tokens_sent = sum(prompt_budget.estimate_tokens(s["text"]) for s in sent)
+    stats.update(tokens_in=prompt_budget.estimate_tokens(text), tokens_out=tokens_sent,
+                 truncated=len(sent) < len(changed))
+    stats["tokens_saved"] = stats["tokens_in"] - tokens_sent
+    document = {
+        "previous_version": previous["version"] if previous else None,
+        "sections_total": len(sections),
+        "changed": len(changed),
+        "removed": len(removed),
+        "tokens_full": tokens_full,
+        "tokens_sent": tokens_sent,
+        **match,
+    }
+
+    if previous and not changed and not removed:
+        document.update(version=previous["version"], unchanged=True, obsoleted=0)
+        return previous["module"], {"count": 0, "cases": [], "document": document, "tokens": stats}
+
+    cases, keys = [], []
+    if sent:
+        labels = {f"S{i + 1}": s["key"] for i, s in enumerate(sent)}
+        target = None
+        if previous:
+            target = max(MIN_TARGET_CASES, round(FULL_MODULE_CASES * tokens_sent / max(tokens_full, 1)))
+        # Bulk work: queued behind bug reports, shared fairly with other projects by prompt size
+        module_name, generated = await ai_scheduler.run(
+            project, "generation", ai_helper.generate_section_cases,
+            [(label, s["text"]) for label, s in zip(labels, sent)],
+            module_name=module_name, context_titles=[s["title"] for s in unchanged], target_cases=target,
+            cost=max(1.0, tokens_sent / 1000))
+        for label, case in generated:
+            cases.append(case)
+            # A case without a usable label can only be tied to the section if there was one
+            keys.append(labels.get(label) or (sent[0]["key"] if len(sent) == 1 else None))
+    if not cases and (sent or not previous):
+        # Nothing usable came back (or the document is empty): store nothing
+        return module_name, {"count": 0, "cases": [], "document": document, "tokens": stats}
+
+    # Sections left out by the budget aren't recorded, so the next upload sends them again
+    sent_keys = {s["key"] for s in sent}
+    stored = [{"key": s["key"], "title": s["title"]} for s in sections if s["key"] in old_keys or s["key"] in sent_keys]
+    saved = utils.save_document_version(project, module_name, filename, compacted, stored,
+                                        cases, keys, obsolete_keys=removed)
+    document.update(version=saved["version"], unchanged=False, obsoleted=saved["obsoleted"])
+    return module_name, {"count": len(cases), "cases": cases, "document": document, "tokens": stats}
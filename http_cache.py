@@ -0,0 +1,307 @@
+"""HTTP caching and transfer helpers: ETags for project data, hashed static
+assets, response compression and fast JSON rendering."""
+import gzip
+import hashlib
+import os
+import zlib
+
+import anyio.to_thread
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+
+import profiling
+import utils
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson  # optional: pip install orjson
+except ImportError:
+    orjson = None
+
+STATIC_DIR = "static"
+
+# Response formats change on deploy while the data version doesn't, so the code itself is part of the ETag
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_CODE_SALT = hashlib.sha1("".join(
+    str(int(os.path.getmtime(os.path.join(_HERE, f)))) for f in ("main.py", "utils.py")
+    if os.path.exists(os.path.join(_HERE, f))
+).encode()).hexdigest()[:8]
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml",
+                      "application/manifest+json")
+MIN_COMPRESS_SIZE = 1024
+
+
+def accepted_encoding(accept_header):
+    """Best encoding we can produce for an Accept-Encoding header: 'br', 'gzip' or None"""
+    offered = set()
+    for part in (accept_header or "").split(","):
+        token, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        try:
+            q = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            q = 1.0
+        if q > 0:  # q=0 means "not acceptable"
+            offered.add(token.strip().lower())
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+
+# --- Fast JSON ---
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed.
+
+    Same output as JSONResponse (compact, UTF-8, non-ASCII kept as is), but several
+    times faster on the long Ukrainian/English case lists. Falls back to the stdlib.
+    """
+
+    def render(self, content):
+        with profiling.stage("render"):
+            if orjson is None:
+                return super().render(content)
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+# --- ETags for API reads ---
+
+def _etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    # Weak comparison: W/"x" and "x" are the same resource version
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return any((c[2:] if c.startswith("W/") else c) == bare for c in candidates)
+
+
+def project_etag(project_name):
+    info = utils.get_project_version(project_name)
+    if not info:
+        return None
+    project_id, version = info
+    return f'W/"{project_id}.{version}.{_CODE_SALT}"'
+
+
+def cached_json(request: Request, project_name, build):
+    """Return ``build()`` as JSON tagged with the project's data version.
+
+    If the client already has this version (If-None-Match) the body is never
+    built and a 304 is returned instead. ``no-cache`` makes browsers revalidate
+    on every fetch, which costs one tiny lookup on our side.
+    """
+    etag = project_etag(project_name)
+    if etag is None:
+        return FastJSONResponse(build())
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    content = build()
+    if isinstance(content, Response):
+        return content
+    return FastJSONResponse(content, headers=headers)
+
+
+# --- Hashed static assets ---
+
+_asset_hashes = {}
+
+
+def asset_version(name):
+    """Short content hash for /static/<name>, recomputed only when the file changes"""
+    path = os.path.join(STATIC_DIR, name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return "0"
+    cached = _asset_hashes.get(name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:10]
+    _asset_hashes[name] = (mtime, digest)
+    return digest
+
+
+def asset_url(name):
+    return f"/static/{name}?v={asset_version(name)}"
+
+
+# App shell the service worker precaches; the SW version is derived from these hashes
+SHELL_ASSETS = ("style.css", "offline.js", "app.js", "manifest.json", "favicon.png")
+
+
+def shell_version():
+    return hashlib.sha1("".join(asset_version(a) for a in SHELL_ASSETS).encode()).hexdigest()[:10]
+
+
+# --- Compressed static files ---
+
+class CompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves brotli/gzip-encoded text assets.
+
+    Compressed bodies are kept in memory keyed by path, mtime and encoding, so
+    each asset is compressed once per deploy. Requests carrying ``?v=<hash>``
+    (see ``asset_url``) are cached by the browser for a year.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._compressed = {}
+
+    def _compress(self, full_path, mtime, encoding):
+        key = (full_path, mtime, encoding)
+        body = self._compressed.get(key)
+        if body is None:
+            with open(full_path, "rb") as f:
+                raw = f.read()
+            body = brotli.compress(raw, quality=11) if encoding == "br" else gzip.compress(raw, 9, mtime=0)
+            self._compressed = {k: v for k, v in self._compressed.items() if k[0] != full_path}
+            self._compressed[key] = body
+        return body
+
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        immutable = b"v=" in scope.get("query_string", b"")
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable" if immutable else "no-cache"
+
+        full_path = getattr(response, "path", None)
+        if response.status_code != 200 or not full_path:
+            return response
+        media_type = response.media_type or ""
+        if not media_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        stat = os.stat(full_path)
+        if stat.st_size < MIN_COMPRESS_SIZE:
+            return response
+        encoding = accepted_encoding(Headers(scope=scope).get("accept-encoding"))
+        if not encoding:
+            return response
+
+        etag = response.headers.get("etag", "").strip('"') + f"-{encoding}"
+        headers = {
+            "ETag": f'"{etag}"',
+            "Cache-Control": response.headers["Cache-Control"],
+            "Content-Encoding": encoding,
+            "Vary": "Accept-Encoding",
+            "Last-Modified": response.headers.get("last-modified", ""),
+        }
+        if f'"{etag}"' in Headers(scope=scope).get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        body = self._compress(full_path, stat.st_mtime, encoding)
+        return Response(body, media_type=media_type, headers=headers)
+
+
+# --- Dynamic response compression ---
+
+class CompressionMiddleware:
+    """Compresses responses with brotli (if installed) or gzip.
+
+    Bodies smaller than ``minimum_size`` go out untouched, as do responses that
+    already carry a Content-Encoding (pre-compressed static files) and
+    non-text content types. Streaming responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size=MIN_COMPRESS_SIZE, gzip_level=6, brotli_quality=5,
+                 thread_minimum_size=256 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.thread_minimum_size = thread_minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = accepted_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressingResponder(self, encoding, send).run(scope, receive)
+
+
+class _CompressingResponder:
+    def __init__(self, config, encoding, send):
+        self.config = config
+        self.encoding = encoding
+        self.send = send
+        self.start_message = None
+        self.passthrough = False
+        self.compressor = None
+
+    async def run(self, scope, receive):
+        await self.config.app(scope, receive, self.on_message)
+
+    def _compress(self, body, final):
+        if self.compressor is None:
+            if self.encoding == "br":
+                self.compressor = brotli.Compressor(quality=self.config.brotli_quality)
+            else:
+                self.compressor = zlib.compressobj(self.config.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        if self.encoding == "br":
+            out = self.compressor.process(body)
+            return out + (self.compressor.finish() if final else self.compressor.flush())
+        out = self.compressor.compress(body)
+        return out + self.compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+    async def _compress_async(self, body, final):
+        # Big bodies would block the event loop for milliseconds
+        if len(body) >= self.config.thread_minimum_size:
+            return await anyio.to_thread.run_sync(self._compress, body, final)
+        return self._compress(body, final)
+
+    async def on_message(self, message):
+        kind = message["type"]
+        if kind == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+            self.passthrough = ("content-encoding" in headers or message["status"] in (204, 206, 304)
+                                or not media_type.startswith(COMPRESSIBLE_TYPES))
+            if self.passthrough:
+                await self.send(message)
+            else:
+                self.start_message = message  # held back until we know the body size
+            return
+
+        if kind != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body and len(body) < self.config.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            headers["Content-Encoding"] = self.encoding
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            body = await self._compress_async(body, final=not more_body)
+            if not more_body:
+                headers["Content-Length"] = str(len(body))
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        body = await self._compress_async(body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -1,24 +1,71 @@
 from fastapi import FastAPI, Depends, UploadFile, File, Form, Request, Query
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse
-import uvicorn
+from fastapi.responses import JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 import shutil
+import json
 import os
 import uuid
 import utils
+import admission
 import ai_helper
+import backup
+import ai_scheduler
+import bug_reports
+import case_import
+import case_priority
+import documents
+import http_cache
+import maintenance
+import profiling
+import sessions
 from pydantic import BaseModel
 from typing import Optional, List
 
-app = FastAPI()
+# Парсери документів і Gemini SDK завантажуються ліниво (див. utils.read_* та
+# ai_helper.get_client), тому імпорт цього модуля має лишатися дешевим.
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+_started = False
+
+def startup():
+    """One-time process initialisation: DB schema and connection warmup.
+
+    Called from the lifespan hook under uvicorn and explicitly from pa_wsgi,
+    because the WSGI adapter never sends ASGI lifespan events.
+    """
+    global _started
+    if _started:
+        return
+    utils.init_db()
+    utils.warmup()
+    maintenance.start()
+    # Results a crashed worker had journaled but not written yet
+    sessions.recover()
+    if not ai_helper.GEMINI_API_KEY:
+        print("⚠️ GEMINI_API_KEY is not set: AI endpoints will fail until it is configured")
+    _started = True
+
+@asynccontextmanager
+async def lifespan(app):
+    startup()
+    yield
 
-# Initialize DB on startup
-utils.init_db()
+app = FastAPI(lifespan=lifespan, default_response_class=http_cache.FastJSONResponse)
+
+# Case lists and bug reports are large text blobs: compress anything over 1 KB
+app.add_middleware(http_cache.CompressionMiddleware, minimum_size=1024)
+
+# Per-stage timings and the slow-request log (see profiling.py); outside compression so that counts too
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Rate limits and load shedding (see admission.py); added last so it runs first
+app.add_middleware(admission.AdmissionMiddleware)
+
+# Mount static files (gzip/brotli + long-lived caching for hashed URLs)
+app.mount("/static", http_cache.CompressedStaticFiles(directory="static"), name="static")
+templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = http_cache.asset_url
 
 class CaseStatusUpdate(BaseModel):
     case_id: int 
@@ -39,10 +86,23 @@ class BugDelete(BaseModel):
 # Batch Models
 class BatchDelete(BaseModel):
     case_ids: List[int]
+    project: Optional[str] = None  # when given, every id must belong to it
 
 class BatchUpdateStatus(BaseModel):
     case_ids: List[int]
     status: str
+    project: Optional[str] = None
+
+class CaseOperation(BaseModel):
+    op: str  # status | bug | delete | move
+    case_ids: List[int]
+    status: Optional[str] = None
+    bug_report: Optional[str] = None
+    module_name: Optional[str] = None
+
+class BatchOperations(BaseModel):
+    project: str
+    operations: List[CaseOperation]
 
 class DeleteAll(BaseModel):
     project: str
@@ -51,41 +111,129 @@ class ModuleRetest(BaseModel):
     project: str
     module_name: str
 
+class ModuleArchive(BaseModel):
+    project: str
+    module_name: str
+    force: bool = False  # archive even with PENDING cases left
+
+class ProjectArchive(BaseModel):
+    project: str
+    force: bool = False
+
+class ArchiveRestore(BaseModel):
+    project: str
+    archive_id: int
+
+class OfflineResult(BaseModel):
+    key: str  # idempotency key, generated once per result by the client
+    case_id: int
+    status: str  # Pass | FAILED
+    base_status: Optional[str] = None  # status of the case when it was downloaded
+    observation: Optional[str] = None  # tester's bug description for FAILED
+    recorded_at: Optional[float] = None  # client clock, ms
+
+class OfflineResults(BaseModel):
+    project: str
+    results: List[OfflineResult]
+
+class MaintenanceRun(BaseModel):
+    tasks: Optional[List[str]] = None  # default: optimize, vacuum
+
+class ModuleRegenerate(BaseModel):
+    project: str
+    module_name: str
+    force: bool = True  # False: reuse cached reports where possible
+
 @app.get("/")
 async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templates.TemplateResponse(request, "index.html", {"request": request})
+
+@app.get("/sw.js")
+async def service_worker():
+    """Served from the root so the worker's scope covers the whole app.
+    The shell asset hashes are stamped in, so any asset change installs a new worker."""
+    with open(os.path.join("static", "sw.js"), encoding="utf-8") as f:
+        script = f.read()
+    assets = ",\n    ".join(f"'{http_cache.asset_url(name)}'" for name in http_cache.SHELL_ASSETS)
+    script = script.replace("'__SHELL_VERSION__'", f"'{http_cache.shell_version()}'")
+    script = script.replace("/* __SHELL_ASSETS__ */", assets)
+    return Response(script, media_type="application/javascript", headers={"Cache-Control": "no-cache"})
 
 @app.post("/api/upload")
-async def upload_file(project: str = Form(...), file: UploadFile = File(...)):
+async def upload_file(project: str = Form(...), file: UploadFile = File(...), module: Optional[str] = Form(None)):
     temp_filename = f"temp_{uuid.uuid4()}_{file.filename}"
     try:
         with open(temp_filename, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
             
-        if file.filename.endswith(".docx"):
-            text = utils.read_docx(temp_filename)
-        elif file.filename.endswith(".doc"):
-            text = utils.read_doc(temp_filename)
-        else:
-            text = utils.read_txt(temp_filename)
-            
-        module_name, cases = ai_helper.generate_test_cases(text)
-        
-        if not cases:
+        with profiling.stage("parse"):
+            if file.filename.endswith(".docx"):
+                text = utils.read_docx(temp_filename)
+            elif file.filename.endswith(".doc"):
+                text = utils.read_doc(temp_filename)
+            else:
+                text = utils.read_txt(temp_filename)
+
+        # Only sections that changed since the module's last upload go to the model (see documents.py)
+        module_name, result = await documents.ingest(project, file.filename, text, module=(module or "").strip() or None)
+        prompt_stats, document = result["tokens"], result["document"]
+        print(f"Prompt: {prompt_stats['tokens_in']} -> {prompt_stats['tokens_out']} tokens "
+              f"({prompt_stats['tokens_saved']} saved{', truncated' if prompt_stats['truncated'] else ''}); "
+              f"{document['changed']}/{document['sections_total']} sections changed")
+
+        if not result["count"] and not document.get("unchanged") and not document["removed"]:
              return JSONResponse(status_code=400, content={"error": "No test cases found in document"})
 
-        utils.add_cases(cases, module_name, project)
-        return {"module": module_name, "count": len(cases)}
+        sessions.invalidate(project)
+        if result["count"]:
+            with profiling.stage("priorities"):
+                await run_in_threadpool(case_priority.rescore, project, [module_name])
+
+        return {"module": module_name, "count": result["count"], "tokens": prompt_stats, "document": document}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
     finally:
         if os.path.exists(temp_filename):
             os.remove(temp_filename)
 
+@app.post("/api/import")
+async def import_cases(project: str = Form(...), file: UploadFile = File(...), module: Optional[str] = Form(None),
+                       mapping: Optional[str] = Form(None), dry_run: bool = Form(False)):
+    """Existing cases from CSV/XLSX/NDJSON, no AI involved (see case_import.py).
+    mapping: JSON {field: column}, e.g. {"module": "Component"}; errors are per row.
+    Everything goes into ``project``: rows whose project column names another are rejected."""
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    temp_filename = f"temp_{uuid.uuid4()}{suffix}"
+    try:
+        fields = json.loads(mapping) if mapping else None
+        if fields is not None and not isinstance(fields, dict):
+            raise ValueError("mapping must be a JSON object")
+        case_import.file_format(file.filename)
+        with open(temp_filename, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        report = await run_in_threadpool(case_import.import_file, temp_filename, project, (module or "").strip() or None,
+                                         fields, None, dry_run, only_project=True)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+    if report["imported"] and not dry_run:
+        # New cases show in running sessions; their order is computed in the background
+        for name in {entry["project"] for entry in report["modules"]}:
+            sessions.invalidate(name)
+            case_priority.schedule(name)
+    return report
+
 @app.get("/api/modules")
-async def get_modules(project: str = "togetherfun"):
-    modules_stats = utils.get_module_stats(project)
-    return {"modules": modules_stats}
+async def get_modules(request: Request, project: str = "togetherfun", fields: Optional[str] = None):
+    try:
+        names = utils.parse_fields(fields, utils.MODULE_FIELDS)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return http_cache.cached_json(request, project, lambda: {"modules": utils.pick_fields(utils.get_module_stats(project), names)})
 
 @app.post("/api/start-module")
 async def start_module(request: Request):
@@ -96,7 +244,8 @@ async def start_module(request: Request):
     if not module_name:
         return JSONResponse(status_code=400, content={"error": "Module name required"})
     
-    case = utils.get_next_pending_case_by_module(module_name, project)
+    # Served from the module's working set (see sessions.py)
+    case = await run_in_threadpool(sessions.next_case, project, module_name)
     if not case:
         return {"finished": True}
     return {"case": case}
@@ -105,21 +254,60 @@ async def start_module(request: Request):
 async def submit_result(update: CaseStatusUpdate):
     try:
         if update.status == "Pass":
-            utils.update_case_status(update.case_id, "Pass")
+            sessions.record(update.project, update.case_id, "Pass")
         else:
             bug_report = None
             if update.bug_description:
-                 bug_report = ai_helper.generate_bug_report(update.failed_case_text, update.bug_description)
-            utils.update_case_status(update.case_id, "FAILED", bug_report)
+                 bug_report = await bug_reports.report_for(update.project, update.case_id,
+                                                           update.failed_case_text, update.bug_description)
+            sessions.record(update.project, update.case_id, "FAILED", bug_report, update.bug_description)
+            # A new failure makes the rest of its module riskier
+            case_priority.schedule(update.project, utils.get_module_name_by_case(update.case_id))
         return {"success": True}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+# --- Offline testing (static/offline.js) ---
+
+@app.get("/api/offline/cases")
+async def get_offline_cases(project: str, module: str):
+    """Every case still to test in a module, for an offline session"""
+    cases = utils.get_offline_cases(project, module)
+    if cases is None:
+        return JSONResponse(status_code=404, content={"error": "Module or project not found"})
+    return {"module": module, "cases": cases}
+
+@app.post("/api/results/batch")
+async def submit_results_batch(req: OfflineResults):
+    """Results recorded offline. Safe to resend: each result is applied once per key.
+    Bug reports for new failures are generated in the background (job_id)."""
+    if len(req.results) > utils.OFFLINE_BATCH_LIMIT:
+        return JSONResponse(status_code=400, content={"error": f"At most {utils.OFFLINE_BATCH_LIMIT} results per batch"})
+    sessions.invalidate(req.project)
+    applied = utils.apply_offline_results(req.project, [r.model_dump() for r in req.results])
+    if applied is None:
+        return JSONResponse(status_code=404, content={"error": "Project not found"})
+    outcomes, needs_report = applied
+    if any(o["outcome"] == "applied" and o["status"] == "FAILED" for o in outcomes):
+        case_priority.schedule(req.project)
+    job_id = bug_reports.start_case_reports(req.project, needs_report)
+    return {"results": outcomes, "job_id": job_id}
+
+@app.get("/api/ai/queue")
+async def ai_queue():
+    """AI scheduler state: queue depth per class and project, wait/run times"""
+    return dict(ai_scheduler.metrics(), bug_report_cache=bug_reports.stats(), admission=admission.metrics())
+
+# --- Bug reports ---
+
 @app.get("/api/bugs")
-async def get_bugs(project: str = "togetherfun"):
+async def get_bugs(request: Request, project: str = "togetherfun", fields: Optional[str] = None):
+    try:
+        names = utils.parse_fields(fields, utils.BUG_FIELDS)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     try:
-        bugs = utils.get_failed_cases_with_bugs(project)
-        return {"bugs": bugs}
+        return http_cache.cached_json(request, project, lambda: {"bugs": utils.pick_fields(utils.get_failed_cases_with_bugs(project), names)})
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
@@ -127,6 +315,7 @@ async def get_bugs(project: str = "togetherfun"):
 async def update_bug(update: BugUpdate):
     try:
         utils.update_bug_report_text(update.case_id, update.new_text)
+        bug_reports.remember_edit(update.case_id, update.new_text)
         return {"success": True}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
@@ -139,19 +328,65 @@ async def delete_bug(req: BugDelete):
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+@app.post("/api/modules/regenerate-bugs")
+async def regenerate_module_bugs(req: ModuleRegenerate):
+    """Regenerate every bug report of a module in the background; poll /api/jobs/{job_id}"""
+    try:
+        job_id = bug_reports.start_module_regeneration(req.project, req.module_name, req.force)
+        if job_id is None:
+            return JSONResponse(status_code=404, content={"error": "Project not found"})
+        return {"job_id": job_id}
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = utils.get_job(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job
+
 # --- New Endpoints ---
 
 @app.get("/api/cases")
-async def get_all_cases(project: str = "togetherfun", page: int = Query(1, ge=1), limit: int = Query(20, le=100), status: Optional[str] = None):
+async def get_all_cases(request: Request, project: str = "togetherfun", page: int = Query(1, ge=1), limit: int = Query(20, le=100), status: Optional[str] = None, module: Optional[str] = None, fields: Optional[str] = None):
+    try:
+        names = utils.parse_fields(fields, utils.CASE_FIELDS)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     try:
-        cases, total, all_modules = utils.get_all_cases_paginated(project, page, limit, status)
-        return {"cases": cases, "total": total, "page": page, "limit": limit, "all_modules": all_modules}
+        def build():
+            cases, total, all_modules = utils.get_all_cases_paginated(project, page, limit, status, module, names)
+            return {"cases": cases, "total": total, "page": page, "limit": limit, "all_modules": all_modules}
+        return http_cache.cached_json(request, project, build)
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+def _run_case_operations(project, operations):
+    sessions.invalidate(project)
+    try:
+        results = utils.apply_case_operations(project, operations)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if results is None:
+        return JSONResponse(status_code=404, content={"error": "Project not found"})
+    case_priority.schedule(project)
+    return {"success": True, "results": results}
+
+@app.post("/api/cases/batch")
+async def batch_operations(req: BatchOperations):
+    """Mixed case operations applied atomically: all succeed or nothing changes"""
+    try:
+        return _run_case_operations(req.project, [op.model_dump() for op in req.operations])
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/api/cases/batch/delete")
 async def batch_delete(req: BatchDelete):
     try:
+        if req.project:
+            return _run_case_operations(req.project, [{"op": "delete", "case_ids": req.case_ids}])
+        sessions.invalidate()
         utils.delete_cases_bulk(req.case_ids)
         return {"success": True}
     except Exception as e:
@@ -160,6 +395,9 @@ async def batch_delete(req: BatchDelete):
 @app.post("/api/cases/batch/status")
 async def batch_status(req: BatchUpdateStatus):
     try:
+        if req.project:
+            return _run_case_operations(req.project, [{"op": "status", "case_ids": req.case_ids, "status": req.status}])
+        sessions.invalidate()
         utils.update_cases_status_bulk(req.case_ids, req.status)
         return {"success": True}
     except Exception as e:
@@ -168,6 +406,7 @@ async def batch_status(req: BatchUpdateStatus):
 @app.post("/api/cases/all/delete")
 async def delete_all(req: DeleteAll):
     try:
+        sessions.invalidate(req.project)
         utils.delete_all_cases_for_project(req.project)
         return {"success": True}
     except Exception as e:
@@ -176,13 +415,102 @@ async def delete_all(req: DeleteAll):
 @app.post("/api/modules/retest")
 async def retest_module(req: ModuleRetest):
     try:
+        sessions.invalidate(req.project)
         success = utils.reset_module_cases(req.project, req.module_name)
         if not success:
             return JSONResponse(status_code=404, content={"error": "Module or project not found"})
+        # The reset cases are PENDING again: order the retest by their failures
+        await run_in_threadpool(case_priority.rescore, req.project, [req.module_name])
         return {"success": True}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+# --- Archive ---
+
+@app.post("/api/modules/archive")
+async def archive_module(req: ModuleArchive):
+    """Move a finished module out of the live tables (restore with /api/archive/restore)"""
+    sessions.invalidate(req.project)
+    try:
+        result = utils.archive_module(req.project, req.module_name, req.force)
+    except ValueError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+    if result is None:
+        return JSONResponse(status_code=404, content={"error": "Module or project not found"})
+    return result
+
+@app.post("/api/projects/archive")
+async def archive_project(req: ProjectArchive):
+    sessions.invalidate(req.project)
+    result = utils.archive_project(req.project, req.force)
+    if result is None:
+        return JSONResponse(status_code=404, content={"error": "Project not found"})
+    return result
+
+@app.get("/api/archive")
+async def get_archive(project: str):
+    return {"archived": utils.get_archived_modules(project)}
+
+@app.post("/api/archive/restore")
+async def restore_archive(req: ArchiveRestore):
+    sessions.invalidate(req.project)
+    result = utils.restore_archived_module(req.project, req.archive_id)
+    if result is None:
+        return JSONResponse(status_code=404, content={"error": "Archive not found"})
+    await run_in_threadpool(case_priority.rescore, req.project, [result["module"]])
+    return result
+
+# --- Administration ---
+
+@app.get("/api/admin/maintenance")
+async def maintenance_status():
+    return maintenance.status()
+
+@app.post("/api/admin/maintenance")
+async def run_maintenance(req: MaintenanceRun):
+    """Run maintenance now instead of waiting for the schedule (VACUUM can take a while)"""
+    try:
+        return await run_in_threadpool(maintenance.run_now, req.tasks)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+@app.get("/api/admin/sessions")
+async def sessions_status():
+    """Working sets in memory, results waiting to be written, flush times"""
+    return sessions.status()
+
+@app.get("/api/admin/backup")
+async def backup_status():
+    """Snapshots on disk and the result of the last backup run"""
+    return {**backup.status(), "last_run": maintenance.status()["backup"]}
+
+@app.post("/api/admin/backup")
+async def run_backup():
+    """Take a snapshot now; the report has its duration and the write-lock wait before/during it"""
+    if not backup.supported():
+        return JSONResponse(status_code=400, content={"error": "Built-in backups are for SQLite; use pg_dump for PostgreSQL"})
+    result = (await run_in_threadpool(maintenance.run_now, ["backup"]))["backup"]
+    if "error" in result:
+        return JSONResponse(status_code=500, content=result)
+    return result
+
+# --- Debugging ---
+
+@app.get("/api/debug/slow")
+async def slow_requests(limit: int = Query(20, ge=1, le=200), path: Optional[str] = None):
+    """Slowest logged requests with their stage breakdown and statements, plus per-path totals"""
+    requests, paths = utils.get_slow_requests(limit, path)
+    return {"slow_request_ms": profiling.SLOW_REQUEST_MS, "slow_query_ms": profiling.SLOW_QUERY_MS,
+            "paths": paths, "requests": requests}
+
+@app.get("/api/debug/slow/{request_id}")
+async def slow_request(request_id: int):
+    """One logged request, with the sampled stacks if it was profiled"""
+    entry = utils.get_slow_request(request_id)
+    if entry is None:
+        return JSONResponse(status_code=404, content={"error": "Not found"})
+    return entry
+
 # --- Project Management ---
 
 @app.get("/api/projects")
@@ -218,6 +546,7 @@ class ProjectDelete(BaseModel):
 async def delete_project(req: ProjectDelete):
     """Delete a project and all its data"""
     try:
+        sessions.invalidate(req.name)
         success = utils.delete_project(req.name)
         if not success:
             return JSONResponse(status_code=404, content={"error": "Project not found"})
@@ -226,13 +555,15 @@ async def delete_project(req: ProjectDelete):
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.get("/api/stats")
-async def get_stats(project: str = "Default"):
+async def get_stats(request: Request, project: str = "Default"):
     """Get project statistics for dashboard"""
     try:
-        stats = utils.get_project_stats(project)
-        if not stats:
-            return {"total_cases": 0, "passed": 0, "failed": 0, "pending": 0, "modules": 0}
-        return stats
+        def build():
+            stats = utils.get_project_stats(project)
+            if not stats:
+                return {"total_cases": 0, "passed": 0, "failed": 0, "pending": 0, "modules": 0}
+            return stats
+        return http_cache.cached_json(request, project, build)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
@@ -245,17 +576,19 @@ import io
 async def export_csv(project: str = "Default"):
     """Export all cases as CSV"""
     try:
-        cases, total = utils.get_all_cases_paginated(project, page=1, limit=10000)
+        cases, total, _ = utils.get_all_cases_paginated(project, page=1, limit=10000, fields=list(utils.CASE_FIELDS))
         
         output = io.StringIO()
         writer = csv.writer(output)
-        writer.writerow(["ID", "Module", "Content", "Status", "Bug Report"])
+        writer.writerow(["ID", "Module", "Content", "Steps", "Expected Result", "Status", "Bug Report"])
         
         for case in cases:
             writer.writerow([
                 case.get("id", ""),
                 case.get("module", ""),
                 case.get("content", ""),
+                "\n".join(case.get("steps") or []),
+                case.get("expected_result", "") or "",
                 case.get("status", ""),
                 case.get("bug_report", "") or ""
             ])
@@ -278,7 +611,7 @@ async def search_cases(project: str = "Default", q: str = ""):
         if not q or len(q) < 2:
             return {"cases": [], "total": 0}
         
-        cases, total = utils.get_all_cases_paginated(project, page=1, limit=1000)
+        cases, total, _ = utils.get_all_cases_paginated(project, page=1, limit=1000)
         filtered = [c for c in cases if q.lower() in c.get("content", "").lower() or q.lower() in c.get("module", "").lower()]
         
         return {"cases": filtered[:50], "total": len(filtered)}
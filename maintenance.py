@@ -0,0 +1,167 @@
+"""In-process scheduled maintenance: planner statistics, space reclaim, auto-archiving.
+
+    maintenance.start()   # from main.startup()
+
+A daemon thread wakes every CHECK_SECONDS and runs the tasks that are due.
+Every worker process has the thread; utils.claim_maintenance_task makes sure
+only one of them takes each run.
+
+Tasks:
+    optimize  every QAFLOW_OPTIMIZE_HOURS (6)     SQLite: PRAGMA optimize; PostgreSQL: ANALYZE
+    vacuum    every QAFLOW_VACUUM_HOURS (168)     ANALYZE, VACUUM if enough pages are free
+                                                  (PostgreSQL: VACUUM (ANALYZE))
+    archive   every 24h if QAFLOW_ARCHIVE_AFTER_DAYS > 0: archive the finished
+              modules of projects nobody has touched for that many days
+    prune     every 24h: forget offline-sync idempotency keys older than
+              IDEMPOTENCY_DAYS, trim the slow-request log to its newest
+              profiling.SLOW_LOG_KEEP entries
+    backup    every QAFLOW_BACKUP_HOURS (24) if > 0, SQLite only: compressed
+              online snapshot with retention (see backup.py)
+    priorities every 6h: recompute the risk-based case order of every project
+              (see case_priority.py)
+
+QAFLOW_MAINTENANCE=off disables the thread; run_now() (POST
+/api/admin/maintenance) still works, except for archive while
+QAFLOW_ARCHIVE_AFTER_DAYS is 0. A backup can be taken on demand even with
+QAFLOW_BACKUP_HOURS=0.
+"""
+import json
+import os
+import threading
+import time
+
+import backup
+import case_priority
+import profiling
+import utils
+
+HOUR = 3600
+
+INTERVALS = {
+    "optimize": float(os.getenv("QAFLOW_OPTIMIZE_HOURS", "6")) * HOUR,
+    "vacuum": float(os.getenv("QAFLOW_VACUUM_HOURS", "168")) * HOUR,
+    "archive": 24 * HOUR,
+    "prune": 24 * HOUR,
+    "backup": backup.BACKUP_HOURS * HOUR,
+    "priorities": 6 * HOUR,
+}
+ARCHIVE_AFTER_DAYS = float(os.getenv("QAFLOW_ARCHIVE_AFTER_DAYS", "0"))
+# Offline clients retry unsynced results for days at most
+IDEMPOTENCY_DAYS = 30
+
+CHECK_SECONDS = 600
+# Let the worker finish starting before the first check
+INITIAL_DELAY_SECONDS = 60
+
+
+def _optimize():
+    return utils.get_backend().maintain(full=False)
+
+
+def _vacuum():
+    return utils.get_backend().maintain(full=True)
+
+
+def _archive():
+    archived = skipped = 0
+    if ARCHIVE_AFTER_DAYS <= 0:
+        # get_idle_projects(0) would be every project
+        return {"modules_archived": 0, "unfinished_skipped": 0}
+    for project in utils.get_idle_projects(ARCHIVE_AFTER_DAYS):
+        result = utils.archive_project(project)
+        archived += len(result["archived"]) if result else 0
+        skipped += len(result["skipped"]) if result else 0
+    return {"modules_archived": archived, "unfinished_skipped": skipped}
+
+
+def _prune():
+    return {"idempotency_keys_deleted": utils.prune_result_submissions(IDEMPOTENCY_DAYS),
+            "slow_requests_deleted": utils.prune_slow_requests(profiling.SLOW_LOG_KEEP)}
+
+
+def _backup():
+    return backup.create()
+
+
+def _priorities():
+    return case_priority.rescore_all()
+
+
+TASKS = {"optimize": _optimize, "vacuum": _vacuum, "archive": _archive, "prune": _prune, "backup": _backup,
+         "priorities": _priorities}
+
+
+def _enabled_tasks():
+    tasks = [task for task in TASKS if task != "archive" or ARCHIVE_AFTER_DAYS > 0]
+    if not (backup.BACKUP_HOURS > 0 and backup.supported()):
+        tasks.remove("backup")
+    return tasks
+
+
+def run_task(task):
+    started = time.time()
+    try:
+        result = TASKS[task]()
+    except Exception as e:
+        result = {"error": str(e)}
+        print(f"Maintenance '{task}' failed: {e}")
+    result["started_at"] = started
+    utils.record_maintenance_run(task, json.dumps(result, default=str))
+    return result
+
+
+def run_due():
+    """Run every task that is due and not taken by another worker"""
+    now = time.time()
+    return {task: run_task(task) for task in _enabled_tasks()
+            if utils.claim_maintenance_task(task, INTERVALS[task], now)}
+
+
+def run_now(tasks=None):
+    """Run the given tasks (default: optimize and vacuum) immediately"""
+    results = {}
+    for task in tasks or ("optimize", "vacuum"):
+        if task not in TASKS:
+            raise ValueError(f"Unknown maintenance task: {task}")
+        if task == "archive" and ARCHIVE_AFTER_DAYS <= 0:
+            raise ValueError("Archiving is off: set QAFLOW_ARCHIVE_AFTER_DAYS to the idle days")
+        if task == "backup" and not backup.supported():
+            raise ValueError("Built-in backups are for SQLite; use pg_dump for PostgreSQL")
+        utils.claim_maintenance_task(task, 0, time.time())
+        results[task] = run_task(task)
+    return results
+
+
+def status():
+    runs = {row["task"]: row for row in utils.get_maintenance_runs()}
+    return {task: {"interval_hours": INTERVALS[task] / HOUR,
+                   "enabled": task in _enabled_tasks(),
+                   "last_run": runs.get(task, {}).get("last_run") or None,
+                   "last_result": json.loads(runs[task]["detail"]) if runs.get(task, {}).get("detail") else None}
+            for task in TASKS}
+
+
+_thread = None
+_pid = None
+
+
+def _loop():
+    time.sleep(INITIAL_DELAY_SECONDS)
+    while True:
+        try:
+            run_due()
+        except Exception as e:  # the database may be briefly unavailable; try again next round
+            print(f"Maintenance check failed: {e}")
+        time.sleep(CHECK_SECONDS)
+
+
+def start():
+    global _thread, _pid
+    if os.getenv("QAFLOW_MAINTENANCE", "on").lower() in ("off", "0", "false"):
+        return
+    # Threads don't survive a fork (gunicorn --preload): start again in the child
+    if _thread is not None and _pid == os.getpid():
+        return
+    _pid = os.getpid()
+    _thread = threading.Thread(target=_loop, name="maintenance", daemon=True)
+    _thread.start()
@@ -1,6 +1,9 @@
-from main import app
+from main import app, startup
 from a2wsgi import ASGIMiddleware
 
+# a2wsgi does not run ASGI lifespan events, so initialise the DB explicitly
+startup()
+
 # This is the object you point to in PythonAnywhere's "WSGI configuration file"
 # e.g. from pa_wsgi import application
 application = ASGIMiddleware(app)
@@ -0,0 +1,257 @@
+"""Request profiling: per-stage timings, a slow-request log and an on-demand sampler.
+
+Every /api request is timed by stage while it runs (ProfilingMiddleware):
+
+    db      SQL statements, execute and fetch (db.query_observer)
+    parse   reading an uploaded document: python-docx, BeautifulSoup
+    ai      Gemini calls, queue wait included (ai_scheduler.run)
+    render  JSON serialization of the response
+    other   the rest: request parsing, Python work, compression
+
+Stages are wall time, so work running concurrently inside one request can
+overlap. A request slower than QAFLOW_SLOW_REQUEST_MS (1000) goes to the
+slow_requests table with its breakdown and its slowest statements; a
+statement over QAFLOW_SLOW_QUERY_MS (100) is stored with its query plan
+(SQLite EXPLAIN QUERY PLAN, PostgreSQL EXPLAIN). GET /api/debug/slow lists
+the worst offenders.
+
+On demand, if QAFLOW_PROFILE_TOKEN is set: with an ``X-Profile: <token>``
+header or ``?_profile=<token>`` the request is logged whatever its duration,
+gets a Server-Timing header, and a sampling profiler records the stacks of
+the threads working on it every QAFLOW_PROFILE_INTERVAL_MS (5). Samples are stored as folded stacks, the
+input format of flamegraph.pl and speedscope. The event loop thread is shared,
+so requests running at the same moment show up in each other's samples.
+Without a token the flag is ignored: a sampler thread and a log entry per
+request are not for anonymous clients to start.
+
+QAFLOW_PROFILING=off turns the whole layer off.
+"""
+import collections
+import contextlib
+import contextvars
+import hmac
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+import db
+import utils
+
+ENABLED = os.getenv("QAFLOW_PROFILING", "on").lower() not in ("off", "0", "false")
+SLOW_REQUEST_MS = float(os.getenv("QAFLOW_SLOW_REQUEST_MS", "1000"))
+SLOW_QUERY_MS = float(os.getenv("QAFLOW_SLOW_QUERY_MS", "100"))
+SAMPLE_INTERVAL = float(os.getenv("QAFLOW_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_TOKEN = os.getenv("QAFLOW_PROFILE_TOKEN", "")
+
+# Statements stored per logged request, slowest first
+MAX_QUERIES = 10
+# Distinct stacks stored per profiled request, and frames per stack
+MAX_STACKS = 300
+MAX_STACK_DEPTH = 60
+# Entries kept in slow_requests; the maintenance prune task trims the rest
+SLOW_LOG_KEEP = 1000
+
+_current = contextvars.ContextVar("profile", default=None)
+
+
+class _Query:
+    __slots__ = ("count", "total", "max", "params", "running")
+
+    def __init__(self):
+        self.count = 0
+        self.total = self.max = self.running = 0.0
+        self.params = None
+
+
+class Profile:
+    """Timings of one request; a db query observer"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.stages = collections.Counter()
+        self.db_seconds = 0.0
+        self.queries = {}
+        # Threads currently working for this request (what the sampler looks at)
+        self.threads = collections.Counter()
+        self._lock = threading.Lock()
+
+    def query(self, sql, params, seconds, new):
+        # Called for every statement, so no lock: a request's statements run one after another
+        self.db_seconds += seconds
+        q = self.queries.get(sql)
+        if q is None:
+            q = self.queries[sql] = _Query()
+        if new:
+            q.count += 1
+            q.running = 0.0
+        q.total += seconds
+        q.running += seconds
+        if q.running >= q.max:
+            q.max, q.params = q.running, params
+
+    def enter(self, thread_id):
+        with self._lock:
+            self.threads[thread_id] += 1
+
+    def leave(self, thread_id, stage=None, seconds=0.0):
+        with self._lock:
+            self.threads[thread_id] -= 1
+            if not self.threads[thread_id]:
+                del self.threads[thread_id]
+            if stage:
+                self.stages[stage] += seconds
+
+    def breakdown(self):
+        """{stage: ms} with "other" and "total" """
+        total = (self.finished or time.perf_counter()) - self.started
+        stages = {"db": _ms(self.db_seconds)} if self.queries else {}
+        stages.update((name, _ms(seconds)) for name, seconds in self.stages.items())
+        stages["other"] = _ms(max(0.0, total - self.db_seconds - sum(self.stages.values())))
+        stages["total"] = _ms(total)
+        return stages
+
+    def slowest_queries(self):
+        ranked = sorted(self.queries.items(), key=lambda item: item[1].max, reverse=True)[:MAX_QUERIES]
+        queries = []
+        for sql, q in ranked:
+            entry = {"sql": " ".join(sql.split()), "count": q.count, "total_ms": _ms(q.total), "max_ms": _ms(q.max)}
+            if q.max * 1000 >= SLOW_QUERY_MS and q.params is not None and _explainable(sql):
+                try:
+                    entry["plan"] = utils.explain_query(sql, q.params)
+                except Exception as e:
+                    entry["plan_error"] = str(e)
+            queries.append(entry)
+        return queries
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def _explainable(sql):
+    return sql.lstrip().split(None, 1)[0].upper() in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Count the time spent in the block towards stage ``name`` of the current request"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    profile.enter(thread_id)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.leave(thread_id, name, time.perf_counter() - started)
+
+
+class Sampler(threading.Thread):
+    """Samples the stacks of a profile's active threads at a fixed interval"""
+
+    def __init__(self, profile, interval=SAMPLE_INTERVAL):
+        super().__init__(name="profiler", daemon=True)
+        self.profile = profile
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.profile.threads):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[_fold(frame)] += 1
+                    self.samples += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common(MAX_STACKS))
+
+
+def _fold(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _requested(scope):
+    if not PROFILE_TOKEN:
+        return False
+    flag = Headers(scope=scope).get("x-profile")
+    if flag is None and b"_profile" in scope.get("query_string", b""):
+        flag = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("_profile", [""])[0]
+    return bool(flag) and hmac.compare_digest(flag.encode(), PROFILE_TOKEN.encode())
+
+
+def _server_timing(stages):
+    return ", ".join(f"{name};dur={ms}" for name, ms in stages.items())
+
+
+def _record(scope, status, profile, sampler):
+    stages = profile.breakdown()
+    utils.log_slow_request(scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"),
+                           status, stages["total"], stages, profile.slowest_queries(),
+                           samples=sampler.folded() if sampler else None, profiled=sampler is not None)
+
+
+class ProfilingMiddleware:
+    """Times every /api request; logs the slow and the explicitly profiled ones"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        profile = Profile()
+        requested = _requested(scope)
+        sampler = Sampler(profile) if requested else None
+        status = None
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if requested:
+                    MutableHeaders(scope=message).append("Server-Timing", _server_timing(profile.breakdown()))
+            await send(message)
+
+        thread_id = threading.get_ident()
+        profile.enter(thread_id)
+        profile_token = _current.set(profile)
+        observer_token = db.query_observer.set(profile)
+        if sampler:
+            sampler.start()
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            if sampler:
+                sampler.stop()
+            profile.leave(thread_id)
+            db.query_observer.reset(observer_token)
+            _current.reset(profile_token)
+            profile.finished = time.perf_counter()
+            if requested or (profile.finished - profile.started) * 1000 >= SLOW_REQUEST_MS:
+                try:
+                    # The response is out already; EXPLAIN and the insert don't hold up the client
+                    await run_in_threadpool(_record, scope, status, profile, sampler)
+                except Exception as e:
+                    print(f"Slow request log failed: {e}")
@@ -0,0 +1,132 @@
+"""Prompt budgeting: shrink extracted requirements before they go to the model.
+
+    text, stats = prompt_budget.prepare(raw_text)
+
+prepare() normalizes whitespace, drops export boilerplate (MIME headers,
+base64 blobs, Confluence page chrome), removes duplicated lines and table
+rows, then cuts whatever is still over the token budget at a line boundary.
+``stats`` says how many tokens that saved; the upload endpoint returns it.
+
+Deduplication is deliberately conservative: Confluence tables come out one
+cell per line, so short lines like "mandatory" or "a. if the user tries to
+save an empty field, the error:" repeat legitimately for every field and are
+kept. Only consecutive repeats, repeated table rows and repeated long
+paragraphs are dropped. benchmarks/compaction.py checks this against the
+fixture corpus.
+"""
+import math
+import os
+import re
+
+# Token budget for the requirements part of the prompt (instructions add ~600 more)
+TOKEN_BUDGET = int(os.getenv("QAFLOW_PROMPT_TOKEN_BUDGET", "24000"))
+
+# Lines at least this long are paragraphs; a second copy carries no information
+LONG_LINE = 120
+# Shorter lines are table cells ("text", "mandatory"); equal neighbours are real data
+SHORT_LINE = 20
+
+_TOKEN_RE = re.compile(r"[A-Za-z]+|\d+|[^\W\d_A-Za-z]+|[^\w\s]")
+
+_BOILERPLATE = [re.compile(p, re.IGNORECASE) for p in (
+    # MIME envelope of "Export to Word" files when it wasn't decoded upstream
+    r"(MIME-Version|Message-ID|Content-Type|Content-Transfer-Encoding|Content-Location):.*",
+    r"boundary=.*",
+    r"-+=_Part_[\w.]+(--)?",
+    r"Subject: Exported From Confluence",
+    # Inline images and attachments (base64, no spaces)
+    r"[A-Za-z0-9+/]{60,}={0,2}",
+    # Confluence page chrome
+    r"Skip to end of metadata",
+    r"Go to start of metadata",
+    # "Created by Olena Koval, last modified by Ivan Petrenko on 12 Sep 2025": a name and a date, not
+    # a requirement such as "Last modified by the admin user is shown in the audit log"
+    r"(Created|Last updated|Last modified) by [^,]{1,60}(, last (modified|updated)( by [^,]{1,60})?)?"
+    r" on (\d{1,2} [a-z]{3,9}\.? \d{4}|[a-z]{3,9}\.? \d{1,2}, \d{4}|\d{4}-\d{2}-\d{2})",
+    r"(Document generated|Printed|Powered) by (Atlassian )?Confluence.*",
+    r"Be the first to like this",
+    r"No labels",
+    r"(Expand|Collapse) source",
+)]
+
+_INVISIBLE = str.maketrans({"\xa0": " ", "\t": " ", "\u200b": None, "\ufeff": None, "\r": None})
+_SPACES = re.compile(r" {2,}")
+
+
+def estimate_tokens(text):
+    """Approximate Gemini token count without a tokenizer call.
+
+    SentencePiece-style: ~4 Latin letters per token, ~3 Cyrillic letters per
+    token, one token per digit and per punctuation mark. Good to ~15% on our
+    requirement docs, which is all budgeting needs.
+    """
+    tokens = 0
+    for piece in _TOKEN_RE.findall(text or ""):
+        first = piece[0]
+        if first.isdigit():
+            tokens += len(piece)
+        elif first.isascii() and first.isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif first.isalpha():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+def compact(text):
+    """Whitespace/boilerplate stripping and de-duplication. Returns (text, stats)."""
+    lines = []
+    seen_rows = set()
+    seen_paragraphs = set()
+    stats = {"boilerplate_lines": 0, "duplicate_lines": 0}
+    previous = None
+    for raw in (text or "").translate(_INVISIBLE).split("\n"):
+        line = _SPACES.sub(" ", raw).strip()
+        if not line:
+            continue
+        if any(p.fullmatch(line) for p in _BOILERPLATE):
+            stats["boilerplate_lines"] += 1
+            continue
+        key = line.casefold()
+        if key == previous and len(line) >= SHORT_LINE:
+            stats["duplicate_lines"] += 1
+            continue
+        previous = key
+        if " | " in line or len(line) >= LONG_LINE:
+            seen = seen_rows if " | " in line else seen_paragraphs
+            if key in seen:
+                stats["duplicate_lines"] += 1
+                continue
+            seen.add(key)
+        lines.append(line)
+    return "\n".join(lines), stats
+
+
+def fit_to_budget(text, max_tokens):
+    """Cut text at a line boundary so it fits max_tokens. Returns (text, truncated)."""
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+    lines = text.split("\n")
+    kept = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1  # newline
+        if used + cost > max_tokens - 20:  # room for the marker below
+            break
+        kept.append(line)
+        used += cost
+    omitted = len(lines) - len(kept)
+    kept.append(f"[... {omitted} more lines omitted to fit the token budget]")
+    return "\n".join(kept), True
+
+
+def prepare(text, max_tokens=None):
+    """compact() + fit_to_budget(). Returns (text, stats) with token counts before/after."""
+    tokens_in = estimate_tokens(text)
+    compacted, stats = compact(text)
+    compacted, truncated = fit_to_budget(compacted, max_tokens or TOKEN_BUDGET)
+    tokens_out = estimate_tokens(compacted)
+    stats.update(tokens_in=tokens_in, tokens_out=tokens_out, tokens_saved=tokens_in - tokens_out,
+                 truncated=truncated)
+    return compacted, stats
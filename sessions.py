@@ -0,0 +1,392 @@
+"""In-memory working set of the modules being tested, with write-behind persistence.
+
+    case = sessions.next_case(project, module)          # /api/start-module
+    sessions.record(project, case_id, "Pass")           # /api/submit-result
+    sessions.invalidate(project)                        # after changing a project's cases some other way
+
+A click used to be two trips to the database: update_case_status (UPDATE,
+data version bump, commit) and get_next_pending_case_by_module. Now the
+first /api/start-module of a module loads its PENDING and FAILED cases into
+compact records (WorkingSet) and every next case is served from memory, in
+the order of the index (priority DESC, id). A result updates the record, is
+appended to this process's journal and queued; a background thread writes
+the queue in one transaction (utils.apply_session_results) QAFLOW_SESSION_FLUSH_MS
+(50) after the first result, or as soon as FLUSH_BATCH are waiting.
+
+Crash safety: record() returns only once the result is in the journal, so a
+result the tester saw accepted survives the process dying before its batch
+was committed. A journal file is deleted once its batch is. Files of a
+process that is gone (by pid; for another host's, nobody wrote to them for
+ORPHAN_SECONDS) are replayed by whichever process finds them, at its first
+session and every ORPHAN_CHECK_SECONDS after. Results carry idempotency keys
+(result_submissions), so a replay never applies one twice. The journal is
+written, not fsynced: that covers a crashed or killed process. With
+QAFLOW_SESSION_FSYNC=on every line is fsynced, which covers power loss too,
+at about a millisecond per click.
+
+Other writers: a working set checks the project's data version at most every
+QAFLOW_SESSION_CHECK_MS (1000) and reloads, keeping its own unflushed results,
+when someone else changed the project. Endpoints of this process that change
+cases call invalidate() first: queued results are written before their change
+(a retest resets the failure just recorded, as it did before) and the change
+shows at once. Other endpoints see a result once its batch is committed.
+
+QAFLOW_SESSION_CACHE=off reads and writes the database on every click, as before.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+
+import utils
+
+ENABLED = os.getenv("QAFLOW_SESSION_CACHE", "on").lower() not in ("off", "0", "false")
+FLUSH_INTERVAL = float(os.getenv("QAFLOW_SESSION_FLUSH_MS", "50")) / 1000
+VERSION_CHECK_SECONDS = float(os.getenv("QAFLOW_SESSION_CHECK_MS", "1000")) / 1000
+FSYNC = os.getenv("QAFLOW_SESSION_FSYNC", "off").lower() in ("on", "1", "true")
+JOURNAL_DIR = os.getenv("QAFLOW_SESSION_JOURNAL_DIR",
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)), "session-journal"))
+
+FLUSH_BATCH = 500
+# A journal of a live pid untouched this long is orphaned anyway (pid reused, another host)
+ORPHAN_SECONDS = 30
+ORPHAN_CHECK_SECONDS = 30
+# Working sets nobody asked for a case this long are dropped
+IDLE_SECONDS = 15 * 60
+# Pause after a failed flush before the next attempt
+ERROR_BACKOFF_SECONDS = 1.0
+
+JOURNAL_PREFIX = "journal-"
+JOURNAL_SUFFIX = ".jsonl"
+
+
+class _Case:
+    __slots__ = ("id", "text", "steps", "expected_result", "status", "priority", "pos")
+
+    def __init__(self, case, pos):
+        self.id, self.text, self.steps = case["id"], case["text"], case["steps"]
+        self.expected_result, self.status, self.priority = case["expected_result"], case["status"], case["priority"]
+        self.pos = pos
+
+    def payload(self):
+        # Same shape as utils.get_next_pending_case_by_module
+        return {"id": self.id, "text": self.text, "steps": self.steps, "expected_result": self.expected_result,
+                "status": self.status, "priority": self.priority, "is_retest": self.status == "FAILED"}
+
+
+class WorkingSet:
+    """A module's PENDING and FAILED cases in next-case order, with a cursor per status"""
+
+    def __init__(self, project, module, project_id, version, cases):
+        self.project, self.module, self.project_id = project, module, project_id
+        self.version = version
+        self.cases = [_Case(case, pos) for pos, case in enumerate(cases)]
+        self.by_id = {case.id: case for case in self.cases}
+        self.checked_at = self.used = time.monotonic()
+        self._pending = self._failed = 0
+
+    def next_case(self):
+        cases = self.cases
+        while self._pending < len(cases) and cases[self._pending].status != "PENDING":
+            self._pending += 1
+        if self._pending < len(cases):
+            return cases[self._pending]
+        # Nothing pending: failed cases for retest, like the database path
+        while self._failed < len(cases) and cases[self._failed].status != "FAILED":
+            self._failed += 1
+        return cases[self._failed] if self._failed < len(cases) else None
+
+    def set_status(self, case, status):
+        case.status = status
+        # Back in play behind a cursor (e.g. an earlier case failed from another tab)
+        if status == "PENDING":
+            self._pending = min(self._pending, case.pos)
+        elif status == "FAILED":
+            self._failed = min(self._failed, case.pos)
+
+
+class _Journal:
+    """This process's JSON-lines journal; a new file after every flush"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._fd = None
+        self.path = None
+
+    def append(self, result):
+        if self._fd is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.path = os.path.join(self.directory,
+                                     f"{JOURNAL_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:12]}{JOURNAL_SUFFIX}")
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.write(self._fd, (json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+        if FSYNC:
+            os.fsync(self._fd)
+
+    def rotate(self):
+        """Close the current file; returns its path (None if nothing was written)"""
+        if self._fd is None:
+            return None
+        os.close(self._fd)
+        path, self._fd, self.path = self.path, None, None
+        return path
+
+
+_lock = threading.Lock()
+_queued = threading.Condition(_lock)
+# One flush at a time: the flusher thread, atexit, callers of flush()
+_flush_lock = threading.Lock()
+# (project, module) -> WorkingSet; case id -> WorkingSet
+_sets = {}
+_case_sets = {}
+# Results waiting for the flusher, and for each case the key of its latest unflushed result
+_queue = []
+_unflushed = {}
+# Journal files whose results are in the batch being written (or one that failed)
+_flushing = []
+_journal = _Journal(JOURNAL_DIR)
+_stats = {"loads": 0, "served": 0, "recorded": 0, "direct": 0, "flushes": 0, "flushed": 0, "flush_errors": 0,
+          "replayed": 0, "last_flush_ms": None}
+_thread = None
+_pid = None
+
+
+def _drop(working_set):
+    if _sets.get((working_set.project, working_set.module)) is working_set:
+        del _sets[working_set.project, working_set.module]
+    for case_id in working_set.by_id:
+        if _case_sets.get(case_id) is working_set:
+            del _case_sets[case_id]
+
+
+def invalidate(project=None):
+    """Before changing a project's (None: any) cases outside the testing flow: writes
+    the queued results and forgets the working sets, which reload on the next case"""
+    flush()
+    with _lock:
+        for working_set in list(_sets.values()):
+            if project is None or working_set.project == project:
+                _drop(working_set)
+
+
+def _load(project, module):
+    loaded = utils.get_session_cases(project, module)
+    if loaded is None:
+        return None
+    working_set = WorkingSet(project, module, *loaded)
+    with _lock:
+        # Our own results the database doesn't have yet
+        for case in working_set.cases:
+            if case.id in _unflushed:
+                working_set.set_status(case, _unflushed[case.id][1])
+        old = _sets.get((project, module))
+        if old is not None:
+            _drop(old)
+        _sets[project, module] = working_set
+        for case_id in working_set.by_id:
+            _case_sets[case_id] = working_set
+        _stats["loads"] += 1
+    return working_set
+
+
+def _current(project, module):
+    """The module's working set, (re)loaded if missing or stale"""
+    now = time.monotonic()
+    with _lock:
+        working_set = _sets.get((project, module))
+    if working_set is not None and now - working_set.checked_at >= VERSION_CHECK_SECONDS:
+        current = utils.get_project_version(project)
+        with _lock:
+            if current is None or current[1] != working_set.version:
+                _drop(working_set)
+                working_set = None
+            else:
+                working_set.checked_at = now
+    return working_set or _load(project, module)
+
+
+def next_case(project, module):
+    """Next case to test in a module (utils.get_next_pending_case_by_module), from memory"""
+    if not ENABLED:
+        return utils.get_next_pending_case_by_module(module, project)
+    _start()
+    working_set = _current(project, module)
+    if working_set is None:
+        return None
+    with _lock:
+        working_set.used = time.monotonic()
+        case = working_set.next_case()
+        _stats["served"] += 1
+        return case.payload() if case else None
+
+
+def record(project, case_id, status, bug_report=None, observation=None):
+    """A case's result from the testing flow (utils.update_case_status); durable once this returns.
+    Cases outside this process's working sets are written straight away."""
+    if ENABLED:
+        with _lock:
+            working_set = _case_sets.get(case_id)
+            if working_set is not None and working_set.project == project:
+                result = {"key": f"session-{uuid.uuid4().hex}", "project_id": working_set.project_id,
+                          "case_id": case_id, "status": status, "bug_report": bug_report, "observation": observation}
+                _journal.append(result)
+                working_set.set_status(working_set.by_id[case_id], status)
+                _queue.append(result)
+                _unflushed[case_id] = (result["key"], status)
+                _stats["recorded"] += 1
+                _queued.notify()
+                return
+            _stats["direct"] += 1
+    utils.update_case_status(case_id, status, bug_report, observation)
+
+
+def flush():
+    """Write every queued result now; returns how many were written"""
+    with _flush_lock:
+        with _lock:
+            batch = _queue[:]
+            del _queue[:]
+            path = _journal.rotate()
+        if path:
+            _flushing.append(path)
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            versions = utils.apply_session_results(batch)
+        except Exception as e:
+            with _lock:
+                # Next flush tries again; the journal files stay until then
+                _queue[:0] = batch
+                _stats["flush_errors"] += 1
+            print(f"⚠️ Session results not written yet ({len(batch)} waiting): {e}")
+            return 0
+        for path in _flushing:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # replayed by another process while the database was unreachable
+        del _flushing[:]
+        with _lock:
+            for result in batch:
+                if _unflushed.get(result["case_id"], (None,))[0] == result["key"]:
+                    del _unflushed[result["case_id"]]
+            for working_set in _sets.values():
+                before, after = versions.get(working_set.project_id, (None, None))
+                # Only our own bump in between: the set still matches the database
+                if before is not None and working_set.version == before and after == before + 1:
+                    working_set.version = after
+            _stats["flushes"] += 1
+            _stats["flushed"] += len(batch)
+            _stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return len(batch)
+
+
+def _orphaned(name, path, min_age):
+    try:
+        pid = int(name[len(JOURNAL_PREFIX):].split("-", 1)[0])
+        if pid == os.getpid():
+            return True  # an earlier process with our pid (a restarted container is pid 1 again)
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except (ValueError, OSError):
+        pass  # not ours to signal: judge by age
+    return time.time() - os.path.getmtime(path) >= min_age
+
+
+def recover(min_age=ORPHAN_SECONDS):
+    """Replay the journals of processes that are gone; returns how many results were replayed"""
+    with _flush_lock:
+        return _recover(min_age)
+
+
+def _recover(min_age):
+    if not os.path.isdir(JOURNAL_DIR):
+        return 0
+    own = set(_flushing) | {_journal.path}
+    replayed = 0
+    for name in sorted(os.listdir(JOURNAL_DIR)):
+        path = os.path.join(JOURNAL_DIR, name)
+        if not (name.startswith(JOURNAL_PREFIX) and name.endswith(JOURNAL_SUFFIX)) or path in own:
+            continue
+        try:
+            if not _orphaned(name, path, min_age):
+                continue
+            results = []
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        results.append(json.loads(line))
+                    except ValueError:
+                        pass  # the line being written when the process died
+            if results:
+                utils.apply_session_results(results)
+            os.remove(path)
+        except FileNotFoundError:
+            continue  # another worker got to it first
+        except Exception as e:
+            print(f"⚠️ Session journal {name} not replayed: {e}")
+            continue
+        replayed += len(results)
+        print(f"Session journal {name}: {len(results)} results replayed")
+    with _lock:
+        _stats["replayed"] += replayed
+    return replayed
+
+
+def _evict_idle():
+    now = time.monotonic()
+    with _lock:
+        for working_set in list(_sets.values()):
+            if now - working_set.used > IDLE_SECONDS:
+                _drop(working_set)
+
+
+def _loop():
+    recover()
+    checked = time.monotonic()
+    while True:
+        with _lock:
+            _queued.wait_for(lambda: _queue, timeout=ORPHAN_CHECK_SECONDS)
+            if _queue:
+                # Let the batch fill up for one flush interval
+                _queued.wait_for(lambda: len(_queue) >= FLUSH_BATCH, timeout=FLUSH_INTERVAL)
+        errors = _stats["flush_errors"]
+        flush()
+        if _stats["flush_errors"] != errors:
+            time.sleep(ERROR_BACKOFF_SECONDS)
+        if time.monotonic() - checked >= ORPHAN_CHECK_SECONDS:
+            checked = time.monotonic()
+            recover()
+            _evict_idle()
+
+
+def _start():
+    global _thread, _pid, _journal
+    # Threads don't survive a fork (gunicorn --preload): start again in the child, with its own journal
+    if _thread is not None and _pid == os.getpid():
+        return
+    with _lock:
+        if _thread is not None and _pid == os.getpid():
+            return
+        if _pid is not None:
+            _journal.rotate()
+            _journal = _Journal(JOURNAL_DIR)
+            del _queue[:]
+            _unflushed.clear()
+        _pid = os.getpid()
+        _thread = threading.Thread(target=_loop, name="session-flush", daemon=True)
+        _thread.start()
+
+
+def status():
+    with _lock:
+        return {"enabled": ENABLED, "working_sets": len(_sets), "cases": len(_case_sets), "queued": len(_queue),
+                "journal_dir": JOURNAL_DIR, **_stats}
+
+
+# Whatever is still queued when the process exits normally
+atexit.register(flush)
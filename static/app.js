@@ -9,14 +9,19 @@ const app = {
 
         // UI State
         selectedCases: new Set(),
-        currentPage: 1,
-        limit: 20,
         totalCases: 0,
         theme: localStorage.getItem('theme') || 'dark',
         allBugs: [],
-        allCasesData: [],
+        casePages: new Map(),        // page number -> cases, for the virtualized All Cases list
+        casePagesLoading: new Set(),
+        caseRowNodes: new Map(),     // row key -> DOM node currently on screen
+        caseListGen: 0,
         uploadQueue: [],
         projects: [],
+        // Offline session (static/offline.js): current module is served from IndexedDB
+        offline: false,
+        offlineCase: null,
+        skippedCases: new Set(),
         stats: null,
         isProcessingQueue: false
     },
@@ -30,6 +35,13 @@ const app = {
         this.setupDragAndDrop();
         this.setupKeyboardShortcuts();
 
+        // Results recorded offline go out as soon as there is a connection
+        if (offline.supported()) {
+            window.addEventListener('online', () => this.syncResults());
+            setInterval(() => this.syncResults(), 30000);
+            this.syncResults();
+        }
+
         if ('serviceWorker' in navigator) {
             navigator.serviceWorker.register('/sw.js')
                 .then(reg => console.log('Service Worker Registered'))
@@ -487,12 +499,13 @@ const app = {
 
                 const response = await fetch('/api/upload', {
                     method: 'POST',
+                    // The rate limiter can't read multipart bodies, so the project also goes in a header
+                    headers: { 'X-Project': this.state.currentProject },
                     body: formData
                 });
 
                 if (!response.ok) {
-                    const errorData = await response.json().catch(() => ({}));
-                    throw new Error(errorData.error || `Server Error: ${response.status}`);
+                    throw new Error(await this.uploadError(response));
                 }
 
                 item.status = 'saving';
@@ -501,7 +514,7 @@ const app = {
                 const data = await response.json();
                 item.status = 'done';
                 item.result = data;
-                this.showToast(`✅ ${item.file.name}: ${data.count} cases`);
+                this.showToast(`✅ ${item.file.name}: ${this.uploadSummary(data)}`);
                 await this.loadModules();
             } catch (e) {
                 item.status = 'error';
@@ -551,17 +564,17 @@ const app = {
         try {
             const response = await fetch('/api/upload', {
                 method: 'POST',
+                headers: { 'X-Project': this.state.currentProject },
                 body: formData,
                 signal: signal
             });
 
             if (!response.ok) {
-                const errorData = await response.json().catch(() => ({}));
-                throw new Error(errorData.error || `Server Error: ${response.status}`);
+                throw new Error(await this.uploadError(response));
             }
 
             const data = await response.json();
-            this.showToast(`Success! ${data.count} cases generated.`);
+            this.showToast(`Success! ${this.uploadSummary(data)}`);
             await this.loadModules();
         } catch (e) {
             if (e.name === 'AbortError') {
@@ -599,6 +612,7 @@ const app = {
                 <div style="text-align:center; padding: 2rem; color: var(--text-secondary)">
                 No active modules found in <b>${this.state.currentProject}</b>.<br>Upload a document to get started.
                 </div>`;
+                this.loadArchive(list);
                 return;
             }
 
@@ -638,14 +652,70 @@ const app = {
                         Start Testing →
                     </button>`
                     }
+                ${mod.pending === 0 ?
+                        `<button class="btn btn-ghost" onclick="app.archiveModule('${mod.name}')" title="Move to archive" style="font-size: 0.8rem; margin-left: 0.5rem; padding: 0.5rem 0.75rem;">🗄</button>` : ''}
                 `;
                 list.appendChild(el);
             });
+            this.loadArchive(list);
         } catch (e) {
             list.innerHTML = `<div style="color: var(--danger); text-align:center">Error loading modules: ${e.message}</div>`;
         }
     },
 
+    async loadArchive(list) {
+        // Archived modules are out of the live tables; listed here so they can be restored
+        try {
+            const res = await fetch(`/api/archive?project=${encodeURIComponent(this.state.currentProject)}`);
+            const data = await res.json();
+            if (!data.archived || data.archived.length === 0) return;
+            const box = document.createElement('details');
+            box.style.cssText = 'margin-top: 1rem; color: var(--text-secondary); font-size: 0.85rem;';
+            box.innerHTML = `<summary style="cursor: pointer;">🗄 Archived modules (${data.archived.length})</summary>` +
+                data.archived.map(a => `
+                <div style="display: flex; justify-content: space-between; align-items: center; padding: 0.5rem 0; border-bottom: 1px solid var(--border-color);">
+                    <span>📦 ${a.name} — ${a.passed}/${a.cases} passed, ${a.failed} failed · ${a.archived_at || ''}</span>
+                    <button class="btn btn-ghost" onclick="app.restoreArchive(${a.id})" style="font-size: 0.8rem; padding: 0.25rem 0.75rem;">Restore</button>
+                </div>`).join('');
+            list.appendChild(box);
+        } catch (e) {
+            console.error('Archive list failed', e);
+        }
+    },
+
+    async archiveModule(moduleName) {
+        if (!confirm(`Archive module "${moduleName}"? It can be restored later.`)) return;
+        const res = await fetch('/api/modules/archive', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ project: this.state.currentProject, module_name: moduleName })
+        });
+        const data = await res.json();
+        if (!res.ok) {
+            this.showErrorModal("Archive Failed", data.error || `Server Error: ${res.status}`);
+            return;
+        }
+        this.showToast(`Module "${moduleName}" archived (${data.cases} cases)`);
+        this.loadModules();
+        this.updateDashboardStats();
+    },
+
+    async restoreArchive(archiveId) {
+        const res = await fetch('/api/archive/restore', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ project: this.state.currentProject, archive_id: archiveId })
+        });
+        const data = await res.json();
+        if (!res.ok) {
+            this.showErrorModal("Restore Failed", data.error || `Server Error: ${res.status}`);
+            return;
+        }
+        this.showToast(`Module "${data.module}" restored (${data.cases} cases)`);
+        this.loadModules();
+        this.updateDashboardStats();
+    },
+
     async startModule(moduleName) {
         this.state.currentModule = moduleName;
         this.hideAllViews();
@@ -653,9 +723,68 @@ const app = {
         testingView.style.display = 'block';
         testingView.classList.add('active');
         document.getElementById('current-module-badge').innerText = moduleName;
+        this.state.skippedCases = new Set();
+        this.state.offline = await offline.isDownloaded(this.state.currentProject, moduleName).catch(() => false);
+        this.updateOfflineButton();
         this.fetchNextCase();
     },
 
+    // --- OFFLINE SESSION ---
+    async toggleOffline() {
+        const project = this.state.currentProject;
+        const module = this.state.currentModule;
+        if (!offline.supported()) {
+            return this.showErrorModal("Offline Mode", "This browser has no IndexedDB support.");
+        }
+        try {
+            if (this.state.offline) {
+                await this.syncResults();
+                await offline.drop(project, module);
+                this.state.offline = false;
+                this.showToast("Back online: cases come from the server");
+            } else {
+                const count = await offline.download(project, module);
+                this.state.offline = true;
+                this.showToast(`📥 ${count} cases saved for offline testing`);
+            }
+        } catch (e) {
+            this.showErrorModal("Offline Mode", e.message);
+        }
+        this.updateOfflineButton();
+        this.fetchNextCase();
+    },
+
+    updateOfflineButton() {
+        const btn = document.getElementById('offline-toggle-btn');
+        if (btn) btn.innerHTML = this.state.offline ? '📴 Offline session (end)' : '📥 Work offline';
+    },
+
+    scheduleSync() {
+        clearTimeout(this._syncTimer);
+        this._syncTimer = setTimeout(() => this.syncResults(), 2000);
+    },
+
+    async syncResults() {
+        if (!offline.supported()) return;
+        const result = await offline.sync().catch(() => null);
+        if (result && (result.applied || result.conflicts || result.rejected)) {
+            if (result.conflicts || result.rejected) {
+                this.showToast(`Synced ${result.applied} results; ${result.conflicts} kept the server's FAILED, ` +
+                    `${result.rejected} cases no longer exist`, 'error');
+            }
+            this.loadModules();
+            this.updateDashboardStats();
+        }
+        await this.updateSyncStatus();
+    },
+
+    async updateSyncStatus() {
+        const el = document.getElementById('sync-status');
+        if (!el) return;
+        const pending = await offline.pendingCount().catch(() => 0);
+        el.innerText = pending ? `⏳ ${pending} result${pending === 1 ? '' : 's'} waiting to sync` : '';
+    },
+
     async retestModule(moduleName) {
         if (!confirm(`Reset all progress for module "${moduleName}" and re-run all tests?`)) {
             return;
@@ -685,6 +814,7 @@ const app = {
     },
 
     async fetchNextCase() {
+        if (this.state.offline) return this.nextOfflineCase();
         document.getElementById('case-content-area').style.display = 'none';
         document.getElementById('case-loader').style.display = 'block';
 
@@ -706,76 +836,111 @@ const app = {
                 return;
             }
 
-            this.state.currentCaseId = data.case.id;
-            this.state.failedCaseText = data.case.text;
-            this.state.isRetest = data.case.is_retest || false;
+            this.renderCase(data.case);
+        } catch (e) {
+            console.error(e);
+            this.showToast("Error fetching case", "error");
+        } finally {
+            document.getElementById('case-loader').style.display = 'none';
+            document.getElementById('case-content-area').style.display = 'block';
+        }
+    },
 
-            document.getElementById('case-id').innerText = "#" + data.case.id;
+    // Offline: the next case is a local IndexedDB read, no round trip
+    async nextOfflineCase() {
+        const project = this.state.currentProject;
+        const module = this.state.currentModule;
+        const testCase = await offline.nextCase(project, module, this.state.skippedCases);
+        this.state.offlineCase = testCase;
+        if (!testCase) {
+            if (await offline.remaining(project, module) === 0) {
+                await offline.drop(project, module);
+                this.state.offline = false;
+                this.updateOfflineButton();
+            }
+            this.showToast("Module Complete! 🎉");
+            this.syncResults();
+            setTimeout(() => this.goHome(), 1000);
+            return;
+        }
+        this.renderCase(testCase);
+    },
 
-            // Parse for structured format: "Steps" and "Result"
-            const rawText = data.case.text || "";
-            let steps = rawText;
-            let result = "Див. опис кейсу";
+    renderCase(testCase) {
+        this.state.currentCaseId = testCase.id;
+        this.state.failedCaseText = testCase.text;
+        this.state.isRetest = testCase.is_retest || false;
 
-            // Improved split logic (handles both <br> and textual "Очікуваний результат")
-            const resultLabel = "Очікуваний результат:";
-            let parts = [];
+        document.getElementById('case-id').innerText = "#" + testCase.id;
 
-            if (rawText.toLowerCase().includes("<br>")) {
-                parts = rawText.split(/<br>/i);
-            } else if (rawText.toLowerCase().includes(resultLabel.toLowerCase())) {
-                const index = rawText.toLowerCase().indexOf(resultLabel.toLowerCase());
-                parts = [
-                    rawText.substring(0, index),
-                    rawText.substring(index)
-                ];
-            }
+        // Typed cases come with their steps and expected result
+        if (Array.isArray(testCase.steps)) {
+            document.getElementById('case-steps').innerText = testCase.steps.map(s => `• ${s}`).join('\n');
+            document.getElementById('case-result').innerText = testCase.expected_result || "Див. опис кейсу";
+            this.renderActionBar();
+            return;
+        }
 
-            if (parts.length >= 2) {
-                steps = parts[0].replace(/Кроки[:\s]*/i, "").trim();
-                result = parts[1].replace(/Очікуваний результат[:\s]*/i, "").trim();
-            }
+        // Older cases: parse "Steps" and "Result" out of the text
+        const rawText = testCase.text || "";
+        let steps = rawText;
+        let result = "Див. опис кейсу";
+
+        // Improved split logic (handles both <br> and textual "Очікуваний результат")
+        const resultLabel = "Очікуваний результат:";
+        let parts = [];
+
+        if (rawText.toLowerCase().includes("<br>")) {
+            parts = rawText.split(/<br>/i);
+        } else if (rawText.toLowerCase().includes(resultLabel.toLowerCase())) {
+            const index = rawText.toLowerCase().indexOf(resultLabel.toLowerCase());
+            parts = [
+                rawText.substring(0, index),
+                rawText.substring(index)
+            ];
+        }
 
-            // Convert legacy semicolons to newlines with bullets if detected
-            if (steps.includes(';') && !steps.includes('\n')) {
-                steps = steps.split(';').map(s => s.trim()).filter(s => s).map(s => `• ${s}`).join('\n');
-            }
+        if (parts.length >= 2) {
+            steps = parts[0].replace(/Кроки[:\s]*/i, "").trim();
+            result = parts[1].replace(/Очікуваний результат[:\s]*/i, "").trim();
+        }
 
-            document.getElementById('case-steps').innerText = steps;
-            document.getElementById('case-result').innerText = result;
-
-            // Update action bar for retest mode
-            const actionBar = document.querySelector('.action-bar');
-            if (this.state.isRetest) {
-                actionBar.innerHTML = `
-                    <button class="btn btn-ghost" onclick="app.skipCase()" style="background: var(--card-hover); height: 60px;">
-                        <span>⏭️</span> Skip (Retest)
-                    </button>
-                    <button class="btn btn-success" onclick="app.handlePass()">
-                        <span>✔</span> Pass (Fixed)
-                    </button>
-                `;
-            } else {
-                actionBar.innerHTML = `
-                    <button class="btn btn-danger" onclick="app.handleFail()">
-                        <span>✖</span> Failed
-                    </button>
-                    <button class="btn btn-success" onclick="app.handlePass()">
-                        <span>✔</span> Pass
-                    </button>
-                `;
-            }
+        // Convert legacy semicolons to newlines with bullets if detected
+        if (steps.includes(';') && !steps.includes('\n')) {
+            steps = steps.split(';').map(s => s.trim()).filter(s => s).map(s => `• ${s}`).join('\n');
+        }
 
-        } catch (e) {
-            console.error(e);
-            this.showToast("Error fetching case", "error");
-        } finally {
-            document.getElementById('case-loader').style.display = 'none';
-            document.getElementById('case-content-area').style.display = 'block';
+        document.getElementById('case-steps').innerText = steps;
+        document.getElementById('case-result').innerText = result;
+        this.renderActionBar();
+    },
+
+    renderActionBar() {
+        // Update action bar for retest mode
+        const actionBar = document.querySelector('.action-bar');
+        if (this.state.isRetest) {
+            actionBar.innerHTML = `
+                <button class="btn btn-ghost" onclick="app.skipCase()" style="background: var(--card-hover); height: 60px;">
+                    <span>⏭️</span> Skip (Retest)
+                </button>
+                <button class="btn btn-success" onclick="app.handlePass()">
+                    <span>✔</span> Pass (Fixed)
+                </button>
+            `;
+        } else {
+            actionBar.innerHTML = `
+                <button class="btn btn-danger" onclick="app.handleFail()">
+                    <span>✖</span> Failed
+                </button>
+                <button class="btn btn-success" onclick="app.handlePass()">
+                    <span>✔</span> Pass
+                </button>
+            `;
         }
     },
 
     skipCase() {
+        if (this.state.offline) this.state.skippedCases.add(this.state.currentCaseId);
         this.showToast("Case skipped");
         this.fetchNextCase();
     },
@@ -825,6 +990,16 @@ const app = {
     },
 
     async submitResult(status, bugDescription = null) {
+        if (this.state.offline) {
+            // Recorded locally and synced in the background; the bug report is generated after sync
+            await offline.record(this.state.currentProject, this.state.currentModule, this.state.offlineCase,
+                status === "Pass" ? "Pass" : "FAILED", bugDescription);
+            this.showToast(status === "Pass" ? "Case Passed" : "Failure saved, report follows after sync");
+            this.fetchNextCase();
+            this.updateSyncStatus();
+            this.scheduleSync();
+            return;
+        }
         try {
             const response = await fetch('/api/submit-result', {
                 method: 'POST',
@@ -933,6 +1108,8 @@ const app = {
         const list = document.getElementById('bugs-list');
         const moduleFilter = document.getElementById('bug-module-filter').value;
 
+        document.getElementById('bug-regenerate-btn').disabled = moduleFilter === 'all';
+
         let filtered = this.state.allBugs;
         if (moduleFilter !== 'all') {
             filtered = filtered.filter(b => b.module === moduleFilter);
@@ -970,6 +1147,44 @@ const app = {
         this.renderBugs();
     },
 
+    async regenerateModuleBugs() {
+        const moduleName = document.getElementById('bug-module-filter').value;
+        if (moduleName === 'all') return;
+        if (!confirm(`Regenerate all bug reports in "${moduleName}" with AI?`)) return;
+
+        const btn = document.getElementById('bug-regenerate-btn');
+        btn.disabled = true;
+        try {
+            const res = await fetch('/api/modules/regenerate-bugs', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ project: this.state.currentProject, module_name: moduleName })
+            });
+            const data = await res.json();
+            if (!res.ok) throw new Error(data.error || `Server Error: ${res.status}`);
+
+            this.showToast(`Regenerating bug reports for "${moduleName}"...`);
+            const job = await this.waitForJob(data.job_id);
+            const failed = job.failed ? `, ${job.failed} failed` : '';
+            this.showToast(`🔁 ${job.done}/${job.total} reports regenerated${failed}`);
+            this.loadBugs();
+        } catch (e) {
+            this.showErrorModal("Regeneration Failed", e.message);
+        } finally {
+            btn.disabled = false;
+        }
+    },
+
+    async waitForJob(jobId) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            const res = await fetch(`/api/jobs/${jobId}`);
+            const job = await res.json();
+            if (!res.ok) throw new Error(job.error || `Server Error: ${res.status}`);
+            if (job.status === 'done' || job.status === 'failed') return job;
+        }
+    },
+
     async deleteBug(caseId) {
         if (!confirm("Are you sure?")) return;
         try {
@@ -991,7 +1206,6 @@ const app = {
         document.getElementById('all-cases-view').style.display = 'block';
         document.getElementById('all-cases-view').classList.add('active');
         this.updateNavState('all-cases-view');
-        this.state.currentPage = 1;
         this.state.selectedCases.clear();
         document.getElementById('case-status-filter').value = 'all';
         document.getElementById('case-module-filter').value = 'all';
@@ -999,152 +1213,239 @@ const app = {
         this.loadAllCases();
     },
 
-    async loadAllCases() {
-        const list = document.getElementById('all-cases-list');
-        list.innerHTML = '<div class="spinner" style="margin: 2rem auto;"></div>';
+    // Virtualized list: only the rows inside the viewport (plus overscan) exist in the DOM.
+    // Rows are absolutely positioned over a spacer sized to the whole result set, pages are
+    // fetched from the server as they scroll into view and row nodes are reused by case id.
+    CASE_ROW_HEIGHT: 168,
+    CASE_PAGE_SIZE: 100,
+    CASE_OVERSCAN: 6,
 
+    caseQuery() {
         const statusFilter = document.getElementById('case-status-filter').value;
-        const statusParam = statusFilter !== 'all' ? `&status=${statusFilter}` : '';
+        const moduleFilter = document.getElementById('case-module-filter').value;
+        let query = `project=${encodeURIComponent(this.state.currentProject)}&limit=${this.CASE_PAGE_SIZE}`;
+        if (statusFilter !== 'all') query += `&status=${encodeURIComponent(statusFilter)}`;
+        if (moduleFilter !== 'all') query += `&module=${encodeURIComponent(moduleFilter)}`;
+        return query;
+    },
 
-        try {
-            const res = await fetch(`/api/cases?project=${this.state.currentProject}&page=${this.state.currentPage}&limit=${this.state.limit}${statusParam}`);
-            const data = await res.json();
+    async loadAllCases() {
+        // Fresh start (view opened, filter changed, bulk action): drop every cached page
+        this.state.caseListGen++;
+        this.state.casePages.clear();
+        this.state.casePagesLoading.clear();
+        this.state.totalCases = 0;
 
-            this.state.totalCases = data.total;
-            this.state.allCasesData = data.cases || [];
+        this.setupCaseViewport();
+        document.getElementById('all-cases-list').scrollTop = 0;
+        this.clearCaseRows();
+        this.setCaseListMessage('<div class="spinner" style="margin: 2rem auto;"></div>');
 
-            // Rebuild module filter - always on fresh project load or if 'all' is selected
-            const moduleFilter = document.getElementById('case-module-filter');
-            const modules = data.all_modules || [];
+        try {
+            await this.fetchCasePage(1, true);
+        } catch (e) {
+            this.setCaseListMessage(`<div style="text-align:center; color: var(--danger);">Error loading cases: ${e.message}</div>`);
+        }
+    },
 
-            const currentVal = moduleFilter.value;
-            moduleFilter.innerHTML = '<option value="all">All Modules</option>' +
-                modules.map(m => `<option value="${m}">${m}</option>`).join('');
+    async fetchCasePage(page, refreshModules = false) {
+        const gen = this.state.caseListGen;
+        if (this.state.casePages.has(page) || this.state.casePagesLoading.has(page)) return;
+        this.state.casePagesLoading.add(page);
 
-            // Restore previous value if it still exists in the new list, otherwise 'all'
-            if (Array.from(moduleFilter.options).some(opt => opt.value === currentVal)) {
-                moduleFilter.value = currentVal;
-            } else {
-                moduleFilter.value = 'all';
-            }
+        try {
+            const res = await fetch(`/api/cases?${this.caseQuery()}&page=${page}`);
+            const data = await res.json();
+            if (gen !== this.state.caseListGen) return; // Filters changed while we were waiting
+            if (!res.ok) throw new Error(data.error || res.statusText);
 
+            this.state.casePages.set(page, data.cases || []);
+            this.state.totalCases = data.total || 0;
+            if (refreshModules) this.updateCaseModuleFilter(data.all_modules || []);
             this.renderCases();
-        } catch (e) {
-            list.innerHTML = `<div style="text-align:center; color: var(--danger);">Error loading cases: ${e.message}</div>`;
+        } finally {
+            if (gen === this.state.caseListGen) this.state.casePagesLoading.delete(page);
         }
     },
 
-    renderCases() {
-        const list = document.getElementById('all-cases-list');
-        const moduleFilter = document.getElementById('case-module-filter').value;
-        const statusFilter = document.getElementById('case-status-filter').value;
+    updateCaseModuleFilter(modules) {
+        const moduleFilter = document.getElementById('case-module-filter');
+        const currentVal = moduleFilter.value;
+        moduleFilter.innerHTML = '<option value="all">All Modules</option>' +
+            modules.map(m => `<option value="${m}">${m}</option>`).join('');
 
-        let filtered = this.state.allCasesData;
-        if (moduleFilter !== 'all') {
-            filtered = filtered.filter(c => c.module === moduleFilter);
-        }
-        // Status filtering is now handled by the server for loadAllCases, 
-        // but we keep this client-side filter here in case module filter is applied locally.
-        if (statusFilter !== 'all') {
-            filtered = filtered.filter(c => c.status === statusFilter);
+        // Restore previous value if it still exists in the new list, otherwise 'all'
+        if (Array.from(moduleFilter.options).some(opt => opt.value === currentVal)) {
+            moduleFilter.value = currentVal;
+        } else {
+            moduleFilter.value = 'all';
         }
+    },
+
+    setupCaseViewport() {
+        const viewport = document.getElementById('all-cases-list');
+        if (viewport.dataset.virtual) return;
+        viewport.dataset.virtual = '1';
+        viewport.classList.add('cases-viewport');
+        viewport.innerHTML = '<div class="cases-spacer"></div><div class="cases-message"></div>';
+
+        // At most one render per frame, however fast the scroll events arrive
+        let ticking = false;
+        viewport.addEventListener('scroll', () => {
+            if (ticking) return;
+            ticking = true;
+            requestAnimationFrame(() => {
+                ticking = false;
+                this.renderCases();
+            });
+        }, { passive: true });
 
+        // One delegated handler instead of inline handlers on every (recycled) row
+        viewport.addEventListener('click', (e) => {
+            const row = e.target.closest('.case-row');
+            if (row && row.dataset.id) this.toggleSelection(Number(row.dataset.id));
+        });
+    },
+
+    setCaseListMessage(html) {
+        const box = document.querySelector('#all-cases-list .cases-message');
+        if (box && box.innerHTML !== html) box.innerHTML = html;
+    },
+
+    clearCaseRows() {
+        this.state.caseRowNodes.forEach(el => el.remove());
+        this.state.caseRowNodes.clear();
+    },
+
+    renderCases() {
+        const viewport = document.getElementById('all-cases-list');
+        const spacer = viewport.querySelector('.cases-spacer');
+        if (!spacer) return;
+
+        const total = this.state.totalCases;
+        const rowHeight = this.CASE_ROW_HEIGHT;
+        spacer.style.height = `${total * rowHeight}px`;
         this.renderPagination();
 
-        list.innerHTML = '';
-        if (filtered.length === 0) {
-            list.innerHTML = '<div style="text-align:center; color: var(--text-secondary);">No cases found.</div>';
+        if (total === 0) {
+            this.clearCaseRows();
+            if (this.state.casePages.size) {
+                this.setCaseListMessage('<div style="text-align:center; color: var(--text-secondary);">No cases found.</div>');
+            }
             return;
         }
+        this.setCaseListMessage('');
+
+        const first = Math.max(0, Math.floor(viewport.scrollTop / rowHeight) - this.CASE_OVERSCAN);
+        const last = Math.min(total - 1, Math.ceil((viewport.scrollTop + viewport.clientHeight) / rowHeight) + this.CASE_OVERSCAN);
+
+        // Which rows should be on screen, keyed by case id (or slot index while the page loads)
+        const wanted = new Map();
+        for (let i = first; i <= last; i++) {
+            const page = Math.floor(i / this.CASE_PAGE_SIZE) + 1;
+            const rows = this.state.casePages.get(page);
+            if (!rows) {
+                this.fetchCasePage(page).catch(e => console.error('Failed to load cases page', page, e));
+                wanted.set(`slot-${i}`, { index: i, c: null });
+                continue;
+            }
+            const c = rows[i % this.CASE_PAGE_SIZE];
+            if (c) wanted.set(`case-${c.id}`, { index: i, c });
+        }
 
-        filtered.forEach(c => {
-            let statusColor = 'var(--text-secondary)';
-            let statusBg = 'rgba(255,255,255,0.05)';
-            if (c.status === 'Pass') { statusColor = 'var(--success)'; statusBg = 'rgba(16, 185, 129, 0.1)'; }
-            if (c.status === 'FAILED') { statusColor = 'var(--danger)'; statusBg = 'rgba(239, 68, 68, 0.1)'; }
-
-            const isSelected = this.state.selectedCases.has(c.id);
+        // Keyed diff: remove rows that left the window, patch the ones that stayed, create the rest
+        const nodes = this.state.caseRowNodes;
+        nodes.forEach((el, key) => {
+            if (!wanted.has(key)) {
+                el.remove();
+                nodes.delete(key);
+            }
+        });
+        wanted.forEach(({ index, c }, key) => {
+            let el = nodes.get(key);
+            if (!el) {
+                el = this.createCaseRow(c);
+                nodes.set(key, el);
+                viewport.appendChild(el);
+            } else if (c) {
+                this.patchCaseRow(el, c);
+            }
+            const transform = `translateY(${index * rowHeight}px)`;
+            if (el.style.transform !== transform) el.style.transform = transform;
+        });
+    },
 
-            const el = document.createElement('div');
-            el.className = `glass-card case-row ${isSelected ? 'selected' : ''}`;
-            if (isSelected) el.style.borderColor = 'var(--accent-primary)';
+    createCaseRow(c) {
+        const el = document.createElement('div');
+        if (!c) {
+            el.className = 'glass-card case-row placeholder';
+            el.innerHTML = '<div class="case-content" style="color: var(--text-secondary);">Loading...</div>';
+            return el;
+        }
 
-            el.innerHTML = `
-            <div style="display:flex; justify-content:space-between; align-items:center; gap: 1rem;">
-                <input type="checkbox" class="case-checkbox" ${isSelected ? 'checked' : ''} onchange="app.toggleSelection(${c.id}, this)">
-                
-                <div style="flex-grow:1" onclick="app.toggleSelection(${c.id})">
+        el.className = 'glass-card case-row';
+        el.dataset.id = c.id;
+        el.innerHTML = `
+            <div style="display:flex; justify-content:space-between; align-items:center; gap: 1rem; height: 100%;">
+                <input type="checkbox" class="case-checkbox">
+                <div style="flex-grow:1; min-width: 0;">
                     <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom: 0.5rem">
                         <div style="font-weight:bold; color: var(--accent-primary); font-size: 0.9rem;">${c.module}</div>
-                        <div style="font-size:0.8rem; padding:0.25rem 0.5rem; border-radius:8px; color:${statusColor}; background:${statusBg}">${c.status}</div>
+                        <div class="case-status" style="font-size:0.8rem; padding:0.25rem 0.5rem; border-radius:8px;"></div>
                     </div>
-                    <div style="font-size:0.95rem;">${c.content}</div>
+                    <div class="case-content">${c.content}</div>
                 </div>
             </div>
             `;
-            list.appendChild(el);
-        });
+        el.title = el.querySelector('.case-content').textContent;
+        this.patchCaseRow(el, c);
+        return el;
+    },
+
+    patchCaseRow(el, c) {
+        // Only touch the DOM when something visible actually changed
+        const isSelected = this.state.selectedCases.has(c.id);
+        const signature = `${c.status}|${isSelected}`;
+        el._case = c;
+        if (el._signature === signature) return;
+        el._signature = signature;
+
+        let statusColor = 'var(--text-secondary)';
+        let statusBg = 'rgba(255,255,255,0.05)';
+        if (c.status === 'Pass') { statusColor = 'var(--success)'; statusBg = 'rgba(16, 185, 129, 0.1)'; }
+        if (c.status === 'FAILED') { statusColor = 'var(--danger)'; statusBg = 'rgba(239, 68, 68, 0.1)'; }
+
+        const badge = el.querySelector('.case-status');
+        badge.innerText = c.status;
+        badge.style.color = statusColor;
+        badge.style.background = statusBg;
+
+        el.classList.toggle('selected', isSelected);
+        el.querySelector('.case-checkbox').checked = isSelected;
     },
 
     filterCases() {
-        this.state.currentPage = 1;
         this.loadAllCases();
     },
 
     renderPagination() {
+        // Pages are loaded while scrolling, so this only shows how many cases match
         const container = document.getElementById('pagination-controls');
-        container.innerHTML = '';
-
-        if (this.state.totalCases === 0) return; // Hide if empty
-        if (this.state.totalCases <= this.state.limit) return; // Hide if only one page
-
-        const totalPages = Math.ceil(this.state.totalCases / this.state.limit);
-
-        // Prev Button
-        const prevBtn = document.createElement('button');
-        prevBtn.innerText = '←';
-        prevBtn.className = 'btn btn-ghost';
-        prevBtn.disabled = this.state.currentPage === 1;
-        prevBtn.onclick = () => this.changePage(-1);
-        container.appendChild(prevBtn);
-
-        // Page Indicator
-        const span = document.createElement('span');
-        span.innerText = `Page ${this.state.currentPage} of ${totalPages}`;
-        span.style.color = 'var(--text-secondary)';
-        container.appendChild(span);
-
-        // Next Button
-        const nextBtn = document.createElement('button');
-        nextBtn.innerText = '→';
-        nextBtn.className = 'btn btn-ghost';
-        nextBtn.disabled = this.state.currentPage >= totalPages;
-        nextBtn.onclick = () => this.changePage(1);
-        container.appendChild(nextBtn);
-    },
-
-    changePage(delta) {
-        this.state.currentPage += delta;
-        this.loadAllCases();
-    },
-
-    toggleSelection(id, checkboxEl = null) {
-        // Handle click on div vs checkbox
-        if (!checkboxEl) {
-            const row = document.querySelector(`.case-checkbox[onchange*="app.toggleSelection(${id}"]`);
-            if (row) {
-                row.checked = !row.checked;
-                checkboxEl = row;
-            }
+        const text = this.state.totalCases > 0 ? `${this.state.totalCases} cases` : '';
+        if (container.innerText !== text) {
+            container.innerText = text;
+            container.style.color = 'var(--text-secondary)';
         }
+    },
 
-        if (checkboxEl && checkboxEl.checked) {
-            this.state.selectedCases.add(id);
-            checkboxEl.closest('.glass-card').style.borderColor = 'var(--accent-primary)';
-        } else if (checkboxEl) {
+    toggleSelection(id) {
+        if (this.state.selectedCases.has(id)) {
             this.state.selectedCases.delete(id);
-            checkboxEl.closest('.glass-card').style.borderColor = 'var(--border-color)';
+        } else {
+            this.state.selectedCases.add(id);
         }
+        const el = this.state.caseRowNodes.get(`case-${id}`);
+        if (el && el._case) this.patchCaseRow(el, el._case);
         this.updateSelectionUI();
     },
 
@@ -1167,7 +1468,10 @@ const app = {
             await fetch('/api/cases/batch/delete', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ case_ids: Array.from(this.state.selectedCases) })
+                body: JSON.stringify({
+                    project: this.state.currentProject,
+                    case_ids: Array.from(this.state.selectedCases)
+                })
             });
             this.showToast("Items deleted");
             this.state.selectedCases.clear();
@@ -1182,6 +1486,7 @@ const app = {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
+                    project: this.state.currentProject,
                     case_ids: Array.from(this.state.selectedCases),
                     status: status
                 })
@@ -1209,7 +1514,6 @@ const app = {
             // Since we are likely on settings page, we don't need to reload cases unless we are there
             // But good practice to reset state
             this.state.totalCases = 0;
-            this.state.currentPage = 1;
         } catch (e) { this.showErrorModal("Wipe Error", "Failed to delete all data."); }
     },
 
@@ -1248,6 +1552,27 @@ const app = {
         document.getElementById('bug-modal').classList.add('open');
     },
 
+    async uploadError(response) {
+        const errorData = await response.json().catch(() => ({}));
+        const message = errorData.error || `Server Error: ${response.status}`;
+        // 429 from the admission layer: rate limit or full AI queue
+        const retry = errorData.retry_after || response.headers.get('Retry-After');
+        return response.status === 429 && retry ? `${message}. Try again in ${retry}s.` : message;
+    },
+
+    uploadSummary(data) {
+        // Re-uploads only regenerate changed sections (see documents.py)
+        const doc = data.document || {};
+        const truncated = data.tokens && data.tokens.truncated ? ' Some sections did not fit the AI budget, upload again to cover them.' : '';
+        if (doc.unchanged) return `No changes since version ${doc.version}, nothing regenerated.`;
+        if (!doc.previous_version) {
+            const rejected = doc.rejected_module ? ` Not treated as a new version of "${doc.rejected_module}": too few of its sections match.` : '';
+            return `${data.count} cases generated.${rejected}${truncated}`;
+        }
+        const obsolete = doc.obsoleted ? `, ${doc.obsoleted} cases obsolete` : '';
+        return `"${doc.matched_module}" v${doc.version}: ${doc.changed} of ${doc.sections_total} sections changed, ${data.count} new cases${obsolete}.${truncated}`;
+    },
+
     showToast(msg, type = 'success') {
         const toast = document.getElementById('toast');
         const msgEl = document.getElementById('toast-msg');
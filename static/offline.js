@@ -0,0 +1,168 @@
+// Offline testing sessions. A module's open cases are downloaded into IndexedDB,
+// Pass/Fail results are recorded there instantly and synced in batches to
+// POST /api/results/batch. Every result carries an idempotency key, so a batch
+// that is resent after a lost response is applied once; the server settles
+// conflicts with results from other testers (see utils.apply_offline_results).
+const offline = {
+    DB_NAME: 'qaflow-offline',
+    SYNC_BATCH: 50,
+    _db: null,
+    _syncing: null,
+
+    supported() {
+        return 'indexedDB' in window;
+    },
+
+    open() {
+        if (this._db) return this._db;
+        this._db = new Promise((resolve, reject) => {
+            const req = indexedDB.open(this.DB_NAME, 1);
+            req.onupgradeneeded = () => {
+                const db = req.result;
+                // key: project|module|case id; "module" index: project|module
+                db.createObjectStore('cases', { keyPath: 'key' }).createIndex('module', 'module');
+                // Results waiting for sync; key is the idempotency key
+                db.createObjectStore('results', { keyPath: 'key' });
+                // Downloaded modules: key project|module
+                db.createObjectStore('modules', { keyPath: 'key' });
+            };
+            req.onsuccess = () => resolve(req.result);
+            req.onerror = () => reject(req.error);
+        });
+        return this._db;
+    },
+
+    // Runs fn(stores...) in one transaction; resolves with fn's result once committed
+    async tx(names, mode, fn) {
+        const db = await this.open();
+        return new Promise((resolve, reject) => {
+            const t = db.transaction(names, mode);
+            let result;
+            Promise.resolve(fn(...names.map(n => t.objectStore(n)))).then(r => { result = r; });
+            t.oncomplete = () => resolve(result);
+            t.onerror = () => reject(t.error);
+            t.onabort = () => reject(t.error);
+        });
+    },
+
+    request(req) {
+        return new Promise((resolve, reject) => {
+            req.onsuccess = () => resolve(req.result);
+            req.onerror = () => reject(req.error);
+        });
+    },
+
+    newKey() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+    },
+
+    moduleKey(project, module) {
+        return `${project}|${module}`;
+    },
+
+    async download(project, module) {
+        const res = await fetch(`/api/offline/cases?project=${encodeURIComponent(project)}&module=${encodeURIComponent(module)}`);
+        const data = await res.json();
+        if (!res.ok) throw new Error(data.error || `Server Error: ${res.status}`);
+        const moduleKey = this.moduleKey(project, module);
+        await this.drop(project, module);
+        await this.tx(['cases', 'modules'], 'readwrite', (cases, modules) => {
+            data.cases.forEach((c, order) => cases.put({ ...c, key: `${moduleKey}|${c.id}`, module: moduleKey, order }));
+            modules.put({ key: moduleKey, project, module, total: data.cases.length, downloadedAt: Date.now() });
+        });
+        return data.cases.length;
+    },
+
+    async isDownloaded(project, module) {
+        if (!this.supported()) return false;
+        const meta = await this.tx(['modules'], 'readonly', modules => this.request(modules.get(this.moduleKey(project, module))));
+        return Boolean(meta);
+    },
+
+    async drop(project, module) {
+        const moduleKey = this.moduleKey(project, module);
+        await this.tx(['cases', 'modules'], 'readwrite', async (cases, modules) => {
+            const keys = await this.request(cases.index('module').getAllKeys(moduleKey));
+            keys.forEach(key => cases.delete(key));
+            modules.delete(moduleKey);
+        });
+    },
+
+    // Next case to test, skipping the ones skipped in this session
+    async nextCase(project, module, skipped) {
+        const all = await this.tx(['cases'], 'readonly',
+            cases => this.request(cases.index('module').getAll(this.moduleKey(project, module))));
+        all.sort((a, b) => a.order - b.order);
+        return all.find(c => !skipped.has(c.id)) || null;
+    },
+
+    async remaining(project, module) {
+        return this.tx(['cases'], 'readonly',
+            cases => this.request(cases.index('module').count(this.moduleKey(project, module))));
+    },
+
+    // The case leaves the local queue and its result joins the sync queue, atomically
+    async record(project, module, testCase, status, observation = null) {
+        await this.tx(['cases', 'results'], 'readwrite', (cases, results) => {
+            cases.delete(testCase.key);
+            results.put({
+                key: this.newKey(), project, case_id: testCase.id, status,
+                base_status: testCase.status, observation, recorded_at: Date.now()
+            });
+        });
+    },
+
+    async pendingCount() {
+        if (!this.supported()) return 0;
+        return this.tx(['results'], 'readonly', results => this.request(results.count()));
+    },
+
+    // Sends queued results, one project and SYNC_BATCH results per request, until the
+    // queue is empty or the network fails. Returns {applied, conflicts, rejected, failed}.
+    sync() {
+        if (this._syncing) return this._syncing;
+        this._syncing = this._sync().finally(() => { this._syncing = null; });
+        return this._syncing;
+    },
+
+    async _sync() {
+        const summary = { applied: 0, conflicts: 0, rejected: 0, failed: false };
+        while (true) {
+            const queued = await this.tx(['results'], 'readonly', results => this.request(results.getAll()));
+            if (queued.length === 0) break;
+            const project = queued[0].project;
+            const batch = queued.filter(r => r.project === project).slice(0, this.SYNC_BATCH);
+            let res;
+            try {
+                res = await fetch('/api/results/batch', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ project, results: batch.map(({ project, ...r }) => r) })
+                });
+            } catch (e) {
+                summary.failed = true;  // offline: keep everything for the next attempt
+                break;
+            }
+            if (res.status === 404) {
+                // Project deleted meanwhile: nothing to sync these results into
+                summary.rejected += batch.length;
+                await this.tx(['results'], 'readwrite', results => batch.forEach(r => results.delete(r.key)));
+                continue;
+            }
+            if (!res.ok) {
+                summary.failed = true;
+                break;
+            }
+            const data = await res.json();
+            for (const r of data.results) {
+                if (r.outcome === 'applied' || r.outcome === 'unchanged' || r.outcome === 'duplicate') summary.applied++;
+                else if (r.outcome === 'conflict') summary.conflicts++;
+                else summary.rejected++;
+            }
+            // Every result got a final answer, conflicts included: drop them from the queue
+            await this.tx(['results'], 'readwrite', results => data.results.forEach(r => results.delete(r.key)));
+        }
+        return summary;
+    }
+};
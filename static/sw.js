@@ -1,30 +1,85 @@
-const CACHE_NAME = 'qaflow-v1';
-const urlsToCache = [
+// Served through GET /sw.js: the server replaces the placeholders below with the
+// current content hashes, so every deploy that changes an asset installs a new worker.
+const SHELL_VERSION = '__SHELL_VERSION__';
+const SHELL_CACHE = `qaflow-shell-${SHELL_VERSION}`;
+const API_CACHE = 'qaflow-api';
+const SHELL_ASSETS = [
     '/',
-    '/static/style.css',
-    '/static/app.js',
-    '/static/manifest.json'
+    /* __SHELL_ASSETS__ */
 ];
 
 self.addEventListener('install', event => {
     event.waitUntil(
-        caches.open(CACHE_NAME)
-            .then(cache => {
-                console.log('Opened cache');
-                return cache.addAll(urlsToCache);
-            })
+        caches.open(SHELL_CACHE)
+            .then(cache => cache.addAll(SHELL_ASSETS))
+            .then(() => self.skipWaiting())
     );
 });
 
-self.addEventListener('fetch', event => {
-    event.respondWith(
-        caches.match(event.request)
-            .then(response => {
-                // Cache hit - return response
-                if (response) {
-                    return response;
-                }
-                return fetch(event.request);
-            })
+self.addEventListener('activate', event => {
+    // Drop shells of previous versions (including the old unversioned 'qaflow-v1')
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(
+                keys.filter(key => key !== SHELL_CACHE && key !== API_CACHE).map(key => caches.delete(key))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+// Hashed assets (?v=...) never change: serve from cache, fetch once if missing
+function cacheFirst(request) {
+    return caches.open(SHELL_CACHE).then(cache =>
+        cache.match(request).then(cached => cached || fetch(request).then(response => {
+            if (response.ok) cache.put(request, response.clone());
+            return response;
+        }))
+    );
+}
+
+// App shell: answer instantly from cache and refresh it in the background
+function staleWhileRevalidate(request, event) {
+    return caches.open(SHELL_CACHE).then(cache =>
+        cache.match(request).then(cached => {
+            const network = fetch(request).then(response => {
+                if (response.ok) cache.put(request, response.clone());
+                return response;
+            });
+            if (cached) {
+                event.waitUntil(network.catch(() => null));
+                return cached;
+            }
+            return network;
+        })
     );
+}
+
+// API reads must reflect the latest writes, so go to the network first. The server
+// answers 304 via ETag when nothing changed, which makes revalidation almost free;
+// the cached copy is only used when offline.
+function networkFirst(request) {
+    return caches.open(API_CACHE).then(cache =>
+        fetch(request).then(response => {
+            if (response.ok) cache.put(request, response.clone());
+            return response;
+        }).catch(() => cache.match(request).then(cached => cached || Promise.reject(new Error('offline'))))
+    );
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (url.pathname.startsWith('/api/')) {
+        // Downloads (CSV export) and search are not worth keeping offline
+        if (url.pathname.startsWith('/api/export') || url.pathname.startsWith('/api/search')) return;
+        event.respondWith(networkFirst(request));
+    } else if (url.pathname.startsWith('/static/') && url.searchParams.has('v')) {
+        event.respondWith(cacheFirst(request));
+    } else {
+        event.respondWith(staleWhileRevalidate(request, event));
+    }
 });
@@ -0,0 +1,279 @@
+"""Outbound Telegram messages: per-chat and global rate budgets, edit coalescing, retry_after.
+
+    outbox = telegram_outbox.Outbox(bot)
+    status = await outbox.answer(message, "⏳ ...")      # waits for the sent Message
+    outbox.edit(status, "📖 ...")                         # queued; no need to wait
+
+Telegram answers 429 with retry_after once a bot sends more than about one
+message per second to a chat, 20 a minute to a group or 30 a second in
+total. The bot handlers used to call the Bot API directly, so the quick
+series of status edits of an upload or a bug report, times many chats, ran
+into flood control, and the handler that got the 429 stalled or failed.
+
+Every call goes into its chat's queue and one dispatcher task sends it, in
+order, as soon as both the chat's and the global token bucket allow. Chats
+are served least recently served first, so one busy chat can't starve the
+rest. A new edit of a message that still has an edit of the same kind
+waiting replaces that edit in place: only the latest status goes out and
+both callers get its result. A 429 puts the call back at the head of its
+queue and pauses the chat for retry_after seconds; network and server
+errors are retried with backoff. Handlers never see either unless the
+retries run out.
+
+Configuration (<messages>/<seconds>:<burst>):
+    QAFLOW_TG_GLOBAL_RATE="30/1:30"   whole bot
+    QAFLOW_TG_CHAT_RATE="1/1:3"       private chats
+    QAFLOW_TG_GROUP_RATE="20/60:3"    groups (negative chat ids)
+    QAFLOW_TG_MAX_RETRIES=5
+
+benchmarks/telegram_load.py runs many chats against a fake Bot API server
+(benchmarks/fake_telegram.py) with and without the outbox.
+"""
+import asyncio
+import collections
+import os
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+MAX_RETRIES = int(os.getenv("QAFLOW_TG_MAX_RETRIES", "5"))
+
+# First wait after a network/server error; doubled on every further attempt
+ERROR_BACKOFF_SECONDS = 1.0
+
+
+def parse_rate(spec):
+    """'20/60:3' -> (messages per second, burst)"""
+    amount, _, rest = spec.partition("/")
+    seconds, _, burst = rest.partition(":")
+    return float(amount) / float(seconds or 1), float(burst) if burst else max(1.0, float(amount))
+
+
+GLOBAL_RATE = parse_rate(os.getenv("QAFLOW_TG_GLOBAL_RATE", "30/1:30"))
+CHAT_RATE = parse_rate(os.getenv("QAFLOW_TG_CHAT_RATE", "1/1:3"))
+GROUP_RATE = parse_rate(os.getenv("QAFLOW_TG_GROUP_RATE", "20/60:3"))
+
+
+class _Bucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.updated = burst, now
+
+    def wait(self, now):
+        """Seconds until a token is available (0: now)"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class _Chat:
+    __slots__ = ("queue", "bucket", "paused_until", "busy")
+
+    def __init__(self, rate, now):
+        self.queue = collections.deque()
+        self.bucket = _Bucket(*rate, now)
+        self.paused_until = 0.0
+        self.busy = False
+
+
+class _Call:
+    __slots__ = ("method", "kwargs", "key", "futures", "attempts")
+
+    def __init__(self, method, kwargs, key, future):
+        self.method, self.kwargs, self.key = method, kwargs, key
+        self.futures = [future]
+        self.attempts = 0
+
+    def resolve(self, result=None, error=None):
+        for future in self.futures:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def _retrieved(future):
+    # Fire-and-forget callers never await: don't let asyncio warn about their errors
+    if not future.cancelled():
+        future.exception()
+
+
+class Outbox:
+    """Rate-limited, coalescing queue in front of an aiogram Bot"""
+
+    def __init__(self, bot, global_rate=None, chat_rate=None, group_rate=None, max_retries=None):
+        self.bot = bot
+        self.chat_rate = chat_rate or CHAT_RATE
+        self.group_rate = group_rate or GROUP_RATE
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self._global = _Bucket(*(global_rate or GLOBAL_RATE), time.monotonic())
+        # Least recently served first
+        self._chats = collections.OrderedDict()
+        # (chat, message, method) -> queued edit, for coalescing
+        self._edits = {}
+        self._wakeup = None
+        self._task = None
+        # Calls being sent (the event loop keeps only weak references to tasks)
+        self._sending = set()
+        self.stats = collections.Counter()
+
+    # --- Bot API calls (same names and arguments as aiogram.Bot) ---
+    def send_message(self, chat_id, text, **kwargs):
+        return self._submit(chat_id, "send_message", dict(chat_id=chat_id, text=text, **kwargs))
+
+    def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        return self._submit(chat_id, "edit_message_text",
+                            dict(chat_id=chat_id, message_id=message_id, text=text, **kwargs), coalesce=True)
+
+    def edit_message_reply_markup(self, chat_id, message_id, reply_markup=None):
+        return self._submit(chat_id, "edit_message_reply_markup",
+                            dict(chat_id=chat_id, message_id=message_id, reply_markup=reply_markup), coalesce=True)
+
+    def delete_message(self, chat_id, message_id):
+        return self._submit(chat_id, "delete_message", dict(chat_id=chat_id, message_id=message_id))
+
+    # --- Shortcuts for handlers ---
+    def answer(self, message, text, **kwargs):
+        return self.send_message(message.chat.id, text, **kwargs)
+
+    def edit(self, message, text, **kwargs):
+        return self.edit_message_text(message.chat.id, message.message_id, text, **kwargs)
+
+    def _submit(self, chat_id, method, kwargs, coalesce=False):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        future = loop.create_future()
+        future.add_done_callback(_retrieved)
+        self.stats["queued"] += 1
+        key = (chat_id, kwargs["message_id"], method) if coalesce else None
+        pending = self._edits.get(key) if key else None
+        if pending is not None:
+            # Still waiting to go out: send the newest content in its place
+            pending.kwargs = kwargs
+            pending.futures.append(future)
+            self.stats["coalesced"] += 1
+            return future
+        call = _Call(method, kwargs, key, future)
+        if key:
+            self._edits[key] = call
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(self.group_rate if chat_id < 0 else self.chat_rate, time.monotonic())
+        chat.queue.append(call)
+        self._wakeup.set()
+        return future
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            wait = self._dispatch(time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, now):
+        """Starts every call that may go now; returns seconds until the next one may (None: nothing queued)"""
+        wait = None
+        served = []
+        for chat_id, chat in list(self._chats.items()):
+            if chat.busy:
+                continue
+            if not chat.queue:
+                if now >= chat.paused_until and chat.bucket.full(now):
+                    del self._chats[chat_id]
+                continue
+            delay = max(chat.paused_until - now, chat.bucket.wait(now))
+            if delay <= 0:
+                delay = self._global.wait(now)
+                if delay > 0:
+                    # Out of global budget: nobody else may send either
+                    wait = delay if wait is None else min(wait, delay)
+                    break
+                chat.bucket.take()
+                self._global.take()
+                call = chat.queue.popleft()
+                if call.key:
+                    del self._edits[call.key]
+                chat.busy = True
+                served.append(chat_id)
+                task = asyncio.get_running_loop().create_task(self._send(chat_id, chat, call))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+                continue
+            wait = delay if wait is None else min(wait, delay)
+        for chat_id in served:
+            self._chats.move_to_end(chat_id)
+        return wait
+
+    async def _send(self, chat_id, chat, call):
+        call.attempts += 1
+        try:
+            result = await getattr(self.bot, call.method)(**call.kwargs)
+        except TelegramRetryAfter as e:
+            self.stats["retry_after"] += 1
+            chat.paused_until = max(chat.paused_until, time.monotonic() + e.retry_after)
+            self._retry(chat_id, chat, call, e)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            self.stats["errors_retried"] += 1
+            chat.paused_until = max(chat.paused_until,
+                                    time.monotonic() + ERROR_BACKOFF_SECONDS * 2 ** (call.attempts - 1))
+            self._retry(chat_id, chat, call, e)
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                # The message already shows this text: what the caller wanted
+                self.stats["sent"] += 1
+                call.resolve(True)
+            else:
+                self._fail(call, e)
+        except Exception as e:
+            self._fail(call, e)
+        else:
+            self.stats["sent"] += 1
+            call.resolve(result)
+        finally:
+            chat.busy = False
+            self._wakeup.set()
+
+    def _retry(self, chat_id, chat, call, error):
+        if call.attempts > self.max_retries:
+            self._fail(call, error)
+            return
+        newer = self._edits.get(call.key) if call.key else None
+        if newer is not None:
+            # A newer edit of the same message is queued already: it answers for this one too
+            newer.futures.extend(call.futures)
+            return
+        if call.key:
+            self._edits[call.key] = call
+        chat.queue.appendleft(call)
+
+    def _fail(self, call, error):
+        self.stats["failed"] += 1
+        print(f"❌ Telegram {call.method} to chat {call.kwargs.get('chat_id')} failed: {error}")
+        call.resolve(error=error)
+
+    def status(self):
+        return {"chats": len(self._chats), "queued": sum(len(chat.queue) for chat in self._chats.values()),
+                **self.stats}
+
+    async def drain(self, timeout=None):
+        """Wait until everything queued so far has been sent (or has failed)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while any(chat.queue or chat.busy for chat in self._chats.values()):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
@@ -1,44 +1,364 @@
-import sqlite3
+import json
 import os
-import docx
-import textract
-from bs4 import BeautifulSoup
-from datetime import datetime
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+import case_schema
+import db
 
-# Database Configuration
-DB_NAME = "database.db"
+# docx, textract та bs4 імпортуються всередині read_* функцій: вони важкі,
+# а потрібні лише під час завантаження документа, не при старті воркера.
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS projects (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+# Database Configuration (see db.py for QAFLOW_DATABASE_URL / PostgreSQL)
+DB_NAME = os.getenv("QAFLOW_DB_PATH", "database.db")
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = db.create_backend(os.getenv("QAFLOW_DATABASE_URL") or DB_NAME)
+    return _backend
+
+def configure_database(url):
+    """Switch storage to ``url`` (a SQLite path, sqlite:///path or postgresql://...)"""
+    global _backend, DB_NAME
+    if _backend is not None:
+        _backend.dispose()
+    _backend = db.create_backend(url)
+    if _backend.dialect == "sqlite":
+        DB_NAME = _backend.path
+
+# Schema. {id_column} and {blob_type} are filled in per backend (see db.Backend).
+# Children reference their parents with ON DELETE CASCADE, so deleting a project
+# or module removes everything under it in one statement.
+TABLES = {
+    "projects": '''CREATE TABLE IF NOT EXISTS {name} (
+                    id {id_column},
                     name TEXT UNIQUE NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS modules (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                )''',
+    "modules": '''CREATE TABLE IF NOT EXISTS {name} (
+                    id {id_column},
                     project_id INTEGER,
                     name TEXT,
-                    FOREIGN KEY(project_id) REFERENCES projects(id),
+                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE,
                     UNIQUE(project_id, name)
-                )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS test_cases (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                )''',
+    "test_cases": '''CREATE TABLE IF NOT EXISTS {name} (
+                    id {id_column},
                     module_id INTEGER,
                     content TEXT,
                     status TEXT DEFAULT 'PENDING',
                     bug_report TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(module_id) REFERENCES modules(id)
-                )''')
+                    bug_observation TEXT,
+                    section_key TEXT,
+                    steps TEXT,
+                    expected_result TEXT,
+                    priority DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    fail_count INTEGER NOT NULL DEFAULT 0,
+                    FOREIGN KEY(module_id) REFERENCES modules(id) ON DELETE CASCADE
+                )''',
+    # Per-project data version, bumped on every write; used for HTTP ETags
+    "project_versions": '''CREATE TABLE IF NOT EXISTS {name} (
+                    project_id INTEGER PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP,
+                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+                )''',
+    # Generated bug reports by (case content, tester observation); see bug_reports.py
+    "bug_report_cache": '''CREATE TABLE IF NOT EXISTS {name} (
+                    project_id INTEGER NOT NULL,
+                    cache_key TEXT NOT NULL,
+                    report TEXT NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY(project_id, cache_key),
+                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+                )''',
+    # Requirement document versions per module; see documents.py
+    "module_documents": '''CREATE TABLE IF NOT EXISTS {name} (
+                    id {id_column},
+                    module_id INTEGER NOT NULL,
+                    version INTEGER NOT NULL,
+                    filename TEXT,
+                    content TEXT NOT NULL,
+                    sections TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(module_id, version),
+                    FOREIGN KEY(module_id) REFERENCES modules(id) ON DELETE CASCADE
+                )''',
+    # Finished modules moved out of the live tables: cases and documents as
+    # zlib-compressed JSON, restorable on demand (archive_module / restore_archived_module)
+    "archived_modules": '''CREATE TABLE IF NOT EXISTS {name} (
+                    id {id_column},
+                    project_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    cases INTEGER NOT NULL,
+                    passed INTEGER NOT NULL,
+                    failed INTEGER NOT NULL,
+                    raw_bytes INTEGER NOT NULL,
+                    payload {blob_type} NOT NULL,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+                )''',
+    # Idempotency keys of results synced from offline sessions (apply_offline_results)
+    "result_submissions": '''CREATE TABLE IF NOT EXISTS {name} (
+                    idempotency_key TEXT PRIMARY KEY,
+                    project_id INTEGER NOT NULL,
+                    case_id INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    outcome TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+                )''',
+    # Last run of each scheduled maintenance task; see maintenance.py
+    "maintenance_runs": '''CREATE TABLE IF NOT EXISTS {name} (
+                    task TEXT PRIMARY KEY,
+                    last_run DOUBLE PRECISION NOT NULL,
+                    detail TEXT
+                )''',
+    # API requests over the slow threshold or explicitly profiled; see profiling.py.
+    # stages/queries are JSON, samples is folded stacks ("a;b;c count" per line).
+    "slow_requests": '''CREATE TABLE IF NOT EXISTS {name} (
+                    id {id_column},
+                    method TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    query TEXT,
+                    status INTEGER,
+                    total_ms REAL NOT NULL,
+                    stages TEXT NOT NULL,
+                    queries TEXT NOT NULL,
+                    samples TEXT,
+                    profiled INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )''',
+    # One row, bumped whenever a project or module is created or deleted; tells the
+    # other worker processes to drop their name -> id cache (see _project_id)
+    "catalog_version": '''CREATE TABLE IF NOT EXISTS {name} (
+                    id INTEGER PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )''',
+    # Background jobs (bulk bug report regeneration); any worker process can report progress
+    "jobs": '''CREATE TABLE IF NOT EXISTS {name} (
+                    id TEXT PRIMARY KEY,
+                    project_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    total INTEGER NOT NULL DEFAULT 0,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    detail TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE
+                )''',
+}
+
+# (table, column, type) added after the table first shipped
+ADDED_COLUMNS = [
+    ("test_cases", "bug_observation", "TEXT"),
+    ("test_cases", "section_key", "TEXT"),
+    ("project_versions", "updated_at", "TIMESTAMP"),
+    # Typed cases (case_schema): steps one per line; rows from before stay NULL, content has it all
+    ("test_cases", "steps", "TEXT"),
+    ("test_cases", "expected_result", "TEXT"),
+    # Risk-based order (case_priority): higher priority is served first; fail_count is
+    # how often the case was marked FAILED, kept across retests
+    ("test_cases", "priority", "DOUBLE PRECISION NOT NULL DEFAULT 0"),
+    ("test_cases", "fail_count", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+# Run once, right after the column is added: fill it in for existing rows
+COLUMN_BACKFILLS = {
+    ("test_cases", "fail_count"): "UPDATE test_cases SET fail_count = 1 WHERE status = 'FAILED'",
+}
+
+# (table, column, parent) foreign keys that must cascade on delete
+CASCADES = [
+    ("modules", "project_id", "projects"),
+    ("test_cases", "module_id", "modules"),
+    ("project_versions", "project_id", "projects"),
+    ("bug_report_cache", "project_id", "projects"),
+    ("jobs", "project_id", "projects"),
+    ("module_documents", "module_id", "modules"),
+    ("archived_modules", "project_id", "projects"),
+    ("result_submissions", "project_id", "projects"),
+]
+
+def table_ddl(table, name=None):
+    backend = get_backend()
+    return TABLES[table].format(name=name or table, id_column=backend.id_column, blob_type=backend.blob_type)
+
+def init_db():
+    conn = get_db_connection()
+    c = conn.cursor()
+    for table in TABLES:
+        c.execute(table_ddl(table))
+    c.execute("INSERT INTO catalog_version (id, version) VALUES (1, 0) ON CONFLICT(id) DO NOTHING")
+    conn.commit()
+    _migrate_columns(conn)
+    _migrate_cascades(conn)
+    # Module/status filters on /api/cases look cases up by module; the testing flow
+    # takes the first entry in (priority DESC, id) order of a module's PENDING cases.
+    # Supersedes the (module_id, status) index, which is its prefix.
+    c = conn.cursor()
+    c.execute("CREATE INDEX IF NOT EXISTS idx_test_cases_next ON test_cases(module_id, status, priority DESC, id)")
+    c.execute("DROP INDEX IF EXISTS idx_test_cases_module_status")
     conn.commit()
     conn.close()
 
+def _migrate_columns(conn):
+    backend = get_backend()
+    for table, column, column_type in ADDED_COLUMNS:
+        if column not in backend.table_columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            if (table, column) in COLUMN_BACKFILLS:
+                conn.execute(COLUMN_BACKFILLS[table, column])
+            conn.commit()
+            print(f"DB migration: added {table}.{column}")
+
+def _migrate_cascades(conn):
+    """Databases created before ON DELETE CASCADE: rebuild their foreign keys in place"""
+    backend = get_backend()
+    for table, column, parent in CASCADES:
+        if backend.foreign_key_rules(conn, table).get(column) != "CASCADE":
+            dropped = backend.rebuild_foreign_key(conn, table, column, parent, table_ddl(table, f"{table}__new"))
+            print(f"DB migration: {table}.{column} -> {parent} now ON DELETE CASCADE"
+                  + (f" ({dropped} orphaned rows removed)" if dropped else ""))
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Pooled connection from the configured backend; close() returns it to the pool"""
+    return get_backend().connect()
+
+def warmup():
+    """Fill the connection pool and touch the schema so the first real request
+    doesn't pay for connecting"""
+    get_backend().warmup()
+    conn = get_db_connection()
+    conn.execute("SELECT id FROM projects LIMIT 1").fetchone()
+    conn.close()
+
+# --- Name resolution cache ---
+# Callers name projects and modules; queries want ids. Resolved ids are kept per
+# process, so the hot reads (stats, next case, case lists, ETags) skip the
+# lookup or join. Only hits are cached: a name created elsewhere is simply
+# looked up again. Writers resolve names inside their own transaction, never
+# from here, and call _names_changed() when they create or delete a project or
+# module; the other workers notice the new catalog_version within
+# NAME_CACHE_CHECK_SECONDS. Until then a stale id matches no rows (project and
+# module ids are never reused), it can't point at someone else's data.
+# Whole-project aggregates (module stats, bug list) keep joining by name: the
+# lookup is nothing next to the aggregate, and with a literal project id
+# PostgreSQL tends to trade the per-module index scans for a full table scan.
+NAME_CACHE_CHECK_SECONDS = float(os.getenv("QAFLOW_NAME_CACHE_SECONDS", "1"))
+NAME_CACHE_MAX = 10000
+
+_name_lock = threading.Lock()
+_project_ids = {}
+_module_ids = {}
+_names_version = None
+_names_checked = 0.0
+
+def _check_names_version(conn):
+    global _names_version, _names_checked
+    now = time.monotonic()
+    if now - _names_checked < NAME_CACHE_CHECK_SECONDS:
+        return
+    row = conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()
+    with _name_lock:
+        version = row[0] if row else 0
+        if version != _names_version:
+            _project_ids.clear()
+            _module_ids.clear()
+            _names_version = version
+        _names_checked = now
+
+def _remember(cache, key, value):
+    with _name_lock:
+        if len(cache) >= NAME_CACHE_MAX:
+            cache.clear()
+        cache[key] = value
+
+def _project_id(conn, project_name):
+    """Cached id of a project, or None"""
+    _check_names_version(conn)
+    project_id = _project_ids.get(project_name)
+    if project_id is None:
+        row = conn.execute("SELECT id FROM projects WHERE name = ?", (project_name,)).fetchone()
+        if row is None:
+            return None
+        project_id = row[0]
+        _remember(_project_ids, project_name, project_id)
+    return project_id
+
+def _module_id(conn, project_name, module_name):
+    """Cached id of a project's module, or None"""
+    project_id = _project_id(conn, project_name)
+    if project_id is None:
+        return None
+    module_id = _module_ids.get((project_id, module_name))
+    if module_id is None:
+        row = conn.execute("SELECT id FROM modules WHERE project_id = ? AND name = ?",
+                           (project_id, module_name)).fetchone()
+        if row is None:
+            return None
+        module_id = row[0]
+        _remember(_module_ids, (project_id, module_name), module_id)
+    return module_id
+
+def _names_changed(conn):
+    """Call in a transaction that creates or deletes projects or modules, and
+    _forget_names() once it is committed"""
+    conn.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+
+def _forget_names():
+    with _name_lock:
+        _project_ids.clear()
+        _module_ids.clear()
+
+# --- Data Versions (HTTP cache validation) ---
+def _bump_project_version(conn, project_id):
+    conn.execute("""
+        INSERT INTO project_versions (project_id, version, updated_at) VALUES (?, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT(project_id) DO UPDATE SET version = project_versions.version + 1, updated_at = CURRENT_TIMESTAMP
+    """, (project_id,))
+
+# Bound parameters per statement. Old SQLite builds cap a statement at 999.
+SQL_CHUNK_SIZE = 500
+
+def _chunks(ids, size=SQL_CHUNK_SIZE):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+def _bump_versions_for_cases(conn, case_ids):
+    """Bump every project owning one of case_ids. Call before deleting the cases."""
+    project_ids = set()
+    for chunk in _chunks(case_ids):
+        placeholders = ','.join(['?'] * len(chunk))
+        rows = conn.execute(f"""
+            SELECT DISTINCT m.project_id
+            FROM test_cases t
+            JOIN modules m ON t.module_id = m.id
+            WHERE t.id IN ({placeholders})
+        """, tuple(chunk)).fetchall()
+        project_ids.update(row[0] for row in rows)
+    for project_id in project_ids:
+        _bump_project_version(conn, project_id)
+
+def get_project_version(project_name):
+    """Returns (project_id, version) or None if the project doesn't exist"""
+    conn = get_db_connection()
+    project_id = _project_id(conn, project_name)
+    row = None
+    if project_id is not None:
+        row = conn.execute("SELECT version FROM project_versions WHERE project_id = ?", (project_id,)).fetchone()
+    conn.close()
+    if project_id is None:
+        return None
+    return project_id, row['version'] if row else 0
 
 # --- Project Management ---
 def get_all_projects():
@@ -47,8 +367,9 @@ def get_all_projects():
         # Try with created_at first
         rows = conn.execute("SELECT name, created_at FROM projects ORDER BY id DESC").fetchall()
         result = [{"name": row["name"], "created_at": row["created_at"]} for row in rows]
-    except:
+    except Exception:
         # Fallback for old databases without created_at
+        conn.rollback()
         rows = conn.execute("SELECT name FROM projects ORDER BY id DESC").fetchall()
         result = [{"name": row["name"], "created_at": None} for row in rows]
     conn.close()
@@ -57,10 +378,13 @@ def get_all_projects():
 def create_project(name):
     conn = get_db_connection()
     try:
-        conn.execute("INSERT INTO projects (name) VALUES (?)", (name,))
+        project_id = conn.execute("INSERT INTO projects (name) VALUES (?) RETURNING id", (name,)).fetchone()[0]
+        _bump_project_version(conn, project_id)
+        _names_changed(conn)
         conn.commit()
+        _forget_names()
         return True
-    except sqlite3.IntegrityError:
+    except get_backend().IntegrityError:
         return False  # Project already exists
     finally:
         conn.close()
@@ -74,34 +398,28 @@ def delete_project(name):
         conn.close()
         return False
     
-    proj_id = proj['id']
-    
-    # Cascade delete: test_cases -> modules -> project
-    c.execute("DELETE FROM test_cases WHERE module_id IN (SELECT id FROM modules WHERE project_id = ?)", (proj_id,))
-    c.execute("DELETE FROM modules WHERE project_id = ?", (proj_id,))
-    c.execute("DELETE FROM projects WHERE id = ?", (proj_id,))
+    # Modules, their cases and the version row go with it (ON DELETE CASCADE)
+    c.execute("DELETE FROM projects WHERE id = ?", (proj['id'],))
+    _names_changed(conn)
     
     # Reset auto-increment if no cases left
     c.execute("SELECT COUNT(*) FROM test_cases")
     if c.fetchone()[0] == 0:
-        c.execute("DELETE FROM sqlite_sequence WHERE name='test_cases'")
+        get_backend().reset_sequence(conn, 'test_cases')
     
     conn.commit()
     conn.close()
+    _forget_names()
     return True
 
 def get_project_stats(project_name):
     """Get statistics for a project"""
     conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT id FROM projects WHERE name = ?", (project_name,))
-    proj = c.fetchone()
-    if not proj:
+    proj_id = _project_id(conn, project_name)
+    if proj_id is None:
         conn.close()
         return None
     
-    proj_id = proj['id']
-    
     stats = conn.execute("""
         SELECT 
             COUNT(t.id) as total,
@@ -110,7 +428,7 @@ def get_project_stats(project_name):
             SUM(CASE WHEN t.status = 'PENDING' THEN 1 ELSE 0 END) as pending
         FROM test_cases t
         JOIN modules m ON t.module_id = m.id
-        WHERE m.project_id = ?
+        WHERE m.project_id = ? AND t.status != 'OBSOLETE'
     """, (proj_id,)).fetchone()
     
     module_count = conn.execute("""
@@ -128,33 +446,67 @@ def get_project_stats(project_name):
     }
 
 # --- Document Reading ---
+def _heading_prefix(style_name):
+    # Headings become markdown "#" lines: section boundaries for documents.split_sections
+    if style_name == "Title":
+        return "# "
+    if style_name.startswith("Heading "):
+        level = style_name[len("Heading "):]
+        if level.isdigit():
+            return "#" * min(int(level), 6) + " "
+    return ""
+
 def read_docx(file_path):
+    import docx
     doc = docx.Document(file_path)
     full_text = []
     # Read Paragraphs
     for paragraph in doc.paragraphs:
         if paragraph.text.strip():
-            full_text.append(paragraph.text)
+            full_text.append(_heading_prefix(paragraph.style.name if paragraph.style else "") + paragraph.text)
     
     # Read Tables (crucial for requirements in tables)
     for table in doc.tables:
         for row in table.rows:
-            row_text = [cell.text.strip() for cell in row.cells if cell.text.strip()]
-            if row_text:
-                full_text.append(" | ".join(row_text))
+            # A merged cell comes back once per grid column it spans: keep it once. Empty cells stay,
+            # so the columns line up with the header row.
+            cells, seen = [], set()
+            for cell in row.cells:
+                if id(cell._tc) not in seen:
+                    seen.add(id(cell._tc))
+                    cells.append(cell.text.strip())
+            if any(cells):
+                full_text.append(" | ".join(cells))
                 
     return "\n".join(full_text)
 
+def _mime_html(content):
+    """HTML part of a MIME "Export to Word" file (Confluence), decoded from quoted-printable"""
+    import email
+    message = email.message_from_string(content)
+    for part in message.walk():
+        if part.get_content_type() == "text/html":
+            payload = part.get_payload(decode=True) or b""
+            return payload.decode(part.get_content_charset() or "utf-8", errors="ignore")
+    return None
+
 def read_doc(file_path):
     try:
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
             content = f.read()
+        if "MIME-Version" in content:
+            # Без декодування в промпт йшли =D0=BE-послідовності та base64 картинок
+            content = _mime_html(content) or content
         if "<html" in content or "MIME-Version" in content:
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(content, 'html.parser')
             for script in soup(["script", "style", "meta", "link", "xml"]):
                 script.decompose()
+            for heading in soup(["h1", "h2", "h3", "h4", "h5", "h6"]):
+                heading.string = "#" * int(heading.name[1]) + " " + heading.get_text(" ", strip=True)
             text = soup.get_text(separator='\n')
             return "\n".join([line.strip() for line in text.splitlines() if line.strip()])
+        import textract
         text = textract.process(file_path).decode('utf-8')
         return text
     except Exception as e:
@@ -171,55 +523,45 @@ def read_txt(file_path):
             return f.read()
 
 # --- Database Operations ---
-def add_cases(cases_list, module_name, project_name="togetherfun"):
+def _case_rows(module_id, cases_list, section_keys):
+    """test_cases rows for generated cases (case_schema models, dicts or text); unusable ones are left out"""
+    rows = []
+    for case, key in zip(cases_list, section_keys or [None] * len(cases_list)):
+        stored = case_schema.columns(case)
+        if stored is not None:
+            rows.append((module_id, *stored, key))
+    return rows
+
+def _split_steps(steps):
+    # None for cases stored before the steps column: the client reads them from content
+    return steps.split("\n") if steps else None
+
+def _get_or_create_project_id(conn, project_name):
+    row = conn.execute("SELECT id FROM projects WHERE name = ?", (project_name,)).fetchone()
+    if row:
+        return row[0]
+    _names_changed(conn)
+    return conn.execute("INSERT INTO projects (name) VALUES (?) RETURNING id", (project_name,)).fetchone()[0]
+
+def _insert_cases(conn, module_id, cases_list, section_keys=None):
+    """Returns the number of cases stored"""
+    rows = _case_rows(module_id, cases_list, section_keys)
+    conn.executemany("""
+        INSERT INTO test_cases (module_id, content, steps, expected_result, status, section_key)
+        VALUES (?, ?, ?, ?, 'PENDING', ?)
+    """, rows)
+    return len(rows)
+
+def add_cases(cases_list, module_name, project_name="togetherfun", section_keys=None):
+    """section_keys: optional list parallel to cases_list, the document section each case was written for"""
     conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT id FROM projects WHERE name = ?", (project_name,))
-    project = c.fetchone()
-    if not project:
-        c.execute("INSERT INTO projects (name) VALUES (?)", (project_name,))
-        project_id = c.lastrowid
-    else:
-        project_id = project['id']
-    
-    c.execute("SELECT id FROM modules WHERE project_id = ? AND name = ?", (project_id, module_name))
-    module = c.fetchone()
-    if not module:
-        c.execute("INSERT INTO modules (project_id, name) VALUES (?, ?)", (project_id, module_name))
-        module_id = c.lastrowid
-    else:
-        module_id = module['id']
-    
-    for case in cases_list:
-        content = case
-        
-        # Check if case is a string that looks like a dict/JSON
-        if isinstance(case, str) and case.strip().startswith('{') and case.strip().endswith('}'):
-            try:
-                import ast
-                # ast.literal_eval is safer than eval for stringified dicts
-                parsed = ast.literal_eval(case)
-                if isinstance(parsed, dict):
-                    case = parsed
-            except:
-                pass
-
-        if isinstance(case, dict):
-            # Try various keys the AI might use
-            steps = case.get("steps") or case.get("description") or case.get("content") or case.get("text")
-            result = case.get("result") or case.get("expected_result") or case.get("expected")
-            
-            if steps and result:
-                content = f"Кроки: {steps} <br> Очікуваний результат: {result}"
-            elif steps:
-                content = steps
-            else:
-                content = str(case)
-        
-        c.execute("INSERT INTO test_cases (module_id, content, status) VALUES (?, ?, 'PENDING')",
-                  (module_id, content))
+    project_id = _get_or_create_project_id(conn, project_name)
+    module_id = _get_or_create_module(conn, project_id, module_name)
+    _insert_cases(conn, module_id, cases_list, section_keys)
+    _bump_project_version(conn, project_id)
     conn.commit()
     conn.close()
+    _forget_names()
 
 def get_unique_pending_modules(project_name="togetherfun"):
     conn = get_db_connection()
@@ -229,13 +571,22 @@ def get_unique_pending_modules(project_name="togetherfun"):
         JOIN test_cases t ON m.id = t.module_id
         JOIN projects p ON m.project_id = p.id
         WHERE p.name = ? AND t.status = 'PENDING'
-        GROUP BY m.name
+        GROUP BY m.id, m.name
         ORDER BY m.id DESC
     """
     rows = conn.execute(query, (project_name,)).fetchall()
     conn.close()
     return {row['name']: row['first_case_id'] for row in rows}
 
+def get_module_name_by_case(case_id):
+    """Module of a case; the bot's module buttons carry the module's first pending case id"""
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT m.name FROM test_cases t JOIN modules m ON t.module_id = m.id WHERE t.id = ?
+    """, (case_id,)).fetchone()
+    conn.close()
+    return row['name'] if row else None
+
 def get_module_stats(project_name="togetherfun"):
     """Get statistics for each module: total cases, passed, failed, pending"""
     conn = get_db_connection()
@@ -247,10 +598,10 @@ def get_module_stats(project_name="togetherfun"):
             SUM(CASE WHEN t.status = 'FAILED' THEN 1 ELSE 0 END) as failed,
             SUM(CASE WHEN t.status = 'PENDING' THEN 1 ELSE 0 END) as pending
         FROM modules m
-        JOIN test_cases t ON m.id = t.module_id
+        JOIN test_cases t ON m.id = t.module_id AND t.status != 'OBSOLETE'
         JOIN projects p ON m.project_id = p.id
         WHERE p.name = ?
-        GROUP BY m.name
+        GROUP BY m.id, m.name
         ORDER BY m.id DESC
     """
     rows = conn.execute(query, (project_name,)).fetchall()
@@ -267,48 +618,54 @@ def get_module_stats(project_name="togetherfun"):
 
 def get_next_pending_case_by_module(module_name, project_name="togetherfun"):
     conn = get_db_connection()
+    module_id = _module_id(conn, project_name, module_name)
+    if module_id is None:
+        conn.close()
+        return None
     
-    # First try to get PENDING cases
-    query_pending = """
-        SELECT t.id, t.content, t.status
-        FROM test_cases t
-        JOIN modules m ON t.module_id = m.id
-        JOIN projects p ON m.project_id = p.id
-        WHERE m.name = ? AND p.name = ? AND t.status = 'PENDING'
-        ORDER BY t.id ASC
+    # First try to get PENDING cases, riskiest first (case_priority); one index lookup, no joins
+    query = """
+        SELECT id, content, steps, expected_result, status, priority
+        FROM test_cases
+        WHERE module_id = ? AND status = ?
+        ORDER BY priority DESC, id ASC
         LIMIT 1
     """
-    row = conn.execute(query_pending, (module_name, project_name)).fetchone()
+    row = conn.execute(query, (module_id, 'PENDING')).fetchone()
     
     # If no pending cases, try to get FAILED cases for retesting
     if not row:
-        query_failed = """
-            SELECT t.id, t.content, t.status
-            FROM test_cases t
-            JOIN modules m ON t.module_id = m.id
-            JOIN projects p ON m.project_id = p.id
-            WHERE m.name = ? AND p.name = ? AND t.status = 'FAILED'
-            ORDER BY t.id ASC
-            LIMIT 1
-        """
-        row = conn.execute(query_failed, (module_name, project_name)).fetchone()
+        row = conn.execute(query, (module_id, 'FAILED')).fetchone()
     
     conn.close()
     if row: 
         return {
             "id": row['id'], 
             "text": row['content'],
+            "steps": _split_steps(row['steps']),
+            "expected_result": row['expected_result'],
             "status": row['status'],
+            "priority": row['priority'],
             "is_retest": row['status'] == 'FAILED'
         }
     return None
 
-def update_case_status(case_id, status, bug_report=None):
-    conn = get_db_connection()
+def _set_case_status(conn, case_id, status, bug_report=None, observation=None):
+    failed = int(status == 'FAILED')
     if bug_report:
-        conn.execute("UPDATE test_cases SET status = ?, bug_report = ? WHERE id = ?", (status, bug_report, case_id))
+        # The tester's own words are kept so the report can be regenerated later
+        conn.execute("""
+            UPDATE test_cases SET status = ?, bug_report = ?, bug_observation = ?, fail_count = fail_count + ?
+            WHERE id = ?
+        """, (status, bug_report, observation, failed, case_id))
     else:
-        conn.execute("UPDATE test_cases SET status = ? WHERE id = ?", (status, case_id))
+        conn.execute("UPDATE test_cases SET status = ?, fail_count = fail_count + ? WHERE id = ?",
+                     (status, failed, case_id))
+
+def update_case_status(case_id, status, bug_report=None, observation=None):
+    conn = get_db_connection()
+    _set_case_status(conn, case_id, status, bug_report, observation)
+    _bump_versions_for_cases(conn, [case_id])
     conn.commit()
     conn.close()
 
@@ -334,28 +691,755 @@ def get_failed_cases_with_bugs(project_name="togetherfun"):
 def update_bug_report_text(case_id, new_text):
     conn = get_db_connection()
     conn.execute("UPDATE test_cases SET bug_report = ? WHERE id = ?", (new_text, case_id))
+    _bump_versions_for_cases(conn, [case_id])
     conn.commit()
     conn.close()
 
 def delete_bug_report(case_id):
     conn = get_db_connection()
+    _bump_versions_for_cases(conn, [case_id])
     conn.execute("DELETE FROM test_cases WHERE id = ?", (case_id,))
     conn.commit()
     conn.close()
 
+# --- Bug report cache & background jobs ---
+def get_project_id(project_name):
+    conn = get_db_connection()
+    project_id = _project_id(conn, project_name)
+    conn.close()
+    return project_id
+
+def get_case_for_report(case_id):
+    """Case content, observation and owning project for bug report generation"""
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT t.id, t.content, t.bug_observation, m.project_id
+        FROM test_cases t
+        JOIN modules m ON t.module_id = m.id
+        WHERE t.id = ?
+    """, (case_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_cached_bug_report(project_id, cache_key):
+    conn = get_db_connection()
+    row = conn.execute("SELECT report FROM bug_report_cache WHERE project_id = ? AND cache_key = ?",
+                       (project_id, cache_key)).fetchone()
+    if row:
+        conn.execute("UPDATE bug_report_cache SET hits = hits + 1 WHERE project_id = ? AND cache_key = ?",
+                     (project_id, cache_key))
+        conn.commit()
+    conn.close()
+    return row[0] if row else None
+
+def save_cached_bug_report(project_id, cache_key, report):
+    conn = get_db_connection()
+    conn.execute("""
+        INSERT INTO bug_report_cache (project_id, cache_key, report) VALUES (?, ?, ?)
+        ON CONFLICT(project_id, cache_key) DO UPDATE SET report = excluded.report
+    """, (project_id, cache_key, report))
+    conn.commit()
+    conn.close()
+
+def get_bug_corpus(project_id):
+    """Failed cases of a project that have a report: what the similarity index is built from"""
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT t.id, t.content, t.bug_observation, t.bug_report
+        FROM test_cases t
+        JOIN modules m ON t.module_id = m.id
+        WHERE m.project_id = ? AND t.status = 'FAILED' AND t.bug_report IS NOT NULL
+    """, (project_id,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_failed_cases_for_module(project_id, module_name):
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT t.id, t.content, t.bug_observation
+        FROM test_cases t
+        JOIN modules m ON t.module_id = m.id
+        WHERE m.project_id = ? AND m.name = ? AND t.status = 'FAILED'
+        ORDER BY t.id
+    """, (project_id, module_name)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+# --- Risk-based case order (case_priority.py) ---
+def get_failure_history(project_id):
+    """Per module name, live and archived: {name: (cases run, cases that failed)}"""
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT m.name,
+               SUM(CASE WHEN t.status IN ('Pass', 'FAILED') OR t.fail_count > 0 THEN 1 ELSE 0 END) AS run,
+               SUM(CASE WHEN t.fail_count > 0 THEN 1 ELSE 0 END) AS failed
+        FROM modules m
+        JOIN test_cases t ON t.module_id = m.id
+        WHERE m.project_id = ?
+        GROUP BY m.id, m.name
+    """, (project_id,)).fetchall()
+    rows += conn.execute("""
+        SELECT name, passed + failed AS run, failed FROM archived_modules WHERE project_id = ?
+    """, (project_id,)).fetchall()
+    conn.close()
+    history = {}
+    for row in rows:
+        run, failed = history.get(row["name"], (0, 0))
+        history[row["name"]] = (run + (row["run"] or 0), failed + (row["failed"] or 0))
+    return history
+
+def get_failure_corpus(project_id):
+    """Cases of a project that failed at least once, whatever their status now"""
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT t.id, t.content, t.bug_observation, t.bug_report
+        FROM test_cases t
+        JOIN modules m ON t.module_id = m.id
+        WHERE m.project_id = ? AND t.fail_count > 0
+    """, (project_id,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_cases_to_prioritize(project_id, modules=None):
+    """PENDING cases of a project, or of the named modules only"""
+    conn = get_db_connection()
+    query = """
+        SELECT t.id, m.name AS module, t.content, t.priority
+        FROM test_cases t
+        JOIN modules m ON t.module_id = m.id
+        WHERE m.project_id = ? AND t.status = 'PENDING'
+    """
+    rows = []
+    if modules is None:
+        rows = conn.execute(query, (project_id,)).fetchall()
+    for chunk in _chunks(modules or []):
+        rows += conn.execute(query + f" AND m.name IN ({','.join(['?'] * len(chunk))})",
+                             (project_id, *chunk)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def save_case_priorities(project_id, priorities):
+    """priorities: [(priority, case_id)]; cases no longer PENDING are left alone"""
+    conn = get_db_connection()
+    conn.executemany("UPDATE test_cases SET priority = ? WHERE id = ? AND status = 'PENDING'", priorities)
+    _bump_project_version(conn, project_id)
+    conn.commit()
+    conn.close()
+
+def create_job(project_id, kind, total=0, detail=None):
+    import uuid
+    job_id = uuid.uuid4().hex
+    conn = get_db_connection()
+    conn.execute("INSERT INTO jobs (id, project_id, kind, total, detail) VALUES (?, ?, ?, ?, ?)",
+                 (job_id, project_id, kind, total, detail))
+    conn.commit()
+    conn.close()
+    return job_id
+
+JOB_FIELDS = ("status", "total", "done", "failed", "detail")
+
+def update_job(job_id, **fields):
+    names = [name for name in fields if name in JOB_FIELDS]
+    assignments = [f"{name} = ?" for name in names] + ["updated_at = CURRENT_TIMESTAMP"]
+    values = [fields[name] for name in names]
+    conn = get_db_connection()
+    conn.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE id = ?",
+                 (*values, job_id))
+    conn.commit()
+    conn.close()
+
+def get_job(job_id):
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT j.id, p.name AS project, j.kind, j.status, j.total, j.done, j.failed, j.detail,
+               j.created_at, j.updated_at
+        FROM jobs j JOIN projects p ON j.project_id = p.id
+        WHERE j.id = ?
+    """, (job_id,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    job = dict(row)
+    for key in ("created_at", "updated_at"):
+        job[key] = str(job[key]) if job[key] is not None else None
+    return job
+
+# --- Requirement document versions (incremental regeneration, see documents.py) ---
+def get_latest_document(project_name, module_name=None, filename=None):
+    """Latest stored version of a module's requirements document.
+
+    Looked up by module name, or else by the file name it was last uploaded
+    under. Returns {"module", "version", "filename", "content", "sections"} or None.
+    """
+    conn = get_db_connection()
+    query = """
+        SELECT m.name AS module, d.version, d.filename, d.content, d.sections
+        FROM module_documents d
+        JOIN modules m ON d.module_id = m.id
+        WHERE m.project_id = ? AND {} = ?
+        ORDER BY d.id DESC
+        LIMIT 1
+    """.format("m.name" if module_name else "d.filename")
+    row = conn.execute(query, (_project_id(conn, project_name), module_name or filename)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    document = dict(row)
+    document["sections"] = json.loads(document["sections"])
+    return document
+
+def save_document_version(project_name, module_name, filename, content, sections,
+                          cases_list=(), section_keys=None, obsolete_keys=()):
+    """Stores a new document version together with its cases, in one transaction.
+
+    Cases written for sections that are gone (``obsolete_keys``) are marked
+    OBSOLETE rather than deleted, so their results and bug reports stay.
+    Returns {"version", "added", "obsoleted"}.
+    """
+    conn = get_db_connection()
+    try:
+        project_id = _get_or_create_project_id(conn, project_name)
+        module_id = _get_or_create_module(conn, project_id, module_name)
+        added = _insert_cases(conn, module_id, list(cases_list), section_keys)
+        obsoleted = 0
+        obsolete_keys = list(obsolete_keys)
+        for chunk in _chunks(obsolete_keys):
+            placeholders = ','.join(['?'] * len(chunk))
+            obsoleted += conn.execute(f"""
+                UPDATE test_cases SET status = 'OBSOLETE'
+                WHERE module_id = ? AND status != 'OBSOLETE' AND section_key IN ({placeholders})
+            """, (module_id, *chunk)).rowcount
+        version = conn.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM module_documents WHERE module_id = ?",
+                               (module_id,)).fetchone()[0]
+        conn.execute("""
+            INSERT INTO module_documents (module_id, version, filename, content, sections)
+            VALUES (?, ?, ?, ?, ?)
+        """, (module_id, version, filename, content, json.dumps(sections, ensure_ascii=False)))
+        _bump_project_version(conn, project_id)
+        conn.commit()
+        _forget_names()
+        return {"version": version, "added": added, "obsoleted": obsoleted}
+    finally:
+        conn.close()
+
+# --- Offline testing sessions ---
+OFFLINE_BATCH_LIMIT = 500
+
+def get_offline_cases(project_name, module_name):
+    """Everything left to test in a module, in the order the online flow serves it
+    (PENDING, then FAILED for retest; riskiest first). None if the module doesn't exist."""
+    conn = get_db_connection()
+    module_id = _module_id(conn, project_name, module_name)
+    if module_id is None:
+        conn.close()
+        return None
+    rows = conn.execute("""
+        SELECT id, content, steps, expected_result, status FROM test_cases
+        WHERE module_id = ? AND status IN ('PENDING', 'FAILED')
+        ORDER BY CASE WHEN status = 'PENDING' THEN 0 ELSE 1 END, priority DESC, id
+    """, (module_id,)).fetchall()
+    conn.close()
+    return [{"id": row["id"], "text": row["content"], "steps": _split_steps(row["steps"]),
+             "expected_result": row["expected_result"], "status": row["status"],
+             "is_retest": row["status"] == "FAILED"} for row in rows]
+
+# --- Session working sets (sessions.py) ---
+def get_session_cases(project_name, module_name):
+    """What a testing session of a module can still be served: its PENDING and FAILED
+    cases in next-case order. Returns (project_id, data version, [case dicts]),
+    or None if the module doesn't exist. The version is read first, so it is never
+    newer than the cases."""
+    conn = get_db_connection()
+    try:
+        project_id = _project_id(conn, project_name)
+        module_id = _module_id(conn, project_name, module_name)
+        if module_id is None:
+            return None
+        row = conn.execute("SELECT version FROM project_versions WHERE project_id = ?", (project_id,)).fetchone()
+        rows = conn.execute("""
+            SELECT id, content, steps, expected_result, status, priority FROM test_cases
+            WHERE module_id = ? AND status IN ('PENDING', 'FAILED')
+            ORDER BY priority DESC, id
+        """, (module_id,)).fetchall()
+        return project_id, row['version'] if row else 0, [
+            {"id": r["id"], "text": r["content"], "steps": _split_steps(r["steps"]),
+             "expected_result": r["expected_result"], "status": r["status"], "priority": r["priority"]}
+            for r in rows]
+    finally:
+        conn.close()
+
+def apply_session_results(results):
+    """Results queued by sessions.py, in one transaction, in the order given.
+
+    Every result is {"key", "project_id", "case_id", "status", "bug_report",
+    "observation"}. ``key`` is claimed in result_submissions, so a result
+    replayed from a journal after a crash is applied once. Results of deleted
+    projects are dropped. Returns {project_id: (data version before, after)}.
+    """
+    conn = get_db_connection()
+    try:
+        project_ids = list({r["project_id"] for r in results})
+        existing = set()
+        for chunk in _chunks(project_ids):
+            rows = conn.execute(f"SELECT id FROM projects WHERE id IN ({','.join(['?'] * len(chunk))})",
+                                tuple(chunk)).fetchall()
+            existing.update(row[0] for row in rows)
+        versions = {}
+        for project_id in existing:
+            row = conn.execute("SELECT version FROM project_versions WHERE project_id = ?", (project_id,)).fetchone()
+            versions[project_id] = row[0] if row else 0
+        for r in results:
+            if r["project_id"] not in existing:
+                continue
+            claimed = conn.execute("""
+                INSERT INTO result_submissions (idempotency_key, project_id, case_id, status, outcome)
+                VALUES (?, ?, ?, ?, 'applied') ON CONFLICT(idempotency_key) DO NOTHING
+            """, (r["key"], r["project_id"], r["case_id"], r["status"])).rowcount
+            if claimed:
+                _set_case_status(conn, r["case_id"], r["status"], r.get("bug_report"), r.get("observation"))
+        for project_id in existing:
+            _bump_project_version(conn, project_id)
+            after = conn.execute("SELECT version FROM project_versions WHERE project_id = ?", (project_id,)).fetchone()[0]
+            versions[project_id] = (versions[project_id], after)
+        conn.commit()
+        return versions
+    finally:
+        conn.close()
+
+def _resolve_offline_result(current, base, new):
+    """Outcome of an offline result against the case's status on the server now.
+
+    Unchanged since download -> applied. Changed by someone else -> a failure
+    still wins (it is never silently dropped), but a Pass doesn't overwrite a
+    failure reported meanwhile. Deleted/obsolete cases reject the result.
+    """
+    if current is None or current == "OBSOLETE":
+        return "rejected"
+    if current == new:
+        return "unchanged"
+    if new == "Pass" and current == "FAILED" and base != "FAILED":
+        return "conflict"
+    return "applied"
+
+def apply_offline_results(project_name, results):
+    """Applies results recorded offline, in one transaction.
+
+    Every result is {"key", "case_id", "status" (Pass/FAILED), "base_status",
+    "observation", "recorded_at"}; ``key`` is the client's idempotency key, so
+    a batch sent twice (lost response, retry) is applied once.
+    Returns None if the project doesn't exist, else
+    ([{"key", "case_id", "outcome", "status"}], ids of cases that need a bug report).
+    Outcomes: applied, unchanged, conflict, rejected, duplicate.
+    """
+    conn = get_db_connection()
+    try:
+        project = conn.execute("SELECT id FROM projects WHERE name = ?", (project_name,)).fetchone()
+        if not project:
+            return None
+        project_id = project[0]
+        case_ids = list({int(r["case_id"]) for r in results})
+        current = {}
+        for chunk in _chunks(case_ids):
+            placeholders = ','.join(['?'] * len(chunk))
+            for row in conn.execute(f"""
+                SELECT t.id, t.status FROM test_cases t
+                JOIN modules m ON t.module_id = m.id
+                WHERE m.project_id = ? AND t.id IN ({placeholders})
+            """, (project_id, *chunk)).fetchall():
+                current[row[0]] = row[1]
+
+        outcomes, needs_report = [], []
+        # Oldest first: if one case was recorded twice, the latest result is the one that stays
+        for r in sorted(results, key=lambda r: r.get("recorded_at") or 0):
+            case_id = int(r["case_id"])
+            status = "Pass" if r["status"] == "Pass" else "FAILED"
+            outcome = _resolve_offline_result(current.get(case_id), r.get("base_status"), status)
+            claimed = conn.execute("""
+                INSERT INTO result_submissions (idempotency_key, project_id, case_id, status, outcome)
+                VALUES (?, ?, ?, ?, ?) ON CONFLICT(idempotency_key) DO NOTHING
+            """, (r["key"], project_id, case_id, status, outcome)).rowcount
+            if not claimed:
+                outcomes.append({"key": r["key"], "case_id": case_id, "outcome": "duplicate",
+                                 "status": current.get(case_id)})
+                continue
+            if outcome == "applied":
+                if status == "Pass":
+                    conn.execute("UPDATE test_cases SET status = 'Pass' WHERE id = ?", (case_id,))
+                else:
+                    # The report is regenerated from the new observation (bug_reports.start_case_reports)
+                    conn.execute("""
+                        UPDATE test_cases SET status = 'FAILED', bug_report = NULL, bug_observation = ?,
+                                              fail_count = fail_count + 1
+                        WHERE id = ?
+                    """, (r.get("observation"), case_id))
+                    if r.get("observation"):
+                        needs_report.append(case_id)
+                current[case_id] = status
+            outcomes.append({"key": r["key"], "case_id": case_id, "outcome": outcome,
+                             "status": current.get(case_id)})
+        _bump_project_version(conn, project_id)
+        conn.commit()
+        return outcomes, needs_report
+    finally:
+        conn.close()
+
+def get_cases_for_reports(project_id, case_ids):
+    conn = get_db_connection()
+    rows = []
+    for chunk in _chunks(case_ids):
+        placeholders = ','.join(['?'] * len(chunk))
+        rows += conn.execute(f"""
+            SELECT t.id, t.content, t.bug_observation
+            FROM test_cases t
+            JOIN modules m ON t.module_id = m.id
+            WHERE m.project_id = ? AND t.id IN ({placeholders})
+            ORDER BY t.id
+        """, (project_id, *chunk)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def prune_result_submissions(older_than_days):
+    """Idempotency keys only have to outlive client retries"""
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db_connection()
+    deleted = conn.execute("DELETE FROM result_submissions WHERE created_at < ?", (cutoff,)).rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+# --- Bulk import (case_import.py) ---
+def import_case_rows(rows):
+    """One chunk of an import, in one transaction. Every row is (project, module,
+    content, steps, expected_result, status, bug_report), already validated;
+    projects and modules are created as needed. Returns {(project, module): cases added}."""
+    conn = get_db_connection()
+    try:
+        project_ids, module_ids, added = {}, {}, {}
+        values = []
+        for project, module, content, steps, expected_result, status, bug_report in rows:
+            if project not in project_ids:
+                project_ids[project] = _get_or_create_project_id(conn, project)
+            if (project, module) not in module_ids:
+                module_ids[project, module] = _get_or_create_module(conn, project_ids[project], module)
+            values.append((module_ids[project, module], content, steps, expected_result, status, bug_report,
+                           int(status == 'FAILED')))
+            added[project, module] = added.get((project, module), 0) + 1
+        conn.executemany("""
+            INSERT INTO test_cases (module_id, content, steps, expected_result, status, bug_report, fail_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, values)
+        for project_id in project_ids.values():
+            _bump_project_version(conn, project_id)
+        conn.commit()
+    finally:
+        conn.close()
+    _forget_names()
+    return added
+
+# --- Archive tier ---
+# Finished modules leave test_cases/module_documents entirely, so stats, pagination
+# and search over live data don't read past them. Archives keep everything needed
+# to put the module back.
+ARCHIVE_FORMAT = 1
+
+def _archive_module(conn, project_id, module_id, module_name, force=False):
+    pending = conn.execute("SELECT COUNT(*) FROM test_cases WHERE module_id = ? AND status = 'PENDING'",
+                           (module_id,)).fetchone()[0]
+    if pending and not force:
+        raise ValueError(f"Module '{module_name}' still has {pending} pending cases")
+    cases = [dict(row) for row in conn.execute("""
+        SELECT content, steps, expected_result, status, bug_report, bug_observation, section_key, fail_count,
+               created_at
+        FROM test_cases WHERE module_id = ? ORDER BY id
+    """, (module_id,)).fetchall()]
+    documents = [dict(row) for row in conn.execute("""
+        SELECT version, filename, content, sections, created_at
+        FROM module_documents WHERE module_id = ? ORDER BY version
+    """, (module_id,)).fetchall()]
+    raw = json.dumps({"format": ARCHIVE_FORMAT, "module": module_name, "cases": cases, "documents": documents},
+                     ensure_ascii=False, default=str).encode("utf-8")
+    payload = zlib.compress(raw, 9)
+    passed = sum(1 for case in cases if case["status"] == "Pass")
+    failed = sum(1 for case in cases if case["status"] == "FAILED")
+    archive_id = conn.execute("""
+        INSERT INTO archived_modules (project_id, name, cases, passed, failed, raw_bytes, payload)
+        VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING id
+    """, (project_id, module_name, len(cases), passed, failed, len(raw), payload)).fetchone()[0]
+    # Cases and document versions go with the module (ON DELETE CASCADE)
+    conn.execute("DELETE FROM modules WHERE id = ?", (module_id,))
+    _names_changed(conn)
+    return {"id": archive_id, "name": module_name, "cases": len(cases), "raw_bytes": len(raw),
+            "stored_bytes": len(payload)}
+
+def archive_module(project_name, module_name, force=False):
+    """Moves a module with its cases and document versions into the archive.
+
+    Only finished modules (no PENDING cases) unless ``force``; raises
+    ValueError otherwise. Returns the archive entry, or None if there's no
+    such module.
+    """
+    conn = get_db_connection()
+    try:
+        row = conn.execute("""
+            SELECT m.id, m.project_id FROM modules m
+            JOIN projects p ON m.project_id = p.id
+            WHERE p.name = ? AND m.name = ?
+        """, (project_name, module_name)).fetchone()
+        if not row:
+            return None
+        result = _archive_module(conn, row["project_id"], row["id"], module_name, force)
+        _bump_project_version(conn, row["project_id"])
+        conn.commit()
+        _forget_names()
+        return result
+    finally:
+        conn.close()
+
+def archive_project(project_name, force=False):
+    """Archives every finished module of a project (every module with ``force``).
+    Returns {"archived": [...], "skipped": [module names]} or None if the project doesn't exist."""
+    conn = get_db_connection()
+    try:
+        project_id = conn.execute("SELECT id FROM projects WHERE name = ?", (project_name,)).fetchone()
+        if not project_id:
+            return None
+        project_id = project_id[0]
+        modules = conn.execute("""
+            SELECT m.id, m.name, SUM(CASE WHEN t.status = 'PENDING' THEN 1 ELSE 0 END) as pending
+            FROM modules m LEFT JOIN test_cases t ON t.module_id = m.id
+            WHERE m.project_id = ?
+            GROUP BY m.id, m.name
+            ORDER BY m.id
+        """, (project_id,)).fetchall()
+        archived, skipped = [], []
+        for module in modules:
+            if module["pending"] and not force:
+                skipped.append(module["name"])
+                continue
+            archived.append(_archive_module(conn, project_id, module["id"], module["name"], force=True))
+        if archived:
+            _bump_project_version(conn, project_id)
+        conn.commit()
+        if archived:
+            _forget_names()
+        return {"archived": archived, "skipped": skipped}
+    finally:
+        conn.close()
+
+def get_idle_projects(idle_days):
+    """Names of projects without any write for ``idle_days``"""
+    cutoff = (datetime.utcnow() - timedelta(days=idle_days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT p.name FROM projects p
+        JOIN project_versions v ON v.project_id = p.id
+        WHERE v.updated_at < ?
+        ORDER BY p.id
+    """, (cutoff,)).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+def get_archived_modules(project_name):
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT a.id, a.name, a.cases, a.passed, a.failed, a.raw_bytes, LENGTH(a.payload) AS stored_bytes,
+               a.archived_at
+        FROM archived_modules a
+        WHERE a.project_id = ?
+        ORDER BY a.id DESC
+    """, (_project_id(conn, project_name),)).fetchall()
+    conn.close()
+    archives = [dict(row) for row in rows]
+    for archive in archives:
+        archive["archived_at"] = str(archive["archived_at"]) if archive["archived_at"] is not None else None
+    return archives
+
+def restore_archived_module(project_name, archive_id):
+    """Puts an archived module back into the live tables.
+
+    Into an existing module of the same name (e.g. re-uploaded since) the cases
+    are merged; its document history is then kept and the archived one dropped.
+    Returns {"module", "cases", "documents"} or None if there's no such archive.
+    """
+    conn = get_db_connection()
+    try:
+        row = conn.execute("""
+            SELECT a.project_id, a.name, a.payload FROM archived_modules a
+            JOIN projects p ON a.project_id = p.id
+            WHERE p.name = ? AND a.id = ?
+        """, (project_name, archive_id)).fetchone()
+        if not row:
+            return None
+        project_id, module_name = row["project_id"], row["name"]
+        data = json.loads(zlib.decompress(bytes(row["payload"])).decode("utf-8"))
+        existed = conn.execute("SELECT 1 FROM modules WHERE project_id = ? AND name = ?",
+                               (project_id, module_name)).fetchone()
+        module_id = _get_or_create_module(conn, project_id, module_name)
+        conn.executemany("""
+            INSERT INTO test_cases (module_id, content, steps, expected_result, status, bug_report, bug_observation,
+                                    section_key, fail_count, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(module_id, c["content"], c.get("steps"), c.get("expected_result"), c["status"], c["bug_report"],
+               c["bug_observation"], c["section_key"], c.get("fail_count", int(c["status"] == "FAILED")),
+               c["created_at"]) for c in data["cases"]])
+        documents = [] if existed else data["documents"]
+        conn.executemany("""
+            INSERT INTO module_documents (module_id, version, filename, content, sections, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(module_id, d["version"], d["filename"], d["content"], d["sections"], d["created_at"])
+              for d in documents])
+        conn.execute("DELETE FROM archived_modules WHERE id = ?", (archive_id,))
+        _bump_project_version(conn, project_id)
+        conn.commit()
+        _forget_names()
+        return {"module": module_name, "cases": len(data["cases"]), "documents": len(documents)}
+    finally:
+        conn.close()
+
+# --- Scheduled maintenance bookkeeping (maintenance.py) ---
+def claim_maintenance_task(task, interval_seconds, now):
+    """True if ``task`` is due and this process got it: one worker runs it, the others skip"""
+    conn = get_db_connection()
+    try:
+        conn.execute("INSERT INTO maintenance_runs (task, last_run) VALUES (?, 0) ON CONFLICT(task) DO NOTHING",
+                     (task,))
+        claimed = conn.execute("UPDATE maintenance_runs SET last_run = ? WHERE task = ? AND last_run <= ?",
+                               (now, task, now - interval_seconds)).rowcount
+        conn.commit()
+        return claimed == 1
+    finally:
+        conn.close()
+
+def record_maintenance_run(task, detail):
+    conn = get_db_connection()
+    conn.execute("UPDATE maintenance_runs SET detail = ? WHERE task = ?", (detail, task))
+    conn.commit()
+    conn.close()
+
+def get_maintenance_runs():
+    conn = get_db_connection()
+    rows = conn.execute("SELECT task, last_run, detail FROM maintenance_runs ORDER BY task").fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_data_versions():
+    """(highest project data version, catalog version)"""
+    conn = get_db_connection()
+    project = conn.execute("SELECT COALESCE(MAX(version), 0) FROM project_versions").fetchone()[0]
+    row = conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()
+    conn.close()
+    return project, row[0] if row else 0
+
+def advance_data_versions(project_by, catalog_by):
+    """After a restore the versions go back in time: move them past every value
+    handed out before, so no ETag or name cache matches data it didn't see"""
+    conn = get_db_connection()
+    conn.execute("UPDATE project_versions SET version = version + ?, updated_at = CURRENT_TIMESTAMP", (project_by,))
+    conn.execute("UPDATE catalog_version SET version = version + ? WHERE id = 1", (catalog_by,))
+    conn.commit()
+    conn.close()
+    _forget_names()
+
+# --- Slow request log (profiling.py) ---
+
+def explain_query(sql, params=()):
+    """Query plan lines for ``sql``; the statement itself is not run"""
+    conn = get_db_connection()
+    try:
+        return get_backend().explain(conn, sql, params)
+    finally:
+        conn.close()
+
+def log_slow_request(method, path, query, status, total_ms, stages, queries, samples=None, profiled=False):
+    conn = get_db_connection()
+    conn.execute("""INSERT INTO slow_requests (method, path, query, status, total_ms, stages, queries, samples, profiled)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                 (method, path, query, status, total_ms, json.dumps(stages), json.dumps(queries, default=str),
+                  samples, 1 if profiled else 0))
+    conn.commit()
+    conn.close()
+
+def _slow_request_row(row, detail=False):
+    entry = dict(row)
+    entry["stages"] = json.loads(entry["stages"])
+    entry["queries"] = json.loads(entry["queries"])
+    entry["profiled"] = bool(entry["profiled"])
+    if not detail:
+        entry.pop("samples", None)
+    return entry
+
+def get_slow_requests(limit=20, path=None):
+    """Worst logged requests (slowest first) and per-path totals"""
+    conn = get_db_connection()
+    where, params = ("WHERE path = ?", (path,)) if path else ("", ())
+    rows = conn.execute(f"""SELECT id, method, path, query, status, total_ms, stages, queries, profiled, created_at
+                            FROM slow_requests {where} ORDER BY total_ms DESC LIMIT ?""", params + (limit,)).fetchall()
+    paths = conn.execute(f"""SELECT method, path, COUNT(*) AS count, AVG(total_ms) AS avg_ms, MAX(total_ms) AS max_ms
+                             FROM slow_requests {where} GROUP BY method, path ORDER BY max_ms DESC""", params).fetchall()
+    conn.close()
+    return [_slow_request_row(row) for row in rows], [dict(row) for row in paths]
+
+def get_slow_request(request_id):
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM slow_requests WHERE id = ?", (request_id,)).fetchone()
+    conn.close()
+    return _slow_request_row(row, detail=True) if row else None
+
+def prune_slow_requests(keep):
+    """Keep only the newest ``keep`` entries"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT id FROM slow_requests ORDER BY id DESC LIMIT 1 OFFSET ?", (keep,)).fetchone()
+    deleted = conn.execute("DELETE FROM slow_requests WHERE id <= ?", (row[0],)).rowcount if row else 0
+    conn.commit()
+    conn.close()
+    return deleted
+
 # --- Bulk & Pagination Helper ---
-def get_all_cases_paginated(project_name="togetherfun", page=1, limit=20, status=None):
+# Columns a client may request via ?fields= on /api/cases
+CASE_FIELDS = {
+    "id": "t.id",
+    "module": "m.name as module",
+    "content": "t.content",
+    "status": "t.status",
+    "bug_report": "t.bug_report",
+    "steps": "t.steps",
+    "expected_result": "t.expected_result",
+    "priority": "t.priority",
+    "fail_count": "t.fail_count",
+}
+# What /api/cases returns without ?fields=; steps and expected_result are in content too
+CASE_DEFAULT_FIELDS = ("id", "module", "content", "status", "bug_report")
+# Keys returned by get_module_stats / get_failed_cases_with_bugs (projected in Python)
+MODULE_FIELDS = ("name", "total", "passed", "failed", "pending", "progress")
+BUG_FIELDS = ("id", "module", "case_text", "bug_report")
+
+def parse_fields(fields, allowed):
+    """'id,status' -> ['id', 'status']; None/empty means every field.
+    Raises ValueError on names not in ``allowed``."""
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return names
+
+def pick_fields(rows, names):
+    """Project a list of dicts onto ``names`` (None keeps rows unchanged)"""
+    if not names:
+        return rows
+    return [{k: row[k] for k in names} for row in rows]
+
+def get_all_cases_paginated(project_name="togetherfun", page=1, limit=20, status=None, module=None, fields=None):
+    """``fields`` is a list of CASE_FIELDS keys; only those columns are read from the DB"""
     offset = (page - 1) * limit
     conn = get_db_connection()
     
     # Check if project exists
-    c = conn.cursor()
-    c.execute("SELECT id FROM projects WHERE name = ?", (project_name,))
-    project = c.fetchone()
-    if not project:
+    proj_id = _project_id(conn, project_name)
+    if proj_id is None:
         conn.close()
-        return [], 0
-    proj_id = project['id']
+        return [], 0, []
     
     where_clause = "WHERE m.project_id = ?"
     params = [proj_id]
@@ -363,6 +1447,15 @@ def get_all_cases_paginated(project_name="togetherfun", page=1, limit=20, status
     if status and status != 'all':
         where_clause += " AND t.status = ?"
         params.append(status)
+    else:
+        # Like the stats: OBSOLETE cases are listed only when asked for by status
+        where_clause += " AND t.status != 'OBSOLETE'"
+
+    if module and module != 'all':
+        # -1 matches nothing: an unknown module filters everything out, as before
+        module_id = _module_id(conn, project_name, module)
+        where_clause += " AND t.module_id = ?"
+        params.append(module_id if module_id is not None else -1)
 
     # Total Count
     count_query = f"""
@@ -374,8 +1467,10 @@ def get_all_cases_paginated(project_name="togetherfun", page=1, limit=20, status
     total = conn.execute(count_query, params).fetchone()['total']
 
     # Items
+    fields = fields or CASE_DEFAULT_FIELDS
+    columns = ", ".join(CASE_FIELDS[f] for f in fields)
     query = f"""
-        SELECT t.id, m.name as module, t.content, t.status, t.bug_report
+        SELECT {columns}
         FROM test_cases t
         JOIN modules m ON t.module_id = m.id
         {where_clause}
@@ -393,25 +1488,106 @@ def get_all_cases_paginated(project_name="togetherfun", page=1, limit=20, status
     print(f"DEBUG: Project {project_name} (ID {proj_id}) - Fetching cases offset {offset} limit {limit}. Found: {len(rows)}")
     conn.close()
     
-    return [dict(row) for row in rows], total, all_modules
+    cases = [dict(row) for row in rows]
+    if "steps" in fields:
+        for case in cases:
+            case["steps"] = _split_steps(case["steps"])
+    return cases, total, all_modules
 
 def delete_cases_bulk(case_ids):
     conn = get_db_connection()
-    placeholders = ','.join(['?'] * len(case_ids))
-    sql = f"DELETE FROM test_cases WHERE id IN ({placeholders})"
-    conn.execute(sql, tuple(case_ids))
+    _bump_versions_for_cases(conn, case_ids)
+    for chunk in _chunks(case_ids):
+        placeholders = ','.join(['?'] * len(chunk))
+        conn.execute(f"DELETE FROM test_cases WHERE id IN ({placeholders})", tuple(chunk))
     conn.commit()
     conn.close()
 
 def update_cases_status_bulk(case_ids, status):
     conn = get_db_connection()
-    placeholders = ','.join(['?'] * len(case_ids))
-    sql = f"UPDATE test_cases SET status = ? WHERE id IN ({placeholders})"
-    args = [status] + case_ids
-    conn.execute(sql, tuple(args))
+    for chunk in _chunks(case_ids):
+        placeholders = ','.join(['?'] * len(chunk))
+        conn.execute(f"UPDATE test_cases SET status = ?, fail_count = fail_count + ? WHERE id IN ({placeholders})",
+                     (status, int(status == 'FAILED'), *chunk))
+    _bump_versions_for_cases(conn, case_ids)
     conn.commit()
     conn.close()
 
+CASE_STATUSES = ("PENDING", "Pass", "FAILED")
+CASE_OPERATIONS = ("status", "bug", "delete", "move")
+
+def _check_case_ownership(conn, project_id, case_ids):
+    """Raises ValueError unless every id is a case of this project"""
+    for chunk in _chunks(case_ids):
+        placeholders = ','.join(['?'] * len(chunk))
+        rows = conn.execute(f"""
+            SELECT t.id FROM test_cases t
+            JOIN modules m ON t.module_id = m.id
+            WHERE m.project_id = ? AND t.id IN ({placeholders})
+        """, (project_id, *chunk)).fetchall()
+        if len(rows) != len(set(chunk)):
+            missing = sorted(set(chunk) - {row[0] for row in rows})
+            raise ValueError(f"Cases not found in this project: {missing[:20]}")
+
+def _get_or_create_module(conn, project_id, module_name):
+    row = conn.execute("SELECT id FROM modules WHERE project_id = ? AND name = ?", (project_id, module_name)).fetchone()
+    if row:
+        return row[0]
+    _names_changed(conn)
+    return conn.execute("INSERT INTO modules (project_id, name) VALUES (?, ?) RETURNING id",
+                        (project_id, module_name)).fetchone()[0]
+
+def apply_case_operations(project_name, operations):
+    """Applies a list of case operations in one transaction: all of them or none.
+
+    Every operation is a dict with ``op`` and ``case_ids`` plus its argument:
+        {"op": "status", "case_ids": [...], "status": "Pass"}
+        {"op": "bug", "case_ids": [...], "bug_report": "..."}   (None clears it)
+        {"op": "delete", "case_ids": [...]}
+        {"op": "move", "case_ids": [...], "module_name": "Payments"}
+
+    Raises ValueError for a bad operation or a case outside the project.
+    Returns None if the project doesn't exist, else affected rows per operation.
+    """
+    conn = get_db_connection()
+    try:
+        project = conn.execute("SELECT id FROM projects WHERE name = ?", (project_name,)).fetchone()
+        if not project:
+            return None
+        project_id = project[0]
+        results = []
+        for op in operations:
+            kind = op.get("op")
+            case_ids = [int(i) for i in op.get("case_ids") or []]
+            if kind not in CASE_OPERATIONS:
+                raise ValueError(f"Unknown operation: {kind}")
+            if kind == "status" and op.get("status") not in CASE_STATUSES:
+                raise ValueError(f"Invalid status: {op.get('status')}")
+            if kind == "move" and not (op.get("module_name") or "").strip():
+                raise ValueError("module_name is required for move")
+            _check_case_ownership(conn, project_id, case_ids)
+
+            if kind == "status":
+                sql = "UPDATE test_cases SET status = ?, fail_count = fail_count + ? WHERE id IN ({})"
+                args = (op["status"], int(op["status"] == "FAILED"))
+            elif kind == "bug":
+                sql, args = "UPDATE test_cases SET bug_report = ? WHERE id IN ({})", (op.get("bug_report"),)
+            elif kind == "move":
+                module_id = _get_or_create_module(conn, project_id, op["module_name"].strip())
+                sql, args = "UPDATE test_cases SET module_id = ? WHERE id IN ({})", (module_id,)
+            else:
+                sql, args = "DELETE FROM test_cases WHERE id IN ({})", ()
+            affected = 0
+            for chunk in _chunks(case_ids):
+                affected += conn.execute(sql.format(','.join(['?'] * len(chunk))), (*args, *chunk)).rowcount
+            results.append({"op": kind, "affected": affected})
+        _bump_project_version(conn, project_id)
+        conn.commit()
+        _forget_names()
+        return results
+    finally:
+        conn.close()
+
 def delete_all_cases_for_project(project_name):
     conn = get_db_connection()
     c = conn.cursor()
@@ -421,15 +1597,19 @@ def delete_all_cases_for_project(project_name):
         conn.close()
         return
     proj_id = proj['id']
-    query = "DELETE FROM test_cases WHERE module_id IN (SELECT id FROM modules WHERE project_id = ?)"
-    conn.execute(query, (proj_id,))
+    # Cases go with their modules (ON DELETE CASCADE)
     conn.execute("DELETE FROM modules WHERE project_id = ?", (proj_id,))
-    conn.execute("DELETE FROM sqlite_sequence WHERE name='test_cases'")
+    _names_changed(conn)
+    # Reset auto-increment if no cases left (other projects may still have some)
+    if conn.execute("SELECT COUNT(*) FROM test_cases").fetchone()[0] == 0:
+        get_backend().reset_sequence(conn, 'test_cases')
+    _bump_project_version(conn, proj_id)
     conn.commit()
     conn.close()
+    _forget_names()
 
 def reset_module_cases(project_name, module_name):
-    """Resets all cases in a module to PENDING and clears bug reports"""
+    """Resets the cases of a module (except OBSOLETE ones) to PENDING and clears bug reports"""
     conn = get_db_connection()
     c = conn.cursor()
     c.execute("SELECT id FROM projects WHERE name = ?", (project_name,))
@@ -442,7 +1622,12 @@ def reset_module_cases(project_name, module_name):
     if not module:
         conn.close()
         return False
-    c.execute("UPDATE test_cases SET status = 'PENDING', bug_report = NULL WHERE module_id = ?", (module['id'],))
+    # OBSOLETE cases belong to sections that are gone from the document: a retest leaves them out
+    c.execute("""
+        UPDATE test_cases SET status = 'PENDING', bug_report = NULL, bug_observation = NULL
+        WHERE module_id = ? AND status != 'OBSOLETE'
+    """, (module['id'],))
+    _bump_project_version(conn, project['id'])
     conn.commit()
     conn.close()
     return True
\ No newline at end of file